@@ -1,11 +1,36 @@
+from app.users.cache import user_cache
+from app.users.dao import ROLE_FIELDS
 from app.users.models import User
 from sqladmin import ModelView
+from sqlalchemy import Select
+from starlette.requests import Request
 
 
 class UserAdmin(ModelView, model=User):
     column_list = [User.id, User.email, User.portfolio_id, User.is_sub]
     column_details_exclude_list = [User.password_hashed]
+    form_excluded_columns = [User.token_version]
     can_delete = False
     name = "User"
     name_plural = "Users"
-    icon = "fa-solid fa-user"
\ No newline at end of file
+    icon = "fa-solid fa-user"
+
+    # списки и счетчики можно читать с реплики, форму редактирования - нет
+    def list_query(self, request: Request) -> Select:
+        return super().list_query(request).execution_options(replica=True)
+
+    def count_query(self, request: Request) -> Select:
+        return super().count_query(request).execution_options(replica=True)
+
+    async def on_model_change(self, data, model, is_created, request):
+        if not is_created and any(
+            field in data and data[field] != getattr(model, field) for field in ROLE_FIELDS
+        ):
+            model.token_version += 1
+
+    async def after_model_change(self, data, model, is_created, request):
+        if not is_created:
+            await user_cache.invalidate(model.id)
+
+    async def after_model_delete(self, model, request):
+        await user_cache.invalidate(model.id)
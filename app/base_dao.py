@@ -1,8 +1,9 @@
-from app.database import async_session_maker
+from app.database import async_session_maker, session_scope
 from app.logger import logger
 
 from abc import ABC, abstractmethod
-from sqlalchemy import insert, select, update
+from sqlalchemy import ARRAY, Integer, any_, bindparam, column, insert, select, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
 
 
@@ -30,15 +31,27 @@ class AbsDAO(ABC):
 
 
 class BaseDAO:
+    """
+    Read methods mark their selects with execution_options(replica=True):
+    RoutingSession sends them to a replica unless the session already wrote
+    """
     model = None
+    # не отдаются наружу методами find_page и stream_all
+    excluded_columns: set[str] = set()
+    
+    @classmethod
+    def _public_columns(cls):
+        return [
+            column for column in cls.model.__table__.columns
+            if column.name not in cls.excluded_columns
+        ]
     
     @classmethod
     async def add(cls, **data):
         try:
-            async with async_session_maker() as session:
+            async with session_scope() as session:
                 query = insert(cls.model).values(**data)
                 await session.execute(query)
-                await session.commit()
         except (SQLAlchemyError, Exception) as e:
             if isinstance(e,  SQLAlchemyError):
                 msg = "Databse "
@@ -51,10 +64,9 @@ class BaseDAO:
     @classmethod
     async def add_return_obj(cls, **data):
         try:
-            async with async_session_maker() as session:
+            async with session_scope() as session:
                 query = insert(cls.model).values(**data).returning(cls.model)
                 new_obj = await session.execute(query)
-                await session.commit()
                 return new_obj.scalar()
         except (SQLAlchemyError, Exception) as e:
             if isinstance(e,  SQLAlchemyError):
@@ -63,20 +75,46 @@ class BaseDAO:
                 msg = "Unknown "
             msg += "Exc: Cannot add and return data"
             logger.error(msg, extra=data, exc_info=True)
+    
+    
+    @classmethod
+    async def add_or_none(cls, conflict_columns: list[str], **data):
+        """
+        INSERT ... ON CONFLICT DO NOTHING RETURNING: the new object, or None
+        if a row with the same conflict_columns already exists.
+        Database errors are re-raised so they are not mistaken for a conflict.
+        """
+        try:
+            async with session_scope() as session:
+                query = (
+                    pg_insert(cls.model)
+                    .values(**data)
+                    .on_conflict_do_nothing(index_elements=conflict_columns)
+                    .returning(cls.model)
+                )
+                new_obj = await session.execute(query)
+                return new_obj.scalar()
+        except (SQLAlchemyError, Exception) as e:
+            if isinstance(e,  SQLAlchemyError):
+                msg = "Databse "
+            elif isinstance(e, Exception):
+                msg = "Unknown "
+            msg += "Exc: Cannot add data on conflict do nothing"
+            logger.error(msg, extra=data, exc_info=True)
+            raise
             
     
     @classmethod
     async def update(cls, filter_by: dict, **update_data):
         try:
-            async with async_session_maker() as session:
+            async with session_scope() as session:
                 query = (
                     update(cls.model)
                     .filter_by(**filter_by)
                     .values(**update_data)
-                    .returning(cls.model)
+                    .returning(*cls.model.__table__.columns)
                 )
                 result = await session.execute(query)
-                await session.commit()
                 return result.mappings().one_or_none()
         except (SQLAlchemyError, Exception) as e:
             if isinstance(e,  SQLAlchemyError):
@@ -86,14 +124,54 @@ class BaseDAO:
             msg += "Exc: Cannot update data"
             logger.error(msg, extra=update_data, exc_info=True)
             
+
+    
+    @classmethod
+    async def bulk_update(cls, key: str, rows: list[dict], chunk_size: int = 1000, **extra_values):
+        """
+        UPDATE ... FROM (VALUES ...) JOIN on `key`: every row holds the key and
+        the same set of columns to set, chunk_size rows per statement.
+        extra_values are set on every updated row (e.g. counters).
+        Returns id and key of the updated rows; errors are re-raised.
+        """
+        if not rows:
+            return []
+        table = cls.model.__table__
+        names = [key] + [name for name in rows[0] if name != key]
+        updated = []
+        try:
+            async with session_scope() as session:
+                for start in range(0, len(rows), chunk_size):
+                    chunk = rows[start:start + chunk_size]
+                    data = values(
+                        *(column(name, table.c[name].type) for name in names),
+                        name="data"
+                    ).data([tuple(row[name] for name in names) for row in chunk])
+                    query = (
+                        update(cls.model)
+                        .where(table.c[key] == data.c[key])
+                        .values(**{name: data.c[name] for name in names[1:]}, **extra_values)
+                        .returning(table.c.id, table.c[key].label("key"))
+                    )
+                    result = await session.execute(query)
+                    updated += result.mappings().all()
+            return updated
+        except (SQLAlchemyError, Exception) as e:
+            if isinstance(e,  SQLAlchemyError):
+                msg = "Databse "
+            elif isinstance(e, Exception):
+                msg = "Unknown "
+            msg += "Exc: Cannot bulk update data"
+            extra = {"key": key, "columns": names[1:], "rows": len(rows)}
+            logger.error(msg, extra=extra, exc_info=True)
+            raise
         
     @classmethod
     async def delete(cls, id: int):
         try:
-            async with async_session_maker() as session:
+            async with session_scope() as session:
                 query = cls.model.__table__.delete().where(cls.model.id == id)
                 await session.execute(query)
-                await session.commit()
         except (SQLAlchemyError, Exception) as e:
             if isinstance(e,  SQLAlchemyError):
                 msg = "Databse "
@@ -107,8 +185,8 @@ class BaseDAO:
     @classmethod
     async def find_by_id(cls, model_id: int):
         try:
-            async with async_session_maker() as session:
-                query = select(cls.model).filter(cls.model.id == model_id)
+            async with session_scope() as session:
+                query = select(cls.model).filter(cls.model.id == model_id).execution_options(replica=True)
                 result = await session.execute(query)
                 return result.scalars().one_or_none()
         except (SQLAlchemyError, Exception) as e:
@@ -120,11 +198,35 @@ class BaseDAO:
             extra = {"model_id": model_id}
             logger.error(msg, extra=extra, exc_info=True)
     
+    @classmethod
+    async def find_many_by_ids(cls, ids: list[int], replica: bool = True):
+        """
+        One `WHERE id = ANY($1)` query for any number of ids: the array is a single
+        parameter, so every batch size shares one prepared statement.
+        replica=False reads the primary. Errors are re-raised.
+        """
+        try:
+            async with session_scope() as session:
+                query = select(cls.model).where(
+                    cls.model.id == any_(bindparam("ids", list(ids), type_=ARRAY(Integer)))
+                ).execution_options(replica=replica)
+                result = await session.execute(query)
+                return result.scalars().all()
+        except (SQLAlchemyError, Exception) as e:
+            if isinstance(e,  SQLAlchemyError):
+                msg = "Databse "
+            elif isinstance(e, Exception):
+                msg = "Unknown "
+            msg += "Exc: Cannot find many by ids"
+            extra = {"ids": len(ids)}
+            logger.error(msg, extra=extra, exc_info=True)
+            raise
+    
     @classmethod
     async def find_one_or_none(cls, **filter_by):
         try:
-            async with async_session_maker() as session:
-                query = select(cls.model.__table__.columns).filter_by(**filter_by)
+            async with session_scope() as session:
+                query = select(cls.model.__table__.columns).filter_by(**filter_by).execution_options(replica=True)
                 result = await session.execute(query)
                 return result.mappings().one_or_none()
         except (SQLAlchemyError, Exception) as e:
@@ -139,8 +241,8 @@ class BaseDAO:
     @classmethod
     async def find_obj(cls, **filter_by):
         try: 
-            async with async_session_maker() as session:
-                query = select(cls.model).filter_by(**filter_by)
+            async with session_scope() as session:
+                query = select(cls.model).filter_by(**filter_by).execution_options(replica=True)
                 result = await session.execute(query)
                 return result.scalar()
         except (SQLAlchemyError, Exception) as e:
@@ -155,8 +257,8 @@ class BaseDAO:
     @classmethod
     async def find_all(cls, **filter_by):
         try:
-            async with async_session_maker() as session:
-                query = select(cls.model).filter_by(**filter_by)
+            async with session_scope() as session:
+                query = select(cls.model).filter_by(**filter_by).execution_options(replica=True)
                 result = await session.execute(query)
                 return result.mappings().all()
         except (SQLAlchemyError, Exception) as e:
@@ -167,4 +269,60 @@ class BaseDAO:
             msg += "Exc: Cannot find all"
             logger.error(msg, extra=filter_by, exc_info=True)
     
-    
\ No newline at end of file
+    
+    @classmethod
+    async def find_page(cls, cursor: int | None = None, limit: int = 100, **filter_by):
+        """
+        Keyset pagination: rows with id > cursor ordered by id
+        """
+        try:
+            async with session_scope() as session:
+                query = (
+                    select(*cls._public_columns())
+                    .filter_by(**filter_by)
+                    .order_by(cls.model.id)
+                    .limit(limit)
+                    .execution_options(replica=True)
+                )
+                if cursor is not None:
+                    query = query.where(cls.model.id > cursor)
+                result = await session.execute(query)
+                return result.mappings().all()
+        except (SQLAlchemyError, Exception) as e:
+            if isinstance(e,  SQLAlchemyError):
+                msg = "Databse "
+            elif isinstance(e, Exception):
+                msg = "Unknown "
+            msg += "Exc: Cannot find page"
+            extra = {"cursor": cursor, "limit": limit, **filter_by}
+            logger.error(msg, extra=extra, exc_info=True)
+    
+    
+    @classmethod
+    async def stream_all(cls, cursor: int | None = None, batch_size: int = 1000, **filter_by):
+        """
+        Yields rows from a server-side cursor, fetching batch_size rows at a time.
+        Uses its own session: the request session is closed before
+        a streaming response body is sent.
+        """
+        try:
+            async with async_session_maker() as session:
+                query = (
+                    select(*cls._public_columns())
+                    .filter_by(**filter_by)
+                    .order_by(cls.model.id)
+                    .execution_options(yield_per=batch_size, replica=True)
+                )
+                if cursor is not None:
+                    query = query.where(cls.model.id > cursor)
+                result = await session.stream(query)
+                async for row in result.mappings():
+                    yield row
+        except (SQLAlchemyError, Exception) as e:
+            if isinstance(e,  SQLAlchemyError):
+                msg = "Databse "
+            elif isinstance(e, Exception):
+                msg = "Unknown "
+            msg += "Exc: Cannot stream all"
+            logger.error(msg, extra=filter_by, exc_info=True)
+            raise
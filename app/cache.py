@@ -0,0 +1,52 @@
+from app.config import settings
+from app.logger import logger
+
+import asyncio
+import inspect
+from typing import Callable
+from redis import asyncio as aioredis
+
+
+redis = aioredis.from_url(
+    f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}",
+    encoding="utf-8",
+    decode_responses=True
+)
+
+_handlers: dict[str, Callable[[str], None]] = {}
+_reconnect_callbacks: list[Callable] = []
+
+
+def subscribe(channel: str, handler: Callable[[str], None]):
+    _handlers[channel] = handler
+
+
+def on_reconnect(callback: Callable):
+    """
+    Callback (sync or async) is run every time the listener (re)subscribes,
+    messages published while it was disconnected are lost.
+    """
+    _reconnect_callbacks.append(callback)
+
+
+async def listen_pubsub():
+    """
+    Background task of each worker: dispatches pub/sub messages to handlers
+    registered with subscribe().
+    """
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(*_handlers)
+                for callback in _reconnect_callbacks:
+                    result = callback()
+                    if inspect.isawaitable(result):
+                        await result
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        _handlers[message["channel"]](message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Redis pub/sub listener failed, reconnecting", exc_info=True)
+            await asyncio.sleep(1)
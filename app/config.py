@@ -5,7 +5,18 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     MODE: Literal["DEV", "TEST", "PROD"]
     LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+    LOG_QUEUE: bool = True  # запись в stdout в отдельном потоке
+    LOG_SERIALIZER: Literal["json", "orjson"] = "orjson"
+    LOG_SAMPLE_RATES: dict[str, float] = {}  # сообщение -> доля записей, которые остаются
     CENTRY: str
+    SENTRY_TRACES_RATE: float = 0.05  # для путей без своей доли
+    SENTRY_CANDIDATE_RATE: float = 0.2  # минимум трассировки путей без своей доли, из него отбираются ошибки и медленные
+    # фрагмент пути -> доля трассируемых запросов, она же потолок: candidate rate к ним не применяется, 0 - не трассировать
+    SENTRY_ROUTE_RATES: dict[str, float] = {"/metrics": 0.0, "/sentry/sampling": 0.0, "/auth/me": 0.01}
+    SENTRY_STATUS_RATES: dict[str, float] = {"4xx": 0.5}  # множитель к доле пути по классу ответа
+    SENTRY_SLOW_SECONDS: float = 1.0
+    SENTRY_MAX_TRANSACTIONS_PER_SECOND: int = 10  # на процесс, без учета ошибок и медленных
+    SENTRY_PROFILES_RATE: float = 0.1
     
     DB_HOST: str
     DB_PORT: int
@@ -13,16 +24,101 @@ class Settings(BaseSettings):
     DB_PASS: str
     DB_NAME: str
     
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100  # prepared statements asyncpg на соединение
+    DB_REPLICA_URLS: list[str] = []  # postgresql+asyncpg://... реплик, пусто - все запросы на основную
+    DB_REPLICA_MAX_LAG: float = 1.0  # реплика с большим отставанием (сек) не получает чтения
+    DB_REPLICA_CHECK_INTERVAL: float = 5.0
+    
     SECRET_KEY: str
     ALGORITHM: str
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    
+    BULK_UPDATE_CHUNK_SIZE: int = 1000  # строк в одном UPDATE ... FROM (VALUES ...)
+    PORTFOLIO_BULK_MAX_ITEMS: int = 10000
+    
+    HASH_EXECUTOR: Literal["thread", "process"] = "thread"
+    HASH_WORKERS: int = 0  # 0 - по числу ядер
+    HASH_QUEUE_LIMIT: int = 32
+    PASSWORD_HASHER: Literal["bcrypt", "argon2id"] = "bcrypt"
+    HASH_TARGET_MS: int = 0  # >0 - подбирать стоимость хеша под это время при старте
+    HASH_CALIBRATED: bool = False  # выставляет gunicorn после калибровки в мастере
+    BCRYPT_ROUNDS: int = 12
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 64*1024  # KiB
+    ARGON2_PARALLELISM: int = 1
     
     REDIS_HOST: str
     REDIS_PORT: int
+    
+    RATE_LIMIT_ENABLED: bool = True
+    # эндпоинт -> область (ip, email, user, global) -> (запросов, окно в секундах)
+    RATE_LIMITS: dict[str, dict[str, tuple[int, int]]] = {
+        "login": {"ip": (20, 60), "email": (10, 15*60), "global": (1000, 60)},
+        "signup": {"ip": (5, 60), "email": (3, 60*60), "global": (200, 60)},
+        "reset_password": {"ip": (5, 60), "user": (3, 60*60), "global": (200, 60)},
+        "reset_email": {"ip": (5, 60), "user": (3, 60*60), "global": (200, 60)},
+    }
+    RATE_LIMIT_LOCAL_SHARE: int = 50  # высокие лимиты воркер резервирует порциями limit/share
+    RATE_LIMIT_LOCAL_TTL: float = 1.0
+    
+    USER_LOADER_DELAY_MS: float = 2  # сколько ждать других запросов в пакет
+    USER_LOADER_MAX_BATCH: int = 500
+    USER_LOOKUP_MAX_IDS: int = 1000
+    INTERNAL_API_KEY: str = ""  # X-Internal-Key для сервисов; пустой - внутренние эндпоинты закрыты
+    
+    USER_CACHE_TTL: int = 300
+    USER_CACHE_LOCAL_TTL: int = 5
+    USER_CACHE_LOCAL_SIZE: int = 10000
+    USER_CACHE_TOMBSTONE_TTL: int = 5
+    
+    VERIFICATION_CODE_TTL: int = 15*60
+    VERIFICATION_CODE_MAX_ATTEMPTS: int = 5
 
     SMTP_HOST: str
     SMTP_PORT: int
     SMTP_USER: str
     SMTP_PASS: str
+    SMTP_SSL: bool = True  # False - обычный SMTP, например локальный aiosmtpd
+    SMTP_TIMEOUT: int = 10
+    SMTP_POOL_SIZE: int = 2
+    SMTP_MAX_IDLE: int = 30  # после простоя соединение проверяется через NOOP
+    SMTP_BATCH_SIZE: int = 100
+    EMAIL_DEDUP_WINDOW: int = 60  # письма на один адрес чаще раза в окно схлопываются, 0 - выключено
+    
+    OUTBOX_RELAY_MODE: Literal["celery", "smtp"] = "celery"
+    OUTBOX_BATCH_SIZE: int = 500
+    OUTBOX_POLL_INTERVAL: float = 0.5
+    OUTBOX_METRICS_PORT: int = 0
+    
+    CELERY_METRICS_PORT: int = 0  # 0 - воркер не отдает метрики
+    CELERY_PREFETCH_MULTIPLIER: int = 1
+    CELERY_ACKS_LATE: bool = True
+    # rate_limit Celery действует на экземпляр воркера (celery worker), общий для
+    # всех его процессов --concurrency; при N воркерах общий предел N× значения
+    CELERY_EMAIL_RATE_LIMIT: str | None = "20/s"  # None - без ограничения
+    CELERY_EMAIL_BATCH_RATE_LIMIT: str | None = "2/s"
+    CELERY_EMAIL_TIME_LIMIT: int = 30
+    CELERY_EMAIL_BATCH_TIME_LIMIT: int = 300
+    CELERY_PERIODIC_TIME_LIMIT: int = 30*60
+    
+    CLEANUP_UNVERIFIED_DAYS: int = 7
+    CLEANUP_BATCH_SIZE: int = 1000
+    CLEANUP_BATCH_PAUSE: float = 0.5  # пауза между пакетами, чтобы реплики успевали
+    
+    IMPORT_CHUNK_SIZE: int = 5000  # строк в одном COPY и одной транзакции
+    IMPORT_HASH_WORKERS: int = 0  # процессы для хеширования паролей при импорте, 0 - по числу ядер
+    IMPORT_MAX_ERRORS: int = 100  # сколько ошибочных строк перечислить в отчете
+    TRANSFER_PROGRESS_ROWS: int = 100000  # как часто писать прогресс экспорта в лог
+    
+    EMAIL_DEFAULT_LOCALE: str = "en"
+    EMAIL_BRAND_NAME: str = "mkbeth"
+    EMAIL_BRAND_COLOR: str = "#2d6cdf"
     
     POSTGRES_DB: str
     POSTGRES_USER: str 
@@ -1,3 +1,6 @@
 import os 
 
-os.environ["MODE"] = "TEST"
\ No newline at end of file
+os.environ["MODE"] = "TEST"
+# быстрый хеш и без лимитов запросов: тесты лимитера создают свой RateLimiter
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["RATE_LIMIT_ENABLED"] = "False"
@@ -1,25 +1,240 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy import create_engine, NullPool
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy import AsyncAdaptedQueuePool, create_engine, event, NullPool, text
+from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
+
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from time import perf_counter
 
 from app.config import settings
+from app.exceptions import RequestTransactionFailedException
+from app.logger import logger
+from app.metrics import DB_POOL_CHECKOUT_WAIT, DB_QUERIES_ROUTED, DB_QUERY_DURATION, DB_REPLICA_LAG
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Records how long checkouts wait for a free connection
+    """
+
+    def connect(self):
+        start = perf_counter()
+        connection = super().connect()
+        DB_POOL_CHECKOUT_WAIT.observe(perf_counter() - start)
+        return connection
+
 
 if settings.MODE == "TEST":
     DATABASE_URL = settings.TEST_DATABASE_URL
+    REPLICA_URLS = []
     DATABASE_PARAMS = {"poolclass": NullPool}
 else:
     DATABASE_URL = settings.DATABASE_URL
-    DATABASE_PARAMS = {}
+    REPLICA_URLS = settings.DB_REPLICA_URLS
+    DATABASE_PARAMS = {
+        "poolclass": TimedAsyncAdaptedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+DATABASE_PARAMS["connect_args"] = {
+    "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE
+}
     
 async_engine = create_async_engine(DATABASE_URL, **DATABASE_PARAMS)
+replica_engines = [create_async_engine(url, **DATABASE_PARAMS) for url in REPLICA_URLS]
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context.query_start = perf_counter()
+
+
+def _observe_query_time(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - context.query_start
+    DB_QUERY_DURATION.labels(statement.split(None, 1)[0].upper()).observe(elapsed)
+
+
+for _engine in (async_engine, *replica_engines):
+    event.listen(_engine.sync_engine, "before_cursor_execute", _start_query_timer)
+    event.listen(_engine.sync_engine, "after_cursor_execute", _observe_query_time)
+
+
+# отставание реплики в секундах; NULL - реплика еще ничего не применила
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        -- все полученное применено: основная простаивает, а не реплика отстает
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class ReplicaSet:
+    """
+    Replica engines with replay lag checked in the background. A replica
+    lagging more than max_lag, or failing the check, gets no reads until
+    a later check passes; with no healthy replica reads go to the primary.
+    """
+
+    def __init__(self, engines: list[AsyncEngine], max_lag: float, interval: float):
+        self.engines = engines
+        self.max_lag = max_lag
+        self.interval = interval
+        self.healthy: list[AsyncEngine] = []
+        self._next = 0
+
+    def pick(self) -> AsyncEngine | None:
+        healthy = self.healthy
+        if not healthy:
+            return None
+        self._next = (self._next + 1) % len(healthy)
+        return healthy[self._next]
+
+    @staticmethod
+    async def _lag(engine: AsyncEngine) -> float | None:
+        async with engine.connect() as connection:
+            lag = (await connection.execute(REPLICA_LAG_QUERY)).scalar()
+            return None if lag is None else float(lag)
+
+    async def check(self):
+        healthy = []
+        for engine in self.engines:
+            replica = f"{engine.url.host}:{engine.url.port}"
+            try:
+                lag = await asyncio.wait_for(self._lag(engine), timeout=self.interval)
+            except Exception:
+                logger.warning("Replica check failed", extra={"replica": replica}, exc_info=True)
+                DB_REPLICA_LAG.labels(replica).set(-1)
+                continue
+            DB_REPLICA_LAG.labels(replica).set(-1 if lag is None else lag)
+            if lag is not None and lag <= self.max_lag:
+                healthy.append(engine)
+            else:
+                logger.warning("Replica lags behind", extra={"replica": replica, "lag": lag})
+        self.healthy = healthy
+
+    async def run(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+
+replicas = ReplicaSet(replica_engines, settings.DB_REPLICA_MAX_LAG, settings.DB_REPLICA_CHECK_INTERVAL)
+
+
+class RoutingSession(Session):
+    """
+    Selects marked with execution_options(replica=True) go to a healthy
+    replica. Everything else goes to the primary, and after the first write
+    so does every later statement of the session: a request reads its own
+    writes. Marked reads may be up to DB_REPLICA_MAX_LAG seconds stale.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if clause is None or not clause.is_select:
+            # flush, insert/update/delete, text()
+            self.info["wrote"] = True
+        elif (
+            not self.info.get("wrote")
+            and clause.get_execution_options().get("replica")
+            and getattr(clause, "_for_update_arg", None) is None
+        ):
+            engine = replicas.pick()
+            if engine is not None:
+                DB_QUERIES_ROUTED.labels("replica").inc()
+                return engine.sync_engine
+        DB_QUERIES_ROUTED.labels("primary").inc()
+        return async_engine.sync_engine
+
+
 # engine = create_engine(DATABASE_URL)
 
-async_session_maker = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+async_session_maker = sessionmaker(
+    async_engine, class_=AsyncSession, sync_session_class=RoutingSession, expire_on_commit=False
+)
 # session_maker = sessionmaker(engine, expire_on_commit=False)
 
+# сессия текущего запроса, привязывается зависимостью get_session
+current_session: ContextVar[AsyncSession | None] = ContextVar("current_session", default=None)
+
+
+async def get_session():
+    """
+    FastAPI dependency: one session and one transaction per request.
+    DAO methods called while it is active reuse this session instead of
+    opening their own; the transaction is committed when the handler returns.
+    """
+    async with async_session_maker() as session:
+        token = current_session.set(session)
+        try:
+            yield session
+            if session.info.get("failed"):
+                # DAO вызов упал, а обработчик мог проглотить ошибку:
+                # коммит остального сохранил бы запрос наполовину
+                raise RequestTransactionFailedException
+            await session.commit()
+            for callback in session.info.pop("after_commit", []):
+                await callback()
+        except Exception:
+            session.info.pop("after_commit", None)
+            await session.rollback()
+            raise
+        finally:
+            current_session.reset(token)
+
+
+@asynccontextmanager
+async def session_scope():
+    """
+    Session for a single DAO call: the request session if one is bound,
+    otherwise a new session committed on exit.
+    """
+    session = current_session.get()
+    if session is not None:
+        try:
+            yield session
+        except Exception:
+            # откат здесь молча отменил бы прошлые записи запроса,
+            # поэтому транзакция только помечается, откатит ее get_session
+            session.info["failed"] = True
+            raise
+        return
+    async with async_session_maker() as session:
+        yield session
+        await session.commit()
+
+
+@asynccontextmanager
+async def driver_connection(replica: bool = False):
+    """
+    asyncpg connection from the engine pool, for what SQLAlchemy does not
+    wrap (COPY). Transactions on it are managed with asyncpg directly.
+    replica=True - a healthy replica if there is one, for reads only.
+    """
+    engine = (replicas.pick() if replica else None) or async_engine
+    async with engine.connect() as connection:
+        raw = await connection.get_raw_connection()
+        yield raw.driver_connection
+
+
+async def run_after_commit(callback):
+    """
+    Runs the callback once the request transaction is committed, or right
+    away when DAO calls are not bound to a request session.
+    """
+    session = current_session.get()
+    if session is None:
+        await callback()
+        return
+    session.info.setdefault("after_commit", []).append(callback)
+
+
 class Base(DeclarativeBase):
     """ 
     используется для миграции
     """
     pass 
-
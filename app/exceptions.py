@@ -24,6 +24,11 @@ class TokenExpiredException(UserException):
     detail="Срок действия токена истек"
         
         
+class TokenRevokedException(UserException):
+    status_code=status.HTTP_401_UNAUTHORIZED
+    detail="Токен отозван"
+
+
 class TokenAbsentException(UserException):
     status_code=status.HTTP_401_UNAUTHORIZED
     detail="Токен отсутствует"
@@ -37,5 +42,34 @@ class IncorrectTokenFormatException(UserException):
 class UserIsNotPresentException(UserException):
     status_code=status.HTTP_401_UNAUTHORIZED
 
+
+class NotEnoughRightsException(UserException):
+    status_code=status.HTTP_403_FORBIDDEN
+    detail="Недостаточно прав"
+
 class InvalidVerificationCode(UserException):
-    status_code=status.HTTP_417_EXPECTATION_FAILED
\ No newline at end of file
+    status_code=status.HTTP_417_EXPECTATION_FAILED
+
+
+class ImportFormatException(UserException):
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
+    detail="Неверный формат файла импорта"
+
+
+class RequestTransactionFailedException(UserException):
+    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+    detail="Ошибка базы данных, изменения отменены"
+
+
+class TooManyRequestsException(UserException):
+    status_code=status.HTTP_429_TOO_MANY_REQUESTS
+    detail="Слишком много запросов, повторите позже"
+
+    def __init__(self, retry_after: int):
+        super().__init__()
+        self.headers = {"Retry-After": str(max(retry_after, 1))}
+
+
+class ServiceOverloadedException(UserException):
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+    detail="Сервис перегружен, повторите запрос позже"
@@ -0,0 +1,92 @@
+from app.metrics import LOADER_BATCH_SIZE
+
+import asyncio
+import contextvars
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BatchLoader(Generic[K, V]):
+    """
+    DataLoader-style coalescing of single-key lookups: keys requested within
+    `delay` seconds are fetched together by one `load_many(keys)` call, and
+    concurrent lookups of the same key share one pending result
+    (single-flight). A batch is dispatched early once it reaches max_batch.
+    """
+
+    def __init__(self, name: str, load_many: Callable[[list[K]], Awaitable[dict[K, V]]], delay: float, max_batch: int):
+        self.name = name
+        self.load_many = load_many
+        self.delay = delay
+        self.max_batch = max_batch
+        # ключ -> результат, общий для всех, кто ждет этот ключ
+        self._inflight: dict[K, asyncio.Future] = {}
+        self._batch: list[K] = []
+        self._dispatcher: asyncio.Task | None = None
+        # ссылки на запущенные задачи, чтобы их не собрал GC
+        self._tasks: set[asyncio.Task] = set()
+
+    async def load(self, key: K) -> V | None:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            self._batch.append(key)
+            if len(self._batch) >= self.max_batch:
+                self._dispatch_now()
+            elif self._dispatcher is None:
+                self._dispatcher = self._spawn(self._dispatch_later())
+        # отмена одного запроса не должна отменять результат для остальных
+        return await asyncio.shield(future)
+
+    async def load_all(self, keys: list[K]) -> dict[K, V]:
+        keys = list(dict.fromkeys(keys))
+        values = await asyncio.gather(*(self.load(key) for key in keys))
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def _spawn(self, coro) -> asyncio.Task:
+        # пустой контекст: иначе задача унаследует сессию запроса (current_session),
+        # который первым попал в пакет, и будет выполнять запрос в его транзакции
+        task = asyncio.create_task(coro, context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _take_batch(self) -> list[K]:
+        batch, self._batch = self._batch, []
+        return batch
+
+    def _dispatch_now(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        self._spawn(self._run(self._take_batch()))
+
+    async def _dispatch_later(self):
+        await asyncio.sleep(self.delay)
+        self._dispatcher = None
+        await self._run(self._take_batch())
+
+    async def _run(self, keys: list[K]):
+        if not keys:
+            return
+        LOADER_BATCH_SIZE.labels(self.name).observe(len(keys))
+        try:
+            values = await self.load_many(keys)
+        except BaseException as e:
+            for key in keys:
+                future = self._inflight.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+                    # исключение могли не забрать, если все ожидающие отменены
+                    future.exception()
+            if not isinstance(e, Exception):
+                raise
+            return
+        for key in keys:
+            future = self._inflight.pop(key)
+            if not future.done():
+                future.set_result(values.get(key))
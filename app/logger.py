@@ -1,28 +1,124 @@
 from app.config import settings
 
+import atexit
+import json
 import logging
-from datetime import datetime, UTC
+import random
+from datetime import date, datetime, time, UTC
+from decimal import Decimal
+from uuid import UUID
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 
 from pythonjsonlogger import jsonlogger
+from pythonjsonlogger.jsonlogger import RESERVED_ATTRS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 logger = logging.getLogger()
 logHandler = logging.StreamHandler()  #пишет логи в консоль
 
+
+json_encoder = jsonlogger.JsonEncoder()
+# значения extra, которые не меняются после записи и передаются в поток как есть
+IMMUTABLE_TYPES = (str, int, float, bool, type(None), bytes, date, time, Decimal, UUID)
+
+
+def orjson_dumps(obj, default=None, cls=None, **kwargs):
+    try:
+        return orjson.dumps(
+            obj,
+            default=default or json_encoder.default,
+            option=orjson.OPT_NON_STR_KEYS
+        ).decode()
+    except orjson.JSONEncodeError:
+        # например, int шире 64 бит - запись не теряем, кодируем через json
+        return json.dumps(obj, default=default, cls=cls or jsonlogger.JsonEncoder, **kwargs)
+
+
+def snapshot(value):
+    """
+    Copy of an extra value that later changes of the original do not affect
+    """
+    if isinstance(value, IMMUTABLE_TYPES):
+        return value
+    if isinstance(value, dict):
+        return {key: snapshot(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [snapshot(item) for item in value]
+    # ORM объекты и прочее - в строку сейчас, пока запрос их не изменил
+    return json_encoder.default(value)
+
+
 class JsonFormatter(jsonlogger.JsonFormatter):
     def add_fields(self, log_record, record, message_dict):
         super(JsonFormatter, self).add_fields(log_record, record, message_dict)
         if not log_record.get("timestamp"):
-            now = datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            # время создания записи, а не форматирования - в режиме очереди они различаются
+            now = datetime.fromtimestamp(record.created, UTC).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
             log_record["timestamp"] = now
         if log_record.get("level"):
             log_record["level"] = log_record["level"].upper()
         else:
             log_record["level"] = record.levelname
-    
-formatter = JsonFormatter(
-    "%(timestamp)s $(level)s $(message)s %(module)s %(funcName)s"
-)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a share of high-volume records: rates maps a message
+    to the probability of the record being kept.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.msg)
+        return rate is None or random.random() < rate
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    Puts records on a queue for a QueueListener thread. Unlike QueueHandler
+    it does not format the record in the caller, so JSON serialization
+    and exc_info handling happen in the listener thread. Mutable extra
+    values are copied here, as they are at the time of the call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        for name, value in record.__dict__.items():
+            if name not in RESERVED_ATTRS and not isinstance(value, IMMUTABLE_TYPES):
+                record.__dict__[name] = snapshot(value)
+        return record
+
+
+def make_formatter(serializer: str) -> JsonFormatter:
+    json_serializer = orjson_dumps if serializer == "orjson" and orjson else json.dumps
+    return JsonFormatter(
+        "%(timestamp)s %(level)s %(message)s %(module)s %(funcName)s",
+        json_serializer=json_serializer
+    )
+
+
+formatter = make_formatter(settings.LOG_SERIALIZER)
 
 logHandler.setFormatter(formatter)
-logger.addHandler(logHandler)
-logger.setLevel(settings.LOG_LEVEL)
\ No newline at end of file
+if settings.LOG_QUEUE:
+    log_queue = SimpleQueue()
+    queueHandler = AsyncQueueHandler(log_queue)
+    queueHandler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+    log_listener = QueueListener(log_queue, logHandler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+    logger.addHandler(queueHandler)
+else:
+    logHandler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+    logger.addHandler(logHandler)
+logger.setLevel(settings.LOG_LEVEL)
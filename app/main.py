@@ -1,12 +1,19 @@
+from app.cache import listen_pubsub, redis
 from app.config import settings
 from app.users.router import router as router_users
 from app.logger import logger
-from app.database import async_engine
+from app.database import async_session_maker, replicas
 from app.admin.views import UserAdmin
+from app.users.hashing import password_hasher
+from app.users.transfer import shutdown_import_executor
+from app.metrics import HTTP_IN_FLIGHT, HTTP_REQUEST_DURATION, render_metrics
+from app.sampling import SSentrySampling, trace_sampler
+from app.users.dependencies import get_internal_caller
 
 import asyncio
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
@@ -16,24 +23,38 @@ from fastapi_versioning import VersionedFastAPI, version
 from sqladmin import Admin
 
 from contextlib import asynccontextmanager
-from redis import asyncio as aioredis
-from time import time
+from time import perf_counter
 import sentry_sdk
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    redis = aioredis.from_url(f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}", encoding="utf-8", decode_responses=True)
     FastAPICache.init(RedisBackend(redis), prefix="cache")
+    if settings.HASH_TARGET_MS and not settings.HASH_CALIBRATED:
+        # под gunicorn калибровка уже сделана в мастере (gunicorn.conf.py)
+        await password_hasher.calibrate(settings.HASH_TARGET_MS)
+    pubsub_listener = asyncio.create_task(listen_pubsub())
+    replica_checker = None
+    if replicas.engines:
+        # до первой проверки все чтения идут на основную
+        await replicas.check()
+        replica_checker = asyncio.create_task(replicas.run())
 
     yield
     
+    pubsub_listener.cancel()
+    if replica_checker is not None:
+        replica_checker.cancel()
+    password_hasher.shutdown()
+    shutdown_import_executor()
+    
     
 app = FastAPI(
     title="Users API doc, mkbeth",
     version="0.1.0",
     root_path="/api",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 app.include_router(router_users)
 
@@ -43,27 +64,64 @@ def root():
     return {"Users microservice"}
 
 
+# VersionedFastAPI создает новое приложение: lifespan передаем явно,
+# middleware регистрируем уже на нем
+app = VersionedFastAPI(
+    app,
+    version_format="{major}",
+    prefix_format="/v{major}",
+    description="v1",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+
 @app.middleware("http")
 async def add_process(
     request: Request,
     call_next
 ):
-    start_time = time()
-    response = await call_next(request)
-    process_time = time() - start_time
+    start_time = perf_counter()
+    HTTP_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+    finally:
+        HTTP_IN_FLIGHT.dec()
+    process_time = perf_counter() - start_time
+    
+    # шаблон пути и версия, а не сам путь - чтобы не плодить метки
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", "unmatched")
+    api_version = getattr(getattr(route, "endpoint", None), "_api_version", None)
+    HTTP_REQUEST_DURATION.labels(
+        request.method,
+        route_path,
+        f"v{api_version[0]}" if api_version else "none",
+        response.status_code
+    ).observe(process_time)
+    
     logger.info("Request execution time", extra={
         "process_time": round(process_time, 4)
     })
     return response
 
-app = VersionedFastAPI(
-    app,
-    version_format="{major}",
-    prefix_format="/v{major}",
-    description="v1"
-)
 
-admin = Admin(app, async_engine)
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.post("/sentry/sampling", include_in_schema=False, dependencies=[Depends(get_internal_caller)])
+async def retune_sentry_sampling(overrides: SSentrySampling):
+    """
+    Changes Sentry sampling on every worker without a restart
+    """
+    await trace_sampler.publish(**overrides.model_dump(exclude_none=True))
+    return trace_sampler.options()
+
+# сессии с маршрутизацией: списки админки читаются с реплик
+admin = Admin(app, session_maker=async_session_maker)
 
 admin.add_view(UserAdmin)
 
@@ -89,8 +147,10 @@ app.add_middleware(
 
 sentry_sdk.init(
     dsn=settings.CENTRY,
-    traces_sample_rate=1.0,
-    profiles_sample_rate=1.0,
-    enable_tracing=True
+    # решение о трассировке принимает trace_sampler (app/sampling.py)
+    traces_sampler=trace_sampler.traces_sampler,
+    before_send_transaction=trace_sampler.before_send_transaction,
+    # доля от трассируемых запросов
+    profiles_sample_rate=settings.SENTRY_PROFILES_RATE,
 ) 
 
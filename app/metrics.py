@@ -0,0 +1,174 @@
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+import os
+
+
+def get_registry() -> CollectorRegistry:
+    # в gunicorn/prefork celery каждый процесс пишет метрики в PROMETHEUS_MULTIPROC_DIR
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int):
+    start_http_server(port, registry=get_registry())
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route", "version", "status"],
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests being processed",
+    multiprocess_mode="livesum",
+)
+
+SENTRY_TRANSACTIONS = Counter(
+    "sentry_transactions_total",
+    "Sentry transactions by the final sampling decision",
+    ["decision"],
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to get a connection from the SQLAlchemy pool",
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30),
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time",
+    ["statement"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+DB_QUERIES_ROUTED = Counter(
+    "db_queries_routed_total",
+    "ORM statements sent to the primary or to a replica",
+    ["target"],
+)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds",
+    "Replay lag of a replica at the last check, -1 if the check failed",
+    ["replica"],
+    multiprocess_mode="max",
+)
+
+CELERY_TASK_QUEUE_WAIT = Histogram(
+    "celery_task_queue_wait_seconds",
+    "Time between publishing a task and a worker starting it",
+    ["task"],
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+CELERY_TASK_DURATION = Histogram(
+    "celery_task_duration_seconds",
+    "Celery task run time",
+    ["task", "state"],
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+
+EMAIL_DEDUP = Counter(
+    "email_dedup_total",
+    "Verification emails sent at once, suppressed, or sent as a trailing send",
+    ["result"],
+)
+EMAIL_REJECTED = Counter(
+    "email_rejected_total",
+    "Emails permanently rejected by the SMTP server (5xx), not retried",
+)
+
+OUTBOX_RELAYED = Counter(
+    "outbox_relayed_total",
+    "Outbox emails handed over to Celery or SMTP",
+    ["mode"],
+)
+OUTBOX_DELAY = Histogram(
+    "outbox_delay_seconds",
+    "Time from writing an outbox row to relaying it",
+    buckets=(.05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 300, 900),
+)
+
+CLEANUP_DELETED = Counter(
+    "cleanup_unverified_deleted_total",
+    "Never verified accounts deleted by the cleanup job",
+)
+CLEANUP_BATCH_DURATION = Histogram(
+    "cleanup_unverified_batch_seconds",
+    "Duration of one cleanup batch transaction",
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+
+USERS_TRANSFERRED = Counter(
+    "users_transferred_total",
+    "Users imported, skipped as duplicates, rejected as invalid, or exported",
+    ["result"],
+)
+
+
+HASH_BUCKETS = (.005, .01, .025, .05, .1, .2, .3, .5, .75, 1, 2.5, 5)
+
+HASH_QUEUE_WAIT = Histogram(
+    "password_hash_queue_wait_seconds",
+    "Time a password hashing job waited for a free worker",
+    ["operation"],
+    buckets=HASH_BUCKETS,
+)
+HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "Time spent inside the password hasher",
+    ["operation"],
+    buckets=HASH_BUCKETS,
+)
+HASH_IN_FLIGHT = Gauge(
+    "password_hash_in_flight",
+    "Password hashing jobs running or queued",
+    multiprocess_mode="livesum",
+)
+HASH_REJECTED = Counter(
+    "password_hash_rejected_total",
+    "Password hashing jobs rejected because the queue was full",
+    ["operation"],
+)
+
+RATE_LIMIT_REQUESTS = Counter(
+    "rate_limit_requests_total",
+    "Rate limit decisions by where they were made",
+    ["endpoint", "tier", "result"],
+)
+
+LOADER_BATCH_SIZE = Histogram(
+    "loader_batch_size",
+    "Keys fetched by one coalesced lookup",
+    ["loader"],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+USER_CACHE_REQUESTS = Counter(
+    "user_cache_requests_total",
+    "Authenticated user cache lookups",
+    ["tier", "result"],
+)
+
+EMAIL_TEMPLATE_RENDER = Histogram(
+    "email_template_render_seconds",
+    "Email template render time",
+    ["template"],
+    buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05),
+)
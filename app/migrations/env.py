@@ -13,6 +13,7 @@ sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
 from app.config import settings
 from app.database import Base
 from app.users.models import User
+from app.outbox.models import EmailOutbox
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,46 @@
+"""users email indexes
+
+Revision ID: 3c9a1f7d2b64
+Revises: f6482c0fa32e
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9a1f7d2b64'
+down_revision: Union[str, None] = 'f6482c0fa32e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # адреса, различающиеся только регистром, после lower() совпали бы:
+    # какой аккаунт оставить, решаем вручную, а не миграцией
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT lower(email) AS email, array_agg(id ORDER BY id) AS ids FROM users "
+        "GROUP BY lower(email) HAVING count(*) > 1 ORDER BY 1"
+    )).all()
+    if duplicates:
+        report = "\n".join(f"  {row.email}: ids {', '.join(map(str, row.ids))}" for row in duplicates)
+        raise RuntimeError(
+            f"{len(duplicates)} emails differ only in case, merge or rename these users "
+            f"before upgrading:\n{report}"
+        )
+    # email храним в нижнем регистре, тогда обычный unique индекс
+    # работает как регистронезависимый и используется в filter_by(email=...)
+    op.execute("UPDATE users SET email = lower(email) WHERE email <> lower(email)")
+    op.create_check_constraint('ck_users_email_lower', 'users', 'email = lower(email)')
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_unverified', 'users', ['id', 'created'],
+                    postgresql_where=sa.text('NOT is_verified'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_unverified', table_name='users')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_constraint('ck_users_email_lower', 'users', type_='check')
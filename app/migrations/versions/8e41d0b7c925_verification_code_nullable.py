@@ -0,0 +1,32 @@
+"""verification code nullable
+
+Revision ID: 8e41d0b7c925
+Revises: 3c9a1f7d2b64
+Create Date: 2026-10-18 11:03:17.552190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e41d0b7c925'
+down_revision: Union[str, None] = '3c9a1f7d2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # коды подтверждения теперь хранятся в redis
+    op.alter_column('users', 'verification_code',
+               existing_type=sa.VARCHAR(),
+               nullable=True)
+
+
+def downgrade() -> None:
+    op.execute("UPDATE users SET verification_code = '' WHERE verification_code IS NULL")
+    op.alter_column('users', 'verification_code',
+               existing_type=sa.VARCHAR(),
+               nullable=False)
@@ -0,0 +1,26 @@
+"""users token version
+
+Revision ID: b5f3e9a2c017
+Revises: 8e41d0b7c925
+Create Date: 2026-10-18 12:21:05.904417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5f3e9a2c017'
+down_revision: Union[str, None] = '8e41d0b7c925'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,33 @@
+"""users verified at
+
+Revision ID: d3e8b1c6a540
+Revises: c7d2a4e81f39
+Create Date: 2026-10-18 16:40:12.502871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3e8b1c6a540'
+down_revision: Union[str, None] = 'c7d2a4e81f39'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('verified_at', sa.DateTime(timezone=True), nullable=True))
+    # точная дата подтверждения неизвестна. Кроме подтвержденных, считаем
+    # подтвержденными и пользователей с портфелем: они могли быть в процессе
+    # смены почты, такие аккаунты очистка удалять не должна
+    op.execute(
+        "UPDATE users SET verified_at = created "
+        "WHERE is_verified OR portfolio_id IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'verified_at')
@@ -0,0 +1,46 @@
+from app.base_dao import BaseDAO
+from app.database import session_scope
+from app.outbox.models import EmailOutbox
+
+from sqlalchemy import delete, insert, select
+
+
+VERIFICATION = "verification"
+
+
+class OutboxDAO(BaseDAO):
+    model = EmailOutbox
+
+    @classmethod
+    async def add_verification(cls, email: str, verification_code: str, locale: str | None = None):
+        """
+        Queues a verification email in the current transaction:
+        it is sent only if the request commits
+        """
+        async with session_scope() as session:
+            query = insert(cls.model).values(
+                kind=VERIFICATION,
+                payload={"email": email, "verification_code": verification_code, "locale": locale}
+            )
+            await session.execute(query)
+
+    @staticmethod
+    async def claim_batch(session, kind: str, limit: int) -> list[EmailOutbox]:
+        """
+        Locks the oldest rows; SKIP LOCKED lets several relays drain the table
+        without waiting for each other. Rows stay locked until the
+        caller's transaction ends.
+        """
+        query = (
+            select(EmailOutbox)
+            .where(EmailOutbox.kind == kind)
+            .order_by(EmailOutbox.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await session.execute(query)
+        return result.scalars().all()
+
+    @staticmethod
+    async def delete_batch(session, ids: list[int]):
+        await session.execute(delete(EmailOutbox).where(EmailOutbox.id.in_(ids)))
@@ -0,0 +1,20 @@
+from app.database import Base
+
+from datetime import datetime
+from sqlalchemy import BigInteger, DateTime, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class EmailOutbox(Base):
+    """
+    Emails to send, written in the same transaction as the change that
+    triggers them; the relay (app/tasks/outbox_relay.py) deletes a row
+    once it is handed over to Celery or SMTP.
+    """
+    __tablename__ = "email_outbox"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    kind: Mapped[str]
+    payload: Mapped[dict] = mapped_column(JSONB)
+    created: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,182 @@
+from app.cache import on_reconnect, redis, subscribe
+from app.config import settings
+from app.logger import logger
+from app.metrics import SENTRY_TRANSACTIONS
+
+import json
+import random
+from datetime import datetime
+from time import monotonic
+from urllib.parse import urlparse
+from pydantic import BaseModel, Field
+
+
+SAMPLING_CHANNEL = "sentry:sampling"
+SAMPLING_KEY = "sentry:sampling"
+OPTIONS = ("traces_rate", "candidate_rate", "route_rates", "status_rates", "slow_seconds", "max_per_second")
+
+
+class SSentrySampling(BaseModel):
+    traces_rate: float | None = Field(None, ge=0, le=1)
+    candidate_rate: float | None = Field(None, ge=0, le=1)
+    route_rates: dict[str, float] | None = None
+    status_rates: dict[str, float] | None = None
+    slow_seconds: float | None = Field(None, gt=0)
+    max_per_second: int | None = Field(None, ge=0)
+
+
+class TraceSampler:
+    """
+    Sentry sampling in two steps. traces_sampler decides at the start of a
+    request, when only the path is known: a route with its own rate is
+    traced at exactly that rate, any other path at least at candidate_rate
+    so errors and slow requests can still be caught.
+    before_send_transaction decides at the end, knowing status and duration:
+    5xx and slow transactions are always kept, the rest are thinned down to
+    route rate * status rate and capped at max_per_second per process.
+    """
+
+    def __init__(
+        self,
+        traces_rate: float,
+        candidate_rate: float,
+        route_rates: dict[str, float],
+        status_rates: dict[str, float],
+        slow_seconds: float,
+        max_per_second: int,
+    ):
+        self.traces_rate = traces_rate
+        self.candidate_rate = candidate_rate
+        self.route_rates = route_rates
+        self.status_rates = status_rates
+        self.slow_seconds = slow_seconds
+        self.max_per_second = max_per_second
+        self._second = 0
+        self._sent_this_second = 0
+
+    def _route(self, path: str) -> str | None:
+        # самый длинный подходящий фрагмент пути: "/auth/login" точнее "/auth"
+        matches = [fragment for fragment in self.route_rates if fragment in path]
+        return max(matches, key=len) if matches else None
+
+    def route_rate(self, path: str) -> float:
+        route = self._route(path)
+        return self.traces_rate if route is None else self.route_rates[route]
+
+    def head_rate(self, path: str) -> float:
+        route = self._route(path)
+        if route is not None:
+            # своя доля пути - потолок: частые дешевые запросы вроде /auth/me
+            # не трассируются чаще, чем задано
+            return min(max(self.route_rates[route], 0.0), 1.0)
+        if self.traces_rate <= 0:
+            return 0.0
+        return min(max(self.traces_rate, self.candidate_rate), 1.0)
+
+    def traces_sampler(self, sampling_context: dict) -> float:
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            # решение вызывающего сервиса, чтобы трассы не рвались
+            return float(parent_sampled)
+        scope = sampling_context.get("asgi_scope") or {}
+        return self.head_rate(scope.get("path", ""))
+
+    @staticmethod
+    def _duration(event: dict) -> float:
+        start, end = event.get("start_timestamp"), event.get("timestamp")
+        if isinstance(start, str):
+            start, end = datetime.fromisoformat(start), datetime.fromisoformat(end)
+        if start is None or end is None:
+            return 0.0
+        return (end - start).total_seconds()
+
+    @staticmethod
+    def _status_code(event: dict) -> int | None:
+        status_code = (event.get("tags") or {}).get("http.status_code")
+        if status_code:
+            return int(status_code)
+        trace_status = (event.get("contexts") or {}).get("trace", {}).get("status")
+        # необработанное исключение: ответ не записан
+        return 500 if trace_status == "internal_error" else None
+
+    def _under_cap(self) -> bool:
+        second = int(monotonic())
+        if second != self._second:
+            self._second, self._sent_this_second = second, 0
+        if self._sent_this_second >= self.max_per_second:
+            return False
+        self._sent_this_second += 1
+        return True
+
+    def before_send_transaction(self, event: dict, hint: dict) -> dict | None:
+        status_code = self._status_code(event)
+        if status_code is not None and status_code >= 500:
+            SENTRY_TRANSACTIONS.labels("error").inc()
+            return event
+        if self._duration(event) >= self.slow_seconds:
+            SENTRY_TRANSACTIONS.labels("slow").inc()
+            return event
+
+        url = (event.get("request") or {}).get("url")
+        path = urlparse(url).path if url else event.get("transaction", "")
+        head = self.head_rate(path)
+        status_class = f"{status_code // 100}xx" if status_code else "unknown"
+        target = self.route_rate(path) * self.status_rates.get(status_class, 1.0)
+        # транзакция уже прошла head-сэмплирование с вероятностью head
+        if head <= 0 or random.random() >= target / head:
+            SENTRY_TRANSACTIONS.labels("dropped").inc()
+            return None
+        if not self._under_cap():
+            SENTRY_TRANSACTIONS.labels("capped").inc()
+            return None
+        SENTRY_TRANSACTIONS.labels("sampled").inc()
+        return event
+
+    def options(self) -> dict:
+        return {name: getattr(self, name) for name in OPTIONS}
+
+    def configure(self, **overrides):
+        for name, value in overrides.items():
+            if name not in OPTIONS:
+                raise ValueError(f"Unknown sampling option: {name}")
+            setattr(self, name, value)
+
+    def _on_message(self, data: str):
+        try:
+            self.configure(**json.loads(data))
+            logger.info("Sentry sampling retuned", extra={"overrides": data})
+        except (ValueError, TypeError):
+            logger.error("Sentry sampling: bad overrides", extra={"overrides": data}, exc_info=True)
+
+    async def load(self):
+        """
+        Overrides published while the worker was starting or disconnected
+        """
+        data = await redis.get(SAMPLING_KEY)
+        if data:
+            self._on_message(data)
+
+    async def publish(self, **overrides):
+        """
+        Retunes every worker; the resulting options are stored
+        for workers that start later
+        """
+        self.configure(**overrides)
+        data = json.dumps(self.options())
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.set(SAMPLING_KEY, data)
+            pipe.publish(SAMPLING_CHANNEL, data)
+            await pipe.execute()
+
+
+trace_sampler = TraceSampler(
+    traces_rate=settings.SENTRY_TRACES_RATE,
+    candidate_rate=settings.SENTRY_CANDIDATE_RATE,
+    route_rates=settings.SENTRY_ROUTE_RATES,
+    status_rates=settings.SENTRY_STATUS_RATES,
+    slow_seconds=settings.SENTRY_SLOW_SECONDS,
+    max_per_second=settings.SENTRY_MAX_TRANSACTIONS_PER_SECOND,
+)
+
+subscribe(SAMPLING_CHANNEL, trace_sampler._on_message)
+on_reconnect(trace_sampler.load)
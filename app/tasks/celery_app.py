@@ -1,6 +1,19 @@
 from app.config import settings
 from celery import Celery
+from kombu import Queue
 from celery.schedules import crontab
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_shutdown,
+)
+from time import perf_counter, time
+
+from app.metrics import CELERY_TASK_DURATION, CELERY_TASK_QUEUE_WAIT, start_metrics_server
+from app.tasks.email_templates import templates
+from app.tasks.smtp_pool import close_smtp_pool
 
 
 app_celery = Celery(
@@ -9,9 +22,72 @@ app_celery = Celery(
     include=["app.tasks.tasks", "app.tasks.scheduled"]
 )
 
+# письма и периодические задачи в разных очередях и у разных воркеров:
+# долгая периодическая задача не задерживает письма с кодами
+app_celery.conf.update(
+    task_queues=(
+        Queue("email", routing_key="email"),
+        Queue("periodic", routing_key="periodic"),
+    ),
+    task_default_queue="email",
+    task_routes={
+        "app.tasks.tasks.*": {"queue": "email"},
+        "periodic_*": {"queue": "periodic"},
+    },
+    # в Redis 0 - наивысший приоритет
+    broker_transport_options={"priority_steps": list(range(10)), "queue_order_strategy": "priority"},
+    task_default_priority=5,
+    # результаты задач никто не читает
+    task_ignore_result=True,
+    # короткие задачи писем не должны простаивать в буфере занятого процесса
+    worker_prefetch_multiplier=settings.CELERY_PREFETCH_MULTIPLIER,
+    # подтверждение после выполнения: задача упавшего воркера будет выполнена снова
+    task_acks_late=settings.CELERY_ACKS_LATE,
+)
+
 app_celery.conf.beat_schedule = {
-    "parser-task": {
-        "task": "periodic_parser",
+    "cleanup-unverified-users": {
+        "task": "periodic_cleanup_unverified",
         "schedule": 60*60
     }
-}
\ No newline at end of file
+}
+
+
+@worker_init.connect
+def compile_email_templates(**kwargs):
+    # до форка, дочерние процессы получают уже скомпилированные шаблоны
+    templates.load()
+
+
+@worker_init.connect
+def serve_metrics(**kwargs):
+    if settings.CELERY_METRICS_PORT:
+        start_metrics_server(settings.CELERY_METRICS_PORT)
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    headers["published_at"] = time()
+
+
+_task_started: dict[str, float] = {}
+
+
+@task_prerun.connect
+def observe_task_start(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = perf_counter()
+    published_at = getattr(task.request, "published_at", None)
+    if published_at:
+        CELERY_TASK_QUEUE_WAIT.labels(task.name).observe(max(time() - published_at, 0))
+
+
+@task_postrun.connect
+def observe_task_duration(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(perf_counter() - started)
+
+
+@worker_process_shutdown.connect
+def close_smtp_connections(**kwargs):
+    close_smtp_pool()
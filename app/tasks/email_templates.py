@@ -1,22 +1,79 @@
 from app.config import settings
+from app.metrics import EMAIL_TEMPLATE_RENDER
+
 from email.message import EmailMessage
+from pathlib import Path
+from time import perf_counter
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
 
 
+TEMPLATES_DIR = Path(__file__).parent / "templates"
+
+
+class TemplateRegistry:
+    """
+    Compiles every email template once per worker and renders from the
+    in-memory cache; templates are looked up as `<locale>/<name>` with
+    a fallback to the default locale.
+    """
+
+    def __init__(self, path: Path, default_locale: str, **brand):
+        self.default_locale = default_locale
+        self.env = Environment(
+            loader=FileSystemLoader(path),
+            autoescape=select_autoescape(["html"]),
+            auto_reload=False,
+            cache_size=-1,
+        )
+        self.env.globals.update(brand)
+        self._names: set[str] | None = None
+
+    def load(self):
+        self._names = set(self.env.list_templates())
+        for name in self._names:
+            self.env.get_template(name)
+
+    def _resolve(self, name: str, locale: str | None) -> str:
+        if self._names is None:
+            self.load()
+        localized = f"{locale}/{name}"
+        if locale and localized in self._names:
+            return localized
+        return f"{self.default_locale}/{name}"
+
+    def render(self, name: str, locale: str | None = None, **context) -> str:
+        template_name = self._resolve(name, locale)
+        start = perf_counter()
+        result = self.env.get_template(template_name).render(
+            locale=template_name.split("/", 1)[0], **context
+        )
+        EMAIL_TEMPLATE_RENDER.labels(template_name).observe(perf_counter() - start)
+        return result
+
+
+templates = TemplateRegistry(
+    TEMPLATES_DIR,
+    default_locale=settings.EMAIL_DEFAULT_LOCALE,
+    brand_name=settings.EMAIL_BRAND_NAME,
+    brand_color=settings.EMAIL_BRAND_COLOR,
+)
+
+
 def create_user_confirmation_message(
     email_to: EmailStr,
-    verification_code
+    verification_code,
+    locale: str | None = None
 ):
+    context = {"verification_code": verification_code}
     email = EmailMessage()
-    email["Subject"] = "Verfification message"
+    email["Subject"] = templates.render("verification_subject.txt", locale, **context).strip()
     email["From"] = settings.SMTP_USER
     email["To"] = email_to
-    
-    email.set_content(
-        f"""
-        <h1>Confirm by using code below on verification page: </h1>
-        {verification_code}
-        """,
+
+    email.set_content(templates.render("verification.txt", locale, **context))
+    email.add_alternative(
+        templates.render("verification.html", locale, **context),
         subtype="html"
     )
-    return email
\ No newline at end of file
+    return email
@@ -0,0 +1,101 @@
+"""
+Drains email_outbox into Celery (or straight to SMTP) in batches.
+Rows are locked with FOR UPDATE SKIP LOCKED and deleted in the same
+transaction after hand-over, so several relays can run side by side and
+every email is delivered at least once.
+
+    python -m app.tasks.outbox_relay
+"""
+from app.config import settings
+from app.database import async_session_maker
+from app.logger import logger
+from app.metrics import OUTBOX_DELAY, OUTBOX_RELAYED, start_metrics_server
+from app.outbox.dao import VERIFICATION, OutboxDAO
+from app.tasks.email_templates import create_user_confirmation_message
+from app.tasks.smtp_pool import close_smtp_pool, get_smtp_pool
+from app.tasks.tasks import email_dedup, send_verify_messages
+
+import asyncio
+import signal
+from collections import deque
+from datetime import datetime, UTC
+
+
+def deliver(items: list[list]) -> int:
+    """
+    Sends directly over the SMTP pool with the same deduplication as
+    send_verify_messages. Returns how many leading items were handled:
+    sent, collapsed into a trailing send, or permanently rejected (5xx) -
+    a rejected row is deleted too, otherwise it would be claimed first
+    by every later batch and block the outbox.
+    """
+    pool = get_smtp_pool()
+    for start in range(0, len(items), settings.SMTP_BATCH_SIZE):
+        chunk = items[start:start + settings.SMTP_BATCH_SIZE]
+        admitted = [i for i, item in enumerate(chunk) if email_dedup.admit(*item)]
+        messages = deque(create_user_confirmation_message(*chunk[i]) for i in admitted)
+        try:
+            pool.send_messages(messages)
+        except Exception:
+            unsent = admitted[len(admitted) - len(messages):]
+            logger.error("Outbox relay: SMTP delivery failed", extra={"sent": start + len(admitted) - len(unsent)}, exc_info=True)
+            # строки неотправленных остаются в outbox: окно снимается,
+            # иначе повтор схлопнулся бы в отложенную отправку
+            for i in unsent:
+                email_dedup.release(chunk[i][0])
+            return start + (unsent[0] if unsent else len(chunk))
+    return len(items)
+
+
+async def relay_batch(mode: str) -> int:
+    async with async_session_maker() as session:
+        async with session.begin():
+            rows = await OutboxDAO.claim_batch(session, VERIFICATION, settings.OUTBOX_BATCH_SIZE)
+            if not rows:
+                return 0
+            items = [
+                [row.payload["email"], row.payload["verification_code"], row.payload.get("locale")]
+                for row in rows
+            ]
+            if mode == "smtp":
+                relayed = rows[:await asyncio.to_thread(deliver, items)]
+            else:
+                # одна задача на пакет: письма уходят по одному SMTP соединению
+                await asyncio.to_thread(send_verify_messages.apply_async, args=[items])
+                relayed = rows
+            await OutboxDAO.delete_batch(session, [row.id for row in relayed])
+
+    now = datetime.now(UTC)
+    for row in relayed:
+        OUTBOX_DELAY.observe((now - row.created).total_seconds())
+    OUTBOX_RELAYED.labels(mode).inc(len(relayed))
+    return len(relayed)
+
+
+async def run(mode: str):
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    logger.info("Outbox relay started", extra={"mode": mode})
+    while not stopping.is_set():
+        try:
+            relayed = await relay_batch(mode)
+        except Exception:
+            # строки остаются в таблице и будут отправлены со следующей попытки
+            logger.error("Outbox relay: batch failed", exc_info=True)
+            relayed = 0
+        if relayed < settings.OUTBOX_BATCH_SIZE:
+            try:
+                await asyncio.wait_for(stopping.wait(), settings.OUTBOX_POLL_INTERVAL)
+            except TimeoutError:
+                pass
+    close_smtp_pool()
+    logger.info("Outbox relay stopped")
+
+
+if __name__ == "__main__":
+    if settings.OUTBOX_METRICS_PORT:
+        start_metrics_server(settings.OUTBOX_METRICS_PORT)
+    asyncio.run(run(settings.OUTBOX_RELAY_MODE))
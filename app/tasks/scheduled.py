@@ -1,6 +1,79 @@
 from app.tasks.celery_app import app_celery as app
+from app.cache import redis
+from app.config import settings
+from app.database import DATABASE_URL
+from app.logger import logger
+from app.metrics import CLEANUP_BATCH_DURATION, CLEANUP_DELETED
+from app.users.cache import user_cache
+from app.users.dao import UserDAO
 
+import asyncio
+from datetime import datetime, timedelta, UTC
+from time import perf_counter
+from sqlalchemy import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine
 
-@app.task(name="periodic_parser")
-def parser():
-    print("parsed")
\ No newline at end of file
+
+async def cleanup_unverified_users(
+    older_than_days: int,
+    batch_size: int,
+    pause: float,
+    max_seconds: float,
+) -> dict:
+    """
+    Deletes accounts that never verified their email, in small transactions
+    walking the ids in order; pauses between batches so replicas keep up.
+    Stops after max_seconds, the next run continues from the start.
+    """
+    # created - дата по UTC (server_default now()), как и у веб-приложения
+    created_before = datetime.now(UTC).date() - timedelta(days=older_than_days)
+    # свой engine без пула: каждый asyncio.run - новый event loop,
+    # соединения общего пула привязаны к циклу веб-приложения
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    started = perf_counter()
+    cursor, batches, deleted = 0, 0, 0
+    try:
+        async with engine.connect() as connection:
+            while perf_counter() - started < max_seconds:
+                batch_started = perf_counter()
+                async with connection.begin():
+                    ids = await UserDAO.delete_never_verified(connection, cursor, created_before, batch_size)
+                elapsed = perf_counter() - batch_started
+                if not ids:
+                    break
+                # после коммита: иначе чтение до удаления вернуло бы строку в кэш
+                await user_cache.invalidate(*ids)
+                cursor = ids[-1]
+                batches += 1
+                deleted += len(ids)
+                CLEANUP_DELETED.inc(len(ids))
+                CLEANUP_BATCH_DURATION.observe(elapsed)
+                logger.info("Unverified users cleanup batch", extra={
+                    "batch": batches, "deleted": len(ids), "cursor": cursor, "seconds": round(elapsed, 3)
+                })
+                if len(ids) < batch_size:
+                    break
+                await asyncio.sleep(pause)
+    finally:
+        await engine.dispose()
+        # соединения общего клиента Redis тоже привязаны к этому циклу
+        await redis.connection_pool.disconnect()
+
+    stats = {"batches": batches, "deleted": deleted, "seconds": round(perf_counter() - started, 3)}
+    logger.info("Unverified users cleanup finished", extra=stats)
+    return stats
+
+
+@app.task(
+    name="periodic_cleanup_unverified",
+    soft_time_limit=settings.CELERY_PERIODIC_TIME_LIMIT,
+    time_limit=settings.CELERY_PERIODIC_TIME_LIMIT + 60,
+)
+def cleanup_unverified():
+    return asyncio.run(cleanup_unverified_users(
+        older_than_days=settings.CLEANUP_UNVERIFIED_DAYS,
+        batch_size=settings.CLEANUP_BATCH_SIZE,
+        pause=settings.CLEANUP_BATCH_PAUSE,
+        # заканчиваем сами, не дожидаясь soft time limit
+        max_seconds=settings.CELERY_PERIODIC_TIME_LIMIT * 0.8,
+    ))
@@ -0,0 +1,173 @@
+from app.config import settings
+from app.logger import logger
+from app.metrics import EMAIL_REJECTED
+
+import os
+import smtplib
+import threading
+from collections import deque
+from contextlib import contextmanager
+from email.message import EmailMessage
+from time import monotonic
+
+
+class SMTPConnectionPool:
+    """
+    Authenticated SMTP connections of one worker process. Connections are
+    reused between tasks; one idle for longer than max_idle is checked with
+    NOOP before use, and one the server dropped is discarded and replaced.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str | None = None,
+        password: str | None = None,
+        use_ssl: bool = True,
+        size: int = 2,
+        max_idle: int = 30,
+        timeout: int = 10,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.size = size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        # (соединение, время последнего использования)
+        self._idle: list[tuple[smtplib.SMTP, float]] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        server = smtp_class(self.host, self.port, timeout=self.timeout)
+        if self.password:
+            server.login(self.user, self.password)
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    @staticmethod
+    def _is_alive(server: smtplib.SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _acquire(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            if monotonic() - last_used < self.max_idle or self._is_alive(server):
+                return server
+            self._close(server)
+        return self._connect()
+
+    def _release(self, server: smtplib.SMTP):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((server, monotonic()))
+                return
+        self._close(server)
+
+    @contextmanager
+    def connection(self):
+        server = self._acquire()
+        try:
+            yield server
+        except smtplib.SMTPResponseException:
+            # ответ сервера на письмо: smtplib уже сделал RSET и соединение
+            # рабочее, кроме 421 - тогда smtplib его сам закрыл
+            if server.sock is None:
+                server.close()
+            else:
+                self._release(server)
+            raise
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # SMTPException - подкласс OSError, ответы сервера обработаны выше
+            server.close()
+            raise
+        except Exception:
+            self._release(server)
+            raise
+        self._release(server)
+
+    def send_messages(self, messages: deque[EmailMessage]) -> list[EmailMessage]:
+        """
+        Sends messages over one connection, removing each one from the deque
+        once it is sent or permanently rejected, so on failure the deque holds
+        what is left. Returns the rejected messages. A temporary (4xx) reply
+        is raised as is; if the server drops the connection it reconnects once.
+        """
+        rejected = []
+        for attempt in range(2):
+            try:
+                with self.connection() as server:
+                    while messages:
+                        try:
+                            server.send_message(messages[0])
+                        except smtplib.SMTPRecipientsRefused:
+                            logger.error("SMTP recipient refused", extra={"email": messages[0]["To"]}, exc_info=True)
+                            rejected.append(messages[0])
+                            EMAIL_REJECTED.inc()
+                        except smtplib.SMTPResponseException as e:
+                            if e.smtp_code < 500:
+                                raise
+                            # повтор получил бы тот же отказ и задержал бы остальные письма
+                            logger.error("SMTP message rejected", extra={
+                                "email": messages[0]["To"], "smtp_code": e.smtp_code
+                            }, exc_info=True)
+                            rejected.append(messages[0])
+                            EMAIL_REJECTED.inc()
+                        messages.popleft()
+                return rejected
+            except smtplib.SMTPResponseException:
+                # временный отказ - не обрыв соединения, решает вызывающий
+                raise
+            except (smtplib.SMTPServerDisconnected, OSError):
+                if attempt:
+                    raise
+                logger.warning("SMTP connection lost, reconnecting", exc_info=True)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
+
+_pool: SMTPConnectionPool | None = None
+_pool_pid: int | None = None
+
+
+def get_smtp_pool() -> SMTPConnectionPool:
+    # пул создается заново в каждом процессе prefork-воркера
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = SMTPConnectionPool(
+            host=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            user=settings.SMTP_USER,
+            password=settings.SMTP_PASS,
+            use_ssl=settings.SMTP_SSL,
+            size=settings.SMTP_POOL_SIZE,
+            max_idle=settings.SMTP_MAX_IDLE,
+            timeout=settings.SMTP_TIMEOUT,
+        )
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def close_smtp_pool():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close_all()
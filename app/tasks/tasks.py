@@ -1,11 +1,18 @@
 from app.tasks.celery_app import app_celery as app
 from app.tasks.email_templates import create_user_confirmation_message
+from app.tasks.smtp_pool import get_smtp_pool
 from app.users.models import User
 from app.config import settings
+from app.logger import logger
+from app.metrics import EMAIL_DEDUP
 
+import json
 import smtplib
 import secrets
 import string
+from collections import deque
+from celery.exceptions import SoftTimeLimitExceeded
+from redis import Redis, RedisError
 
 
 def create_verification_code(length=6):
@@ -13,13 +20,147 @@ def create_verification_code(length=6):
     return ''.join(secrets.choice(characters) for i in range(length))
 
 
-@app.task
+# первое письмо на адрес в окне уходит сразу, остальные схлопываются
+# в одно отложенное письмо с последним кодом (старые коды уже недействительны).
+# 1 - отправить сейчас, 0 - запланировать отложенную отправку через ARGV[3] мс,
+# -1 - отложенная отправка уже запланирована, код в ней обновлен
+ADMIT_SCRIPT = """
+if redis.call('SET', KEYS[1], '1', 'NX', 'PX', ARGV[1]) then
+    redis.call('DEL', KEYS[2])
+    return {1, 0}
+end
+redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[1] * 2)
+if redis.call('SET', KEYS[3], '1', 'NX', 'PX', ARGV[1] * 2) then
+    return {0, redis.call('PTTL', KEYS[1])}
+end
+return {-1, 0}
+"""
+
+# отложенная отправка забирает последний код и открывает новое окно
+TRAILING_SCRIPT = """
+local payload = redis.call('GET', KEYS[2])
+redis.call('DEL', KEYS[2], KEYS[3])
+if payload then
+    redis.call('SET', KEYS[1], '1', 'PX', ARGV[1])
+end
+return payload
+"""
+
+
+class EmailDeduplicator:
+    """
+    Collapses verification emails to the same address within `window`
+    seconds: a leading send goes out at once, all later ones in the window
+    become a single trailing send with the latest code. State is in Redis,
+    so it works across all workers; if Redis is down every email is sent.
+    """
+
+    def __init__(self, window: int):
+        self.window_ms = window * 1000
+        self.redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, decode_responses=True)
+        self._admit = self.redis.register_script(ADMIT_SCRIPT)
+        self._trailing = self.redis.register_script(TRAILING_SCRIPT)
+
+    @staticmethod
+    def _keys(email: str) -> list[str]:
+        return [f"email:dedup:{email}", f"email:pending:{email}", f"email:trailing:{email}"]
+
+    def admit(self, email: str, verification_code: str, locale: str | None = None) -> bool:
+        """
+        True if the email should be sent now
+        """
+        if not self.window_ms:
+            return True
+        try:
+            decision, delay = self._admit(
+                keys=self._keys(email),
+                args=[self.window_ms, json.dumps([email, verification_code, locale])]
+            )
+        except RedisError:
+            logger.warning("Email dedup unavailable", extra={"email": email}, exc_info=True)
+            return True
+        if decision == 1:
+            EMAIL_DEDUP.labels("sent").inc()
+            return True
+        if decision == 0:
+            send_trailing_verify_message.apply_async(args=[email], countdown=max(delay, 0) / 1000)
+        EMAIL_DEDUP.labels("suppressed").inc()
+        return False
+
+    def take_trailing(self, email: str) -> list | None:
+        try:
+            payload = self._trailing(keys=self._keys(email), args=[self.window_ms])
+        except RedisError:
+            # отложенный код хранится в Redis: без него отправлять нечего
+            logger.warning("Email dedup unavailable", extra={"email": email}, exc_info=True)
+            return None
+        return json.loads(payload) if payload else None
+
+    def release(self, email: str):
+        """
+        Closes the window of an admitted email that was not sent, so that
+        the retry is sent at once instead of being collapsed
+        """
+        if not self.window_ms:
+            return
+        try:
+            self.redis.delete(self._keys(email)[0])
+        except RedisError:
+            logger.warning("Email dedup unavailable", extra={"email": email}, exc_info=True)
+
+
+email_dedup = EmailDeduplicator(settings.EMAIL_DEDUP_WINDOW)
+
+
+# soft limit прерывает задачу исключением, hard (+10 c) убивает процесс
+EMAIL_TASK_OPTIONS = {
+    "priority": 0,
+    "rate_limit": settings.CELERY_EMAIL_RATE_LIMIT,
+    "soft_time_limit": settings.CELERY_EMAIL_TIME_LIMIT,
+    "time_limit": settings.CELERY_EMAIL_TIME_LIMIT + 10,
+}
+
+
+@app.task(**EMAIL_TASK_OPTIONS)
 def send_verify_message(
-    email: str, verification_code
+    email: str, verification_code, locale: str | None = None
 ):
-    
-    msg_content = create_user_confirmation_message(email, verification_code)
-    with smtplib.SMTP_SSL(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-        server.login(settings.SMTP_USER, settings.SMTP_PASS)
-        server.send_message(msg_content)
-        
\ No newline at end of file
+    if not email_dedup.admit(email, verification_code, locale):
+        return
+    msg_content = create_user_confirmation_message(email, verification_code, locale)
+    get_smtp_pool().send_messages(deque([msg_content]))
+
+
+@app.task(**EMAIL_TASK_OPTIONS)
+def send_trailing_verify_message(email: str):
+    item = email_dedup.take_trailing(email)
+    if item:
+        EMAIL_DEDUP.labels("trailing").inc()
+        send_verify_messages.delay([item], dedup=False)
+
+
+@app.task(
+    bind=True,
+    max_retries=5,
+    default_retry_delay=10,
+    priority=1,
+    rate_limit=settings.CELERY_EMAIL_BATCH_RATE_LIMIT,
+    soft_time_limit=settings.CELERY_EMAIL_BATCH_TIME_LIMIT,
+    time_limit=settings.CELERY_EMAIL_BATCH_TIME_LIMIT + 10,
+)
+def send_verify_messages(self, items: list[tuple], dedup: bool = True):
+    """
+    Sends a batch of (email, verification_code[, locale]) over one pooled SMTP
+    connection. On failure only the messages that were not sent are retried.
+    """
+    if dedup:
+        items = [item for item in items if email_dedup.admit(*item)]
+    for start in range(0, len(items), settings.SMTP_BATCH_SIZE):
+        chunk = items[start:start + settings.SMTP_BATCH_SIZE]
+        messages = deque(create_user_confirmation_message(*item) for item in chunk)
+        try:
+            get_smtp_pool().send_messages(messages)
+        except (smtplib.SMTPException, OSError, SoftTimeLimitExceeded) as e:
+            remaining = chunk[len(chunk) - len(messages):] + items[start + len(chunk):]
+            # повтор уже прошел дедупликацию
+            raise self.retry(args=[remaining], kwargs={"dedup": False}, exc=e)
@@ -3,10 +3,14 @@ from sqlalchemy import insert
 from app.database import Base, async_session_maker, async_engine
 from app.config import settings
 from app.users.models import User
+from app.outbox.models import EmailOutbox
+from app.main import app as fastapi_app
 
 import json
 import pytest
+from redis import Redis
 import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
 
 
 @pytest_asyncio.fixture(autouse=True, scope="session")
@@ -16,12 +20,19 @@ async def prepare_database():
     async with async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+    # кэш и коды прошлых прогонов ссылаются на старые id; отдельный клиент,
+    # чтобы пул app.cache не привязался к циклу этой фикстуры
+    with Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT) as client:
+        client.flushdb()
     
     def open_mock_json(model: str):
         with open(f"app/tests/mock_{model}.json", "r") as f:
             return json.load(f)
     
     users = open_mock_json("users")
+    for user in users:
+        # в json хеш строкой, колонка - bytea
+        user["password_hashed"] = user["password_hashed"].encode()
     # portfolios = open_mock_json("portfolios")
     
     async with async_session_maker() as session:
@@ -38,4 +49,10 @@ def event_loop(request):
     """
     loop = asyncio.get_event_loop_policy().new_event_loop()
     yield loop
-    loop.close()
\ No newline at end of file
+    loop.close()
+
+
+@pytest_asyncio.fixture(scope="function")
+async def ac():
+    async with AsyncClient(transport=ASGITransport(app=fastapi_app), base_url="http://test") as ac:
+        yield ac
@@ -0,0 +1,85 @@
+from app.loader import BatchLoader
+
+import asyncio
+import contextvars
+
+import pytest
+
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+class Source:
+    def __init__(self, fail: bool = False):
+        self.calls: list[list[int]] = []
+        self.contexts: list = []
+        self.fail = fail
+
+    async def load_many(self, keys: list[int]) -> dict[int, str]:
+        self.calls.append(keys)
+        self.contexts.append(request_id.get())
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("database is down")
+        return {key: f"user{key}" for key in keys if key > 0}
+
+
+def make_loader(source: Source, max_batch: int = 100) -> BatchLoader[int, str]:
+    return BatchLoader("test", source.load_many, delay=0.005, max_batch=max_batch)
+
+
+async def test_coalesces_concurrent_loads():
+    source = Source()
+    loader = make_loader(source)
+
+    values = await asyncio.gather(*(loader.load(key) for key in [1, 2, 2, 3, -1]))
+
+    assert values == ["user1", "user2", "user2", "user3", None]
+    # один запрос, повторный ключ в нем один раз
+    assert source.calls == [[1, 2, 3, -1]]
+
+
+async def test_max_batch_dispatches_early():
+    source = Source()
+    loader = make_loader(source, max_batch=2)
+
+    assert await loader.load_all([1, 2, 3, -1, 1]) == {1: "user1", 2: "user2", 3: "user3"}
+    assert source.calls == [[1, 2], [3, -1]]
+
+
+async def test_error_reaches_every_waiter_and_is_not_cached():
+    source = Source(fail=True)
+    loader = make_loader(source)
+
+    results = await asyncio.gather(loader.load(1), loader.load(1), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    source.fail = False
+    assert await loader.load(1) == "user1"
+    assert source.calls == [[1], [1]]
+
+
+async def test_cancelled_waiter_does_not_cancel_others():
+    source = Source()
+    loader = make_loader(source)
+
+    first = asyncio.create_task(loader.load(1))
+    second = asyncio.create_task(loader.load(1))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "user1"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+async def test_batch_does_not_inherit_caller_context():
+    source = Source()
+    loader = make_loader(source)
+
+    async def request(value: str):
+        request_id.set(value)
+        return await loader.load(1)
+
+    await asyncio.gather(request("first"), request("second"))
+    assert source.contexts == [None]
@@ -0,0 +1,49 @@
+from app.logger import AsyncQueueHandler, make_formatter
+
+import json
+import logging
+from queue import SimpleQueue
+
+import pytest
+
+
+def make_record(**extra) -> logging.LogRecord:
+    return logging.makeLogRecord({"msg": "test", "levelname": "INFO", **extra})
+
+
+@pytest.mark.parametrize("serializer", ["json", "orjson"])
+def test_non_native_types(serializer):
+    formatter = make_formatter(serializer)
+    record = make_record(code=b"\x00bytes", big=2**70, ids={1: "a"})
+
+    data = json.loads(formatter.format(record))
+
+    assert data["big"] == 2**70
+    assert data["message"] == "test"
+    assert isinstance(data["code"], str)
+
+
+def test_orjson_non_str_keys():
+    data = json.loads(make_formatter("orjson").format(make_record(ids={1: "a"})))
+    assert data["ids"] == {"1": "a"}
+
+
+def test_queue_handler_snapshots_extra():
+    class Model:
+        def __init__(self):
+            self.state = "before"
+
+        def __str__(self):
+            return self.state
+
+    handler = AsyncQueueHandler(SimpleQueue())
+    payload, model = {"items": ["before"]}, Model()
+    record = handler.prepare(make_record(payload=payload, model=model))
+
+    # запрос меняет объекты после вызова логгера, до записи в потоке
+    payload["items"].append("after")
+    model.state = "after"
+    data = json.loads(make_formatter("orjson").format(record))
+
+    assert data["payload"] == {"items": ["before"]}
+    assert data["model"] == "before"
@@ -0,0 +1,80 @@
+from app import sampling
+from app.sampling import TraceSampler
+
+import pytest
+
+
+@pytest.fixture
+def sampler() -> TraceSampler:
+    return TraceSampler(
+        traces_rate=0.05,
+        candidate_rate=0.2,
+        route_rates={"/metrics": 0.0, "/auth": 0.5, "/auth/me": 0.01},
+        status_rates={"4xx": 0.5},
+        slow_seconds=1.0,
+        max_per_second=10,
+    )
+
+
+def event(path: str, status_code: int | None = 200, seconds: float = 0.1) -> dict:
+    return {
+        "request": {"url": f"http://test{path}"},
+        "tags": {"http.status_code": str(status_code)} if status_code else {},
+        "start_timestamp": "2026-01-01T00:00:00+00:00",
+        "timestamp": f"2026-01-01T00:00:{seconds:09.6f}+00:00",
+    }
+
+
+@pytest.mark.parametrize("path,rate", [
+    ("/api/v1/auth/me", 0.01),  # своя доля ниже candidate_rate не поднимается
+    ("/api/v1/auth/login", 0.5),
+    ("/metrics", 0.0),
+    ("/api/v1/users/all", 0.2),
+])
+def test_head_rate(sampler: TraceSampler, path: str, rate: float):
+    assert sampler.head_rate(path) == rate
+    assert sampler.traces_sampler({"asgi_scope": {"path": path}}) == rate
+
+
+def test_head_rate_traces_off(sampler: TraceSampler):
+    sampler.configure(traces_rate=0.0)
+    assert sampler.head_rate("/api/v1/users/all") == 0.0
+
+
+def test_parent_decision_wins(sampler: TraceSampler):
+    assert sampler.traces_sampler({"parent_sampled": True, "asgi_scope": {"path": "/metrics"}}) == 1.0
+    assert sampler.traces_sampler({"parent_sampled": False, "asgi_scope": {"path": "/"}}) == 0.0
+
+
+def test_errors_and_slow_always_kept(sampler: TraceSampler, monkeypatch):
+    monkeypatch.setattr(sampling.random, "random", lambda: 0.999)
+    assert sampler.before_send_transaction(event("/api/v1/auth/me", 503), {})
+    assert sampler.before_send_transaction(event("/api/v1/auth/me", seconds=1.5), {})
+    assert sampler.before_send_transaction({"contexts": {"trace": {"status": "internal_error"}}}, {})
+
+
+@pytest.mark.parametrize("path,status_code,threshold", [
+    ("/api/v1/auth/me", 200, 1.0),  # head уже равен доле пути
+    ("/api/v1/auth/me", 404, 0.5),
+    ("/api/v1/users/all", 200, 0.25),  # 0.05 из отобранных с 0.2
+])
+def test_tail_keeps_target_share(sampler: TraceSampler, monkeypatch, path: str, status_code: int, threshold: float):
+    monkeypatch.setattr(sampling.random, "random", lambda: threshold - 0.01)
+    assert sampler.before_send_transaction(event(path, status_code), {})
+    monkeypatch.setattr(sampling.random, "random", lambda: threshold)
+    assert sampler.before_send_transaction(event(path, status_code), {}) is None
+
+
+def test_cap_per_second(sampler: TraceSampler, monkeypatch):
+    monkeypatch.setattr(sampling.random, "random", lambda: 0.0)
+    monkeypatch.setattr(sampling, "monotonic", lambda: 100.0)
+    sampler.configure(max_per_second=2)
+    kept = [sampler.before_send_transaction(event("/api/v1/auth/login"), {}) for _ in range(3)]
+    assert [bool(item) for item in kept] == [True, True, False]
+    # ошибки не ограничиваются
+    assert sampler.before_send_transaction(event("/api/v1/auth/login", 500), {})
+
+
+def test_configure_rejects_unknown(sampler: TraceSampler):
+    with pytest.raises(ValueError):
+        sampler.configure(sample_everything=True)
@@ -0,0 +1,36 @@
+from app.database import get_session, run_after_commit
+from app.exceptions import RequestTransactionFailedException
+from app.users.dao import UserDAO
+
+import pytest
+
+
+async def test_failed_dao_call_rolls_back_request():
+    committed = []
+
+    async def after_commit():
+        committed.append(True)
+
+    dependency = get_session()
+    await anext(dependency)
+    await UserDAO.add(email="session-first@test.io", password_hashed=b"")
+    await run_after_commit(after_commit)
+    # дубликат email: BaseDAO логирует ошибку и возвращает None
+    await UserDAO.add(email="session-first@test.io", password_hashed=b"")
+
+    with pytest.raises(RequestTransactionFailedException):
+        await anext(dependency)
+
+    # первая запись запроса не закоммичена, колбэки после коммита не вызваны
+    assert await UserDAO.find_one_or_none(email="session-first@test.io") is None
+    assert committed == []
+
+
+async def test_request_commits_without_failures():
+    dependency = get_session()
+    await anext(dependency)
+    await UserDAO.add(email="session-ok@test.io", password_hashed=b"")
+    with pytest.raises(StopAsyncIteration):
+        await anext(dependency)
+
+    assert await UserDAO.find_one_or_none(email="session-ok@test.io") is not None
@@ -0,0 +1,70 @@
+"""
+Local aiosmtpd server for the SMTP pool and outbox relay tests.
+Recipients starting with "refused" are refused at RCPT, "bounce" get
+554 and "busy" get 451 at DATA.
+"""
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.received: list[tuple[str, tuple]] = []
+        self.data_attempts: list[str] = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("refused"):
+            return "550 no such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.data_attempts.append(envelope.rcpt_tos[0])
+        if envelope.rcpt_tos[0].startswith("bounce"):
+            return "554 message rejected"
+        if envelope.rcpt_tos[0].startswith("busy"):
+            return "451 try again later"
+        self.received.append((envelope.rcpt_tos[0], session.peer))
+        return "250 OK"
+
+    @property
+    def recipients(self) -> list[str]:
+        return [rcpt for rcpt, _ in self.received]
+
+    @property
+    def connections(self) -> int:
+        return len({peer for _, peer in self.received})
+
+
+class SMTPServer:
+    """
+    aiosmtpd on a fixed port; a stopped Controller cannot be started
+    again, so every start makes a new one with the same handler
+    """
+
+    def __init__(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.hostname = "127.0.0.1"
+        self.handler = RecordingHandler()
+        self.controller: Controller | None = None
+
+    def start(self):
+        self.controller = Controller(self.handler, hostname=self.hostname, port=self.port)
+        self.controller.start()
+
+    def stop(self):
+        if self.controller is not None:
+            self.controller.stop()
+            self.controller = None
+
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPServer()
+    server.start()
+    yield server
+    server.stop()
@@ -0,0 +1,97 @@
+from app.tasks import outbox_relay, tasks
+from app.tasks.tasks import EmailDeduplicator
+
+import pytest
+from redis import RedisError
+
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        tasks.send_trailing_verify_message, "apply_async",
+        lambda args, countdown: calls.append((args, countdown))
+    )
+    return calls
+
+
+@pytest.fixture
+def dedup():
+    dedup = EmailDeduplicator(window=60)
+    yield dedup
+    for key in dedup.redis.scan_iter("email:*"):
+        dedup.redis.delete(key)
+
+
+def test_collapses_into_one_trailing_send(dedup: EmailDeduplicator, scheduled: list):
+    email = "dedup@test.io"
+    assert dedup.admit(email, "CODE01")
+    assert not dedup.admit(email, "CODE02")
+    assert not dedup.admit(email, "CODE03", "ru")
+
+    # одна отложенная отправка на окно, в ней последний код
+    [(args, countdown)] = scheduled
+    assert args == [email] and 0 < countdown <= 60
+    assert dedup.take_trailing(email) == [email, "CODE03", "ru"]
+    assert dedup.take_trailing(email) is None
+
+    # отложенная отправка открыла новое окно
+    assert not dedup.admit(email, "CODE04")
+    assert len(scheduled) == 2
+
+
+def test_window_zero_sends_everything(scheduled: list):
+    dedup = EmailDeduplicator(window=0)
+    assert dedup.admit("dedup-off@test.io", "CODE01")
+    assert dedup.admit("dedup-off@test.io", "CODE02")
+    assert scheduled == []
+
+
+def test_release_reopens_window(dedup: EmailDeduplicator, scheduled: list):
+    assert dedup.admit("dedup-release@test.io", "CODE01")
+    dedup.release("dedup-release@test.io")
+    assert dedup.admit("dedup-release@test.io", "CODE02")
+
+
+def test_fails_open_without_redis(dedup: EmailDeduplicator, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise RedisError("down")
+
+    monkeypatch.setattr(dedup, "_admit", unavailable)
+    monkeypatch.setattr(dedup, "_trailing", unavailable)
+    assert dedup.admit("dedup-down@test.io", "CODE01")
+    assert dedup.take_trailing("dedup-down@test.io") is None
+
+
+class FakePool:
+    def __init__(self, fail_after: int | None = None):
+        self.sent = []
+        self.fail_after = fail_after
+
+    def send_messages(self, messages):
+        while messages:
+            if len(self.sent) == self.fail_after:
+                raise OSError("connection lost")
+            self.sent.append(messages.popleft()["To"])
+
+
+def test_deliver_deduplicates(dedup: EmailDeduplicator, scheduled: list, monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(outbox_relay, "get_smtp_pool", lambda: pool)
+    monkeypatch.setattr(outbox_relay, "email_dedup", dedup)
+    items = [["a@test.io", "CODE01", None], ["a@test.io", "CODE02", None], ["b@test.io", "CODE03", None]]
+
+    assert outbox_relay.deliver(items) == 3
+    assert pool.sent == ["a@test.io", "b@test.io"]
+    assert len(scheduled) == 1
+
+
+def test_deliver_failure_keeps_unsent(dedup: EmailDeduplicator, scheduled: list, monkeypatch):
+    pool = FakePool(fail_after=1)
+    monkeypatch.setattr(outbox_relay, "get_smtp_pool", lambda: pool)
+    monkeypatch.setattr(outbox_relay, "email_dedup", dedup)
+    items = [["c@test.io", "CODE01", None], ["d@test.io", "CODE02", None]]
+
+    assert outbox_relay.deliver(items) == 1
+    # строка d осталась в outbox, и повтор не схлопывается
+    assert dedup.admit("d@test.io", "CODE02")
@@ -0,0 +1,104 @@
+from app.config import settings
+from app.database import async_session_maker, get_session
+from app.outbox.dao import OutboxDAO
+from app.outbox.models import EmailOutbox
+from app.tasks import outbox_relay
+from app.tasks.smtp_pool import SMTPConnectionPool
+from app.tasks.tasks import EmailDeduplicator
+
+import pytest
+from sqlalchemy import delete, select
+
+
+@pytest.fixture(autouse=True)
+async def empty_outbox():
+    async with async_session_maker() as session:
+        await session.execute(delete(EmailOutbox))
+        await session.commit()
+
+
+@pytest.fixture
+def published(monkeypatch):
+    calls = []
+    monkeypatch.setattr(outbox_relay.send_verify_messages, "apply_async", lambda args: calls.append(args))
+    return calls
+
+
+async def outbox_emails() -> list[str]:
+    async with async_session_maker() as session:
+        rows = await session.execute(select(EmailOutbox).order_by(EmailOutbox.id))
+        return [row.payload["email"] for row in rows.scalars()]
+
+
+async def add_emails(*emails: str):
+    for email in emails:
+        await OutboxDAO.add_verification(email, "CODE01", "ru")
+
+
+async def test_celery_mode_hands_over_batch(published: list, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_BATCH_SIZE", 2)
+    await add_emails("relay1@test.io", "relay2@test.io", "relay3@test.io")
+
+    assert await outbox_relay.relay_batch("celery") == 2
+    # одна задача на пакет, в порядке записи
+    assert published == [[[["relay1@test.io", "CODE01", "ru"], ["relay2@test.io", "CODE01", "ru"]]]]
+    assert await outbox_emails() == ["relay3@test.io"]
+
+    assert await outbox_relay.relay_batch("celery") == 1
+    assert await outbox_relay.relay_batch("celery") == 0
+
+
+async def test_smtp_mode_keeps_unsent(monkeypatch):
+    monkeypatch.setattr(outbox_relay, "deliver", lambda items: 1)
+    await add_emails("relay-smtp1@test.io", "relay-smtp2@test.io")
+
+    assert await outbox_relay.relay_batch("smtp") == 1
+    assert await outbox_emails() == ["relay-smtp2@test.io"]
+
+
+async def test_rejected_row_does_not_block_outbox(smtp_server, monkeypatch):
+    pool = SMTPConnectionPool(smtp_server.hostname, smtp_server.port, use_ssl=False)
+    monkeypatch.setattr(outbox_relay, "get_smtp_pool", lambda: pool)
+    monkeypatch.setattr(outbox_relay, "email_dedup", EmailDeduplicator(window=0))
+    await add_emails("relay-a@test.io", "bounce-relay@test.io", "relay-b@test.io")
+
+    assert await outbox_relay.relay_batch("smtp") == 3
+
+    # отказ 5xx окончателен: строка удалена, остальные письма ушли по одному разу
+    assert await outbox_emails() == []
+    assert smtp_server.handler.data_attempts == ["relay-a@test.io", "bounce-relay@test.io", "relay-b@test.io"]
+    assert smtp_server.handler.recipients == ["relay-a@test.io", "relay-b@test.io"]
+    pool.close_all()
+
+
+async def test_temporary_reply_keeps_rest(smtp_server, monkeypatch):
+    pool = SMTPConnectionPool(smtp_server.hostname, smtp_server.port, use_ssl=False)
+    monkeypatch.setattr(outbox_relay, "get_smtp_pool", lambda: pool)
+    monkeypatch.setattr(outbox_relay, "email_dedup", EmailDeduplicator(window=0))
+    await add_emails("relay-c@test.io", "busy-relay@test.io", "relay-d@test.io")
+
+    assert await outbox_relay.relay_batch("smtp") == 1
+    assert await outbox_emails() == ["busy-relay@test.io", "relay-d@test.io"]
+    pool.close_all()
+
+
+async def test_failed_hand_over_keeps_rows(monkeypatch):
+    def broker_down(args):
+        raise ConnectionError("broker is down")
+
+    monkeypatch.setattr(outbox_relay.send_verify_messages, "apply_async", broker_down)
+    await add_emails("relay-down@test.io")
+
+    with pytest.raises(ConnectionError):
+        await outbox_relay.relay_batch("celery")
+    assert await outbox_emails() == ["relay-down@test.io"]
+
+
+async def test_rolled_back_request_queues_nothing():
+    dependency = get_session()
+    await anext(dependency)
+    await add_emails("relay-rollback@test.io")
+    with pytest.raises(RuntimeError):
+        await dependency.athrow(RuntimeError("handler failed"))
+
+    assert await outbox_emails() == []
@@ -0,0 +1,24 @@
+from app.tasks.scheduled import cleanup_unverified_users
+from app.users.cache import user_cache
+from app.users.dao import UserDAO
+
+from datetime import date, datetime, UTC
+
+
+async def test_cleanup_deletes_and_invalidates():
+    old = date(2000, 1, 1)
+    await UserDAO.add(email="cleanup-old@test.io", password_hashed=b"", created=old)
+    await UserDAO.add(email="cleanup-verified@test.io", password_hashed=b"", created=old,
+                      is_verified=True, verified_at=datetime.now(UTC))
+    await UserDAO.add(email="cleanup-new@test.io", password_hashed=b"")
+    old_id = (await UserDAO.find_one_or_none(email="cleanup-old@test.io"))["id"]
+    await user_cache.set(await UserDAO.find_by_id(old_id))
+    assert await user_cache.get(old_id) is not None
+
+    stats = await cleanup_unverified_users(older_than_days=365, batch_size=1, pause=0, max_seconds=10)
+
+    assert stats["deleted"] == 1
+    assert await UserDAO.find_by_id(old_id) is None
+    assert await user_cache.get(old_id) is None
+    assert await UserDAO.find_one_or_none(email="cleanup-verified@test.io") is not None
+    assert await UserDAO.find_one_or_none(email="cleanup-new@test.io") is not None
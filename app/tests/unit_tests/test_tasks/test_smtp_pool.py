@@ -0,0 +1,112 @@
+from app.tasks.email_templates import create_user_confirmation_message
+from app.tasks.smtp_pool import SMTPConnectionPool
+
+import smtplib
+import socket
+from collections import deque
+
+import pytest
+
+
+def messages(*emails: str) -> deque:
+    return deque(create_user_confirmation_message(email, "AbC123") for email in emails)
+
+
+def make_pool(server, **kwargs) -> SMTPConnectionPool:
+    return SMTPConnectionPool(server.hostname, server.port, use_ssl=False, **kwargs)
+
+
+def test_batch_reuses_one_connection(smtp_server):
+    pool = make_pool(smtp_server)
+    batch = messages("smtp1@test.io", "smtp2@test.io", "smtp3@test.io")
+
+    pool.send_messages(batch)
+    pool.send_messages(messages("smtp4@test.io"))
+
+    assert not batch
+    assert smtp_server.handler.recipients == ["smtp1@test.io", "smtp2@test.io", "smtp3@test.io", "smtp4@test.io"]
+    assert smtp_server.handler.connections == 1
+    pool.close_all()
+
+
+def test_refused_recipient_is_skipped(smtp_server):
+    pool = make_pool(smtp_server)
+    batch = messages("smtp-ok1@test.io", "refused@test.io", "smtp-ok2@test.io")
+
+    pool.send_messages(batch)
+
+    assert not batch
+    assert smtp_server.handler.recipients == ["smtp-ok1@test.io", "smtp-ok2@test.io"]
+    pool.close_all()
+
+
+def test_rejected_message_is_not_retried(smtp_server):
+    pool = make_pool(smtp_server)
+    batch = messages("smtp-a@test.io", "bounce@test.io", "smtp-b@test.io")
+
+    rejected = pool.send_messages(batch)
+
+    assert not batch
+    assert [message["To"] for message in rejected] == ["bounce@test.io"]
+    # каждое письмо ровно один раз, по одному соединению
+    assert smtp_server.handler.data_attempts == ["smtp-a@test.io", "bounce@test.io", "smtp-b@test.io"]
+    assert smtp_server.handler.recipients == ["smtp-a@test.io", "smtp-b@test.io"]
+    assert smtp_server.handler.connections == 1
+    pool.close_all()
+
+
+def test_temporary_reply_keeps_rest_queued(smtp_server):
+    pool = make_pool(smtp_server)
+    batch = messages("smtp-c@test.io", "busy@test.io", "smtp-d@test.io")
+
+    with pytest.raises(smtplib.SMTPDataError):
+        pool.send_messages(batch)
+
+    assert [message["To"] for message in batch] == ["busy@test.io", "smtp-d@test.io"]
+    assert smtp_server.handler.data_attempts == ["smtp-c@test.io", "busy@test.io"]
+    # соединение не закрыто, а возвращено в пул
+    batch.popleft()
+    pool.send_messages(batch)
+    assert smtp_server.handler.recipients == ["smtp-c@test.io", "smtp-d@test.io"]
+    assert smtp_server.handler.connections == 1
+    pool.close_all()
+
+
+def test_reconnects_after_dropped_connection(smtp_server):
+    pool = make_pool(smtp_server)
+    pool.send_messages(messages("smtp-drop1@test.io"))
+    # соединение в пуле оборвано, отправка переподключается один раз
+    pool._idle[0][0].sock.shutdown(socket.SHUT_RDWR)
+
+    pool.send_messages(messages("smtp-drop2@test.io", "smtp-drop3@test.io"))
+
+    assert smtp_server.handler.recipients == ["smtp-drop1@test.io", "smtp-drop2@test.io", "smtp-drop3@test.io"]
+    assert smtp_server.handler.connections == 2
+    pool.close_all()
+
+
+def test_idle_connection_checked_with_noop(smtp_server):
+    pool = make_pool(smtp_server, max_idle=0)
+    pool.send_messages(messages("smtp-idle1@test.io"))
+    pool.send_messages(messages("smtp-idle2@test.io"))
+    assert smtp_server.handler.connections == 1
+
+    # сервер перезапущен: NOOP не проходит, соединение заменяется до отправки
+    smtp_server.stop()
+    smtp_server.start()
+    pool.send_messages(messages("smtp-idle3@test.io"))
+
+    assert smtp_server.handler.recipients[-1] == "smtp-idle3@test.io"
+    assert smtp_server.handler.connections == 2
+    pool.close_all()
+
+
+def test_fails_when_server_is_down(smtp_server):
+    pool = make_pool(smtp_server, timeout=1)
+    smtp_server.stop()
+    batch = messages("smtp-down@test.io")
+
+    with pytest.raises(OSError):
+        pool.send_messages(batch)
+    # неотправленное остается в очереди для повтора
+    assert len(batch) == 1
@@ -0,0 +1,22 @@
+from app.users.dao import UserDAO
+from app.users.hashing import password_hasher
+
+from httpx import AsyncClient
+
+
+PASSWORD = "Passw0rd!"
+
+
+async def test_demoted_admin_token_rejected(ac: AsyncClient):
+    email = "demoted-admin@test.io"
+    await UserDAO.add(email=email, password_hashed=await password_hasher.hash(PASSWORD), is_verified=True, is_admin=True)
+    response = await ac.post("/v1/auth/login", json={"email": email, "password": PASSWORD})
+    assert response.status_code == 200
+
+    response = await ac.get("/v1/auth/all", params={"limit": 1})
+    assert response.status_code == 200
+
+    # в токене is_admin остался, но token_version уже поднят
+    await UserDAO.update({"email": email}, is_admin=False)
+    response = await ac.get("/v1/auth/all", params={"limit": 1})
+    assert response.status_code == 401
@@ -0,0 +1,65 @@
+from app.config import settings
+from app.users.dao import UserDAO
+
+import pytest
+from httpx import AsyncClient
+
+
+INTERNAL_KEY = "test-internal-key"
+
+
+@pytest.fixture
+def internal_key(monkeypatch):
+    monkeypatch.setattr(settings, "INTERNAL_API_KEY", INTERNAL_KEY)
+    return {"X-Internal-Key": INTERNAL_KEY}
+
+
+async def add_users(*emails: str) -> list[int]:
+    for email in emails:
+        await UserDAO.add(email=email, password_hashed=b"")
+    return [(await UserDAO.find_one_or_none(email=email))["id"] for email in emails]
+
+
+async def test_bulk_update_chunks():
+    ids = await add_users("bulk1@test.io", "bulk2@test.io", "bulk3@test.io")
+    rows = [{"id": user_id, "portfolio_id": user_id * 10} for user_id in ids] + [{"id": 10**9, "portfolio_id": 1}]
+
+    updated = await UserDAO.bulk_update("id", rows, chunk_size=2)
+
+    assert sorted(row["key"] for row in updated) == ids
+    for user_id in ids:
+        assert (await UserDAO.find_by_id(user_id)).portfolio_id == user_id * 10
+
+
+async def test_bulk_update_role_bumps_token_version():
+    [user_id] = await add_users("bulk-role@test.io")
+
+    await UserDAO.bulk_update("email", [{"email": "bulk-role@test.io", "is_sub": True}])
+
+    user = await UserDAO.find_by_id(user_id)
+    assert user.is_sub and user.token_version == 1
+
+
+async def test_update_portfolio_ids_requires_internal_key(ac: AsyncClient, internal_key):
+    body = {"items": [{"email": "test@test.io", "portfolio_id": 1}]}
+    response = await ac.post("/v1/auth/update_portfolio_ids", json=body)
+    assert response.status_code == 403
+    response = await ac.post("/v1/auth/update_portfolio_ids", json=body, headers={"X-Internal-Key": "wrong"})
+    assert response.status_code == 403
+
+
+async def test_update_portfolio_ids(ac: AsyncClient, internal_key):
+    [user_id] = await add_users("bulk-api@test.io")
+    body = {"items": [
+        {"id": user_id, "portfolio_id": 7},
+        {"email": "test2@test.io", "portfolio_id": 8},
+        {"email": "missing@test.io", "portfolio_id": 9},
+    ]}
+
+    response = await ac.post("/v1/auth/update_portfolio_ids", json=body, headers=internal_key)
+
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["updated"], result["not_found"]) == (2, 1)
+    assert [item["status"] for item in result["results"]] == ["updated", "updated", "not_found"]
+    assert (await UserDAO.find_by_id(user_id)).portfolio_id == 7
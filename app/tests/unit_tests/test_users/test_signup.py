@@ -0,0 +1,24 @@
+from app.users.dao import UserDAO
+from app.users.hashing import password_hasher
+
+from httpx import AsyncClient
+
+
+async def test_signup(ac: AsyncClient):
+    response = await ac.post("/v1/auth/signup", json={"email": "New.User@Test.io", "password": "Passw0rd!"})
+    assert response.status_code == 201
+    user = await UserDAO.find_obj(email="new.user@test.io")
+    assert user is not None and not user.is_verified
+
+
+async def test_signup_existing_email_is_not_hashed(ac: AsyncClient, monkeypatch):
+    calls = []
+
+    async def counting_hash(password):
+        calls.append(password)
+        return b""
+
+    monkeypatch.setattr(password_hasher, "hash", counting_hash)
+    response = await ac.post("/v1/auth/signup", json={"email": "test@test.io", "password": "Passw0rd!"})
+    assert response.status_code == 409
+    assert calls == []
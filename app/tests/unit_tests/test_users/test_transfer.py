@@ -0,0 +1,110 @@
+from app.exceptions import ImportFormatException
+from app.users.dao import UserDAO
+from app.users.hashing import password_hasher
+from app.users.transfer import iter_dicts, iter_export, parse_record, export_users, import_users
+
+import io
+from datetime import date, datetime, UTC
+
+import bcrypt
+import orjson
+import pytest
+from httpx import AsyncClient
+
+
+TODAY, NOW = date(2026, 1, 2), datetime(2026, 1, 2, tzinfo=UTC)
+HASHED = bcrypt.hashpw(b"password", bcrypt.gensalt(4)).decode()
+
+
+async def as_chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def collect(chunks) -> list:
+    return [item async for parsed in chunks for item in parsed]
+
+
+def test_parse_record():
+    record, password = parse_record({"email": "Parse@Test.io", "password": "secret", "is_verified": "yes",
+                                     "portfolio_id": "7", "created": "2025-05-06"}, TODAY, NOW)
+    assert record == ["parse@test.io", None, True, NOW, 7, False, False, False, date(2025, 5, 6), 0]
+    assert password == b"secret"
+
+    record, password = parse_record({"email": "parse@test.io", "password_hashed": HASHED}, TODAY, NOW)
+    assert record[1] == HASHED.encode() and record[3] is None and record[8] == TODAY
+    assert password is None
+
+
+@pytest.mark.parametrize("data", [
+    {"email": "parse@test.io"},
+    {"email": "parse@test.io", "password": "x", "password_hashed": HASHED},
+    {"email": "parse@test.io", "password_hashed": "plain"},
+    {"email": "parse@test.io", "password": "x", "is_admin": "maybe"},
+])
+def test_parse_record_invalid(data: dict):
+    with pytest.raises(ValueError):
+        parse_record(data, TODAY, NOW)
+
+
+async def test_iter_dicts_csv_across_chunks():
+    body = b'\xef\xbb\xbfemail,password\r\na@test.io,one\n\nb@test.io,"t,wo"\nc@test.io\nd@test.io,four'
+    parsed = await collect(iter_dicts(as_chunks(body, 7), "csv"))
+
+    assert [line for line, _ in parsed] == [2, 4, 5, 6]
+    assert parsed[0][1] == {"email": "a@test.io", "password": "one"}
+    assert parsed[1][1] == {"email": "b@test.io", "password": "t,wo"}
+    assert isinstance(parsed[2][1], ValueError)
+    assert parsed[3][1] == {"email": "d@test.io", "password": "four"}
+
+
+async def test_iter_dicts_ndjson():
+    body = b'{"email": "a@test.io"}\n[1]\n{broken\n{"email": "b@test.io"}\n'
+    parsed = await collect(iter_dicts(as_chunks(body, 5), "ndjson"))
+
+    assert parsed[0] == (1, {"email": "a@test.io"})
+    assert isinstance(parsed[1][1], ValueError) and isinstance(parsed[2][1], ValueError)
+    assert parsed[3] == (4, {"email": "b@test.io"})
+
+
+async def test_iter_dicts_csv_without_email_header():
+    with pytest.raises(ImportFormatException):
+        await collect(iter_dicts(as_chunks(b"name,password\nx,y\n", 64), "csv"))
+
+
+async def test_import_and_export():
+    await UserDAO.add(email="import-existing@test.io", password_hashed=b"")
+    body = "\n".join([
+        "email,password,password_hashed,is_verified,portfolio_id",
+        "Import1@test.io,secret,,true,11",
+        f"import2@test.io,,{HASHED},false,",
+        "import-existing@test.io,secret,,,",
+        "not-an-email,secret,,,",
+        f"import3@test.io,,{HASHED},,",
+    ]).encode()
+
+    stats = await import_users(as_chunks(body, 32), "csv", chunk_size=2, workers=1)
+
+    assert (stats["read"], stats["imported"], stats["skipped"], stats["invalid"]) == (5, 3, 1, 1)
+    assert [error["line"] for error in stats["errors"]] == [5]
+    user = await UserDAO.find_one_or_none(email="import1@test.io")
+    assert user["is_verified"] and user["verified_at"] is not None and user["portfolio_id"] == 11
+    stored = await UserDAO.find_by_id(user["id"])
+    assert await password_hasher.verify("secret", stored.password_hashed)
+
+    # экспорт после курсора: только импортированные строки, без хешей паролей
+    cursor = (await UserDAO.find_one_or_none(email="import-existing@test.io"))["id"]
+    output = io.BytesIO()
+    assert await export_users(output, "ndjson", cursor) == 3
+    exported = [orjson.loads(line) for line in output.getvalue().splitlines()]
+    assert [row["email"] for row in exported] == ["import1@test.io", "import2@test.io", "import3@test.io"]
+    assert "password_hashed" not in exported[0]
+
+    csv_body = b"".join([chunk async for chunk in iter_export("csv", cursor)])
+    lines = csv_body.decode().splitlines()
+    assert lines[0].startswith("id,email") and len(lines) == 4
+
+
+async def test_import_endpoint_requires_admin(ac: AsyncClient):
+    response = await ac.post("/v1/auth/admin/import", content=b"email,password\nx@test.io,y\n")
+    assert response.status_code == 401
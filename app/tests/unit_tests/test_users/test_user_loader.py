@@ -0,0 +1,22 @@
+from app.database import async_engine, replicas
+from app.users.dao import UserDAO
+from app.users.loader import load_users
+
+
+async def test_cache_fill_reads_primary(monkeypatch):
+    picked = []
+
+    def pick():
+        picked.append(True)
+        return async_engine
+
+    monkeypatch.setattr(replicas, "pick", pick)
+    await UserDAO.add(email="loader-primary@test.io", password_hashed=b"")
+    user = await UserDAO.find_one_or_none(email="loader-primary@test.io")
+    assert picked == [True]
+
+    users = await load_users([user["id"]])
+
+    assert list(users) == [user["id"]]
+    # реплика не выбиралась
+    assert picked == [True]
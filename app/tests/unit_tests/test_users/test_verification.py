@@ -0,0 +1,96 @@
+from app.config import settings
+from app.database import async_session_maker
+from app.outbox.models import EmailOutbox
+from app.users.dao import UserDAO
+from app.users.hashing import password_hasher
+from app.users.verification import verification_codes
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import select
+
+
+PASSWORD = "Passw0rd!"
+
+
+async def login_verified_user(ac: AsyncClient, email: str):
+    await UserDAO.add(email=email, password_hashed=await password_hasher.hash(PASSWORD), is_verified=True)
+    response = await ac.post("/v1/auth/login", json={"email": email, "password": PASSWORD})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("path,body", [
+    ("/v1/auth/verify_password", {"password_new": "N3wPassword!"}),
+    ("/v1/auth/verify_new_email", {"email_new": "renamed-{email}"}),
+])
+async def test_wrong_code(ac: AsyncClient, path: str, body: dict):
+    email = f"wrong-code-{path.rsplit('/', 1)[-1]}@test.io"
+    await login_verified_user(ac, email)
+    await verification_codes.issue(email, "RIGHT1")
+
+    body = {name: value.format(email=email) for name, value in body.items()}
+    response = await ac.post(path, json={"verification_code": "WRONG1", **body})
+    assert response.status_code == 417
+
+    # неверная попытка не сжигает код, пока попытки не исчерпаны
+    response = await ac.post(path, json={"verification_code": "RIGHT1", **body})
+    assert response.status_code == 200
+
+
+async def test_too_many_attempts(ac: AsyncClient):
+    email = "too-many-attempts@test.io"
+    await login_verified_user(ac, email)
+    await verification_codes.issue(email, "RIGHT1")
+
+    for _ in range(settings.VERIFICATION_CODE_MAX_ATTEMPTS):
+        response = await ac.post("/v1/auth/verify_password", json={"verification_code": "WRONG1", "password_new": "x"})
+        assert response.status_code == 417
+
+    # после исчерпания попыток код удален, верный код тоже не принимается
+    response = await ac.post("/v1/auth/verify_password", json={"verification_code": "RIGHT1", "password_new": "x"})
+    assert response.status_code == 417
+
+
+async def test_verify_email_wrong_code(ac: AsyncClient):
+    email = "verify-email-wrong@test.io"
+    await UserDAO.add(email=email, password_hashed=b"")
+    await verification_codes.issue(email, "RIGHT1")
+
+    response = await ac.post("/v1/auth/verify_email", json={"email": email, "verification_code": "WRONG1"})
+    assert response.status_code == 417
+    assert response.json()["message"] == "Invalid verification code"
+
+    response = await ac.post("/v1/auth/verify_email", json={"email": email, "verification_code": "RIGHT1"})
+    assert response.status_code == 202
+
+
+async def test_new_email_gets_its_own_code(ac: AsyncClient):
+    email, email_new = "change-email@test.io", "changed-email@test.io"
+    await login_verified_user(ac, email)
+    await verification_codes.issue(email, "RIGHT1")
+
+    response = await ac.post("/v1/auth/verify_new_email", json={"verification_code": "RIGHT1", "email_new": email_new})
+    assert response.status_code == 200
+
+    user = await UserDAO.find_one_or_none(email=email_new)
+    assert not user["is_verified"]
+    async with async_session_maker() as session:
+        rows = await session.execute(select(EmailOutbox).where(EmailOutbox.payload["email"].astext == email_new))
+        [row] = rows.scalars().all()
+
+    response = await ac.post("/v1/auth/verify_email", json={"email": email_new, "verification_code": row.payload["verification_code"]})
+    assert response.status_code == 202
+    assert (await UserDAO.find_one_or_none(email=email_new))["is_verified"]
+
+
+async def test_new_email_taken(ac: AsyncClient):
+    email, taken = "change-taken@test.io", "already-taken@test.io"
+    await UserDAO.add(email=taken, password_hashed=await password_hasher.hash(PASSWORD))
+    await login_verified_user(ac, email)
+    await verification_codes.issue(email, "RIGHT1")
+
+    response = await ac.post("/v1/auth/verify_new_email", json={"verification_code": "RIGHT1", "email_new": taken})
+    assert response.status_code == 409
+    # код не потрачен: пользователь может выбрать другой адрес
+    assert await verification_codes.consume(email, "RIGHT1")
+    assert await UserDAO.find_one_or_none(email=email)
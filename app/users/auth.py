@@ -1,30 +1,32 @@
-import bcrypt
 from datetime import UTC, datetime, timedelta
+from uuid import uuid4
 from jose import jwt
 from pydantic import EmailStr
 
 from app.users.dao import UserDAO
+from app.users.hashing import password_hasher
 from app.config import settings
+from app.exceptions import ServiceOverloadedException
+from app.logger import logger
 
 
-def get_password_hash(password:str) -> bytes:
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password=password, salt=salt)
-    return hashed_password
+async def get_password_hash(password:str) -> bytes:
+    return await password_hasher.hash(password)
 
 
-def verify_password(plain_password, hashed_password) -> bool:
-    if isinstance(plain_password, str):
-        password_byte_enc = plain_password.encode('utf-8')
-    else:
-        password_byte_enc = plain_password
-    return bcrypt.checkpw(password=password_byte_enc, hashed_password=hashed_password)
+async def verify_password(plain_password, hashed_password) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
-def create_access_token(data: dict) -> str:
+# роли и статус в access токене, чтобы проверки прав не ходили в базу
+TOKEN_CLAIMS = ("is_admin", "is_moder", "is_sub", "is_verified")
+
+
+def create_access_token(data: dict, expires_delta: timedelta | None = None, token_type: str = "access") -> str:
     to_encode = data.copy()
-    expire = datetime.now(UTC) + timedelta(hours=24)
-    to_encode.update({"exp": expire})
+    now = datetime.now(UTC)
+    expire = now + (expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire, "iat": now, "jti": uuid4().hex, "typ": token_type})
     encoded_jwt = jwt.encode(
         # to_encode, "secret1", "HS256"
         to_encode, settings.SECRET_KEY, settings.ALGORITHM
@@ -32,7 +34,39 @@ def create_access_token(data: dict) -> str:
     return encoded_jwt
 
 
+def create_refresh_token(data: dict) -> str:
+    return create_access_token(
+        data, timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS), token_type="refresh"
+    )
+
+
+def create_user_tokens(user) -> tuple[str, str]:
+    """
+    Access token with role claims and a refresh token, both bound
+    to the user's current token_version
+    """
+    subject = {"sub": str(user.id), "ver": user.token_version}
+    claims = {**subject, **{claim: getattr(user, claim) for claim in TOKEN_CLAIMS}}
+    return create_access_token(claims), create_refresh_token(subject)
+
+
+async def rehash_password(user, password: str):
+    """
+    Re-hashes the password with the current hasher and cost,
+    the plain password is only available at login
+    """
+    try:
+        password_hashed = await get_password_hash(password)
+    except ServiceOverloadedException:
+        # не критично - пересчитаем при следующем входе
+        return
+    await UserDAO.update(filter_by={"id": user.id}, password_hashed=password_hashed)
+    logger.info("Password rehashed", extra={"user_id": user.id})
+
+
 async def authenticate_user(email: EmailStr, password: str):
     user = await UserDAO.find_one_or_none(email=email)
-    if user and verify_password(password, user.password_hashed) and user.is_verified:
+    if user and await verify_password(password, user.password_hashed) and user.is_verified:
+        if password_hasher.needs_rehash(user.password_hashed):
+            await rehash_password(user, password)
         return user
\ No newline at end of file
@@ -0,0 +1,172 @@
+from app.cache import on_reconnect, redis, subscribe
+from app.config import settings
+from app.logger import logger
+from app.metrics import USER_CACHE_REQUESTS
+from app.users.models import User
+
+import json
+from collections import OrderedDict
+from datetime import date
+from time import monotonic
+from redis.exceptions import RedisError
+
+
+INVALIDATE_CHANNEL = "users:invalidate"
+TOMBSTONE = "-"
+# секреты в кэш не попадают
+EXCLUDED_COLUMNS = {"password_hashed"}
+
+
+class UserCache:
+    """
+    Two-tier cache of authenticated users: an in-process LRU with a short TTL
+    in front of Redis. Invalidation leaves a short-lived tombstone in both
+    tiers so a lookup that read the row before the write committed cannot
+    put the stale row back, and is broadcast to the other workers.
+    The serialized /auth/me response is kept in Redis next to the row and
+    invalidated together with it.
+    """
+
+    def __init__(self, ttl: int, local_ttl: int, local_size: int, tombstone_ttl: int):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        self.tombstone_ttl = tombstone_ttl
+        # user_id -> (expires_at, data), data is None for a tombstone
+        self._local: OrderedDict[int, tuple[float, dict | None]] = OrderedDict()
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"users:{user_id}"
+
+    @staticmethod
+    def _response_key(user_id: int) -> str:
+        return f"users:{user_id}:me"
+
+    @staticmethod
+    def _dump(user: User) -> str:
+        data = {
+            column.name: getattr(user, column.name)
+            for column in User.__table__.columns
+            if column.name not in EXCLUDED_COLUMNS
+        }
+        return json.dumps(data, default=str)
+
+    @staticmethod
+    def _load(raw: str) -> dict:
+        data = json.loads(raw)
+        for column in User.__table__.columns:
+            value = data.get(column.name)
+            if value is not None and issubclass(column.type.python_type, date):
+                data[column.name] = column.type.python_type.fromisoformat(value)
+        return data
+
+    def _get_local(self, user_id: int) -> tuple[bool, dict | None]:
+        entry = self._local.get(user_id)
+        if entry is None:
+            return False, None
+        expires_at, data = entry
+        if expires_at < monotonic():
+            del self._local[user_id]
+            return False, None
+        self._local.move_to_end(user_id)
+        return True, data
+
+    def _set_local(self, user_id: int, data: dict | None, ttl: int):
+        if data is not None:
+            found, current = self._get_local(user_id)
+            if found and current is None:
+                return
+        self._local[user_id] = (monotonic() + ttl, data)
+        self._local.move_to_end(user_id)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    async def get(self, user_id: int) -> User | None:
+        found, data = self._get_local(user_id)
+        if found:
+            if data is None:
+                USER_CACHE_REQUESTS.labels("local", "tombstone").inc()
+                return None
+            USER_CACHE_REQUESTS.labels("local", "hit").inc()
+            return User(**data)
+        USER_CACHE_REQUESTS.labels("local", "miss").inc()
+
+        try:
+            raw = await redis.get(self._key(user_id))
+        except RedisError:
+            logger.warning("User cache: redis get failed", extra={"user_id": user_id}, exc_info=True)
+            return None
+        if raw is None or raw == TOMBSTONE:
+            USER_CACHE_REQUESTS.labels("redis", "miss").inc()
+            return None
+        USER_CACHE_REQUESTS.labels("redis", "hit").inc()
+        data = self._load(raw)
+        self._set_local(user_id, data, self.local_ttl)
+        return User(**data)
+
+    async def set(self, user: User):
+        raw = self._dump(user)
+        self._set_local(user.id, self._load(raw), self.local_ttl)
+        try:
+            # NX: не перезаписываем tombstone, оставленный инвалидацией
+            await redis.set(self._key(user.id), raw, ex=self.ttl, nx=True)
+        except RedisError:
+            logger.warning("User cache: redis set failed", extra={"user_id": user.id}, exc_info=True)
+
+    async def get_response(self, user_id: int) -> dict | None:
+        """
+        Serialized /auth/me body with its etag and the token_version it was built for
+        """
+        try:
+            raw = await redis.get(self._response_key(user_id))
+        except RedisError:
+            logger.warning("User cache: redis get failed", extra={"user_id": user_id}, exc_info=True)
+            return None
+        if raw is None or raw == TOMBSTONE:
+            USER_CACHE_REQUESTS.labels("response", "miss").inc()
+            return None
+        USER_CACHE_REQUESTS.labels("response", "hit").inc()
+        return json.loads(raw)
+
+    async def set_response(self, user_id: int, token_version: int, etag: str, body: str):
+        raw = json.dumps({"ver": token_version, "etag": etag, "body": body})
+        try:
+            # NX, как и в set: tombstone инвалидации не перезаписываем
+            await redis.set(self._response_key(user_id), raw, ex=self.ttl, nx=True)
+        except RedisError:
+            logger.warning("User cache: redis set failed", extra={"user_id": user_id}, exc_info=True)
+
+    def evict_local(self, user_id: int):
+        self._set_local(user_id, None, self.tombstone_ttl)
+
+    async def invalidate(self, *user_ids: int):
+        """
+        Invalidates any number of users in one pipeline round trip
+        """
+        if not user_ids:
+            return
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    self.evict_local(user_id)
+                    pipe.set(self._key(user_id), TOMBSTONE, ex=self.tombstone_ttl)
+                    pipe.set(self._response_key(user_id), TOMBSTONE, ex=self.tombstone_ttl)
+                    pipe.publish(INVALIDATE_CHANNEL, str(user_id))
+                await pipe.execute()
+        except RedisError:
+            logger.error("User cache: cannot invalidate", extra={"user_ids": list(user_ids)}, exc_info=True)
+
+    def clear_local(self):
+        self._local.clear()
+
+
+user_cache = UserCache(
+    ttl=settings.USER_CACHE_TTL,
+    local_ttl=settings.USER_CACHE_LOCAL_TTL,
+    local_size=settings.USER_CACHE_LOCAL_SIZE,
+    tombstone_ttl=settings.USER_CACHE_TOMBSTONE_TTL,
+)
+
+subscribe(INVALIDATE_CHANNEL, lambda user_id: user_cache.evict_local(int(user_id)))
+on_reconnect(user_cache.clear_local)
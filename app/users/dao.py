@@ -1,23 +1,151 @@
 from app.base_dao import BaseDAO
+from app.users.cache import user_cache
 from app.users.models import User
-from app.database import async_session_maker
+from app.database import run_after_commit, session_scope
 
-from sqlalchemy import update
+from functools import partial
+from datetime import date
+from sqlalchemy import delete, func, select, update
 from pydantic import EmailStr
 
+
+# изменение этих полей делает выданные токены недействительными
+ROLE_FIELDS = {"is_admin", "is_moder", "is_sub"}
+# порядок полей в записях для copy_import
+IMPORT_COLUMNS = (
+    "email", "password_hashed", "is_verified", "verified_at", "portfolio_id",
+    "is_sub", "is_admin", "is_moder", "created", "token_version",
+)
+IMPORT_TABLE = "users_import"
+
+
 class UserDAO(BaseDAO):
     model = User
+    excluded_columns = {"password_hashed", "verification_code"}
+    
+    @classmethod
+    async def _invalidate(cls, *user_ids: int):
+        if user_ids:
+            await run_after_commit(partial(user_cache.invalidate, *user_ids))
+    
+    @classmethod
+    async def update(cls, filter_by: dict, **update_data):
+        if ROLE_FIELDS & update_data.keys():
+            update_data["token_version"] = cls.model.token_version + 1
+        user = await super().update(filter_by, **update_data)
+        if user:
+            await cls._invalidate(user["id"])
+        return user
+    
+    @classmethod
+    async def bulk_update(cls, key: str, rows: list[dict], chunk_size: int = 1000, **extra_values):
+        if rows and ROLE_FIELDS & rows[0].keys():
+            extra_values["token_version"] = cls.model.token_version + 1
+        updated = await super().bulk_update(key, rows, chunk_size, **extra_values)
+        await cls._invalidate(*(row["id"] for row in updated))
+        return updated
+    
+    @classmethod
+    async def delete(cls, id: int):
+        await super().delete(id=id)
+        await cls._invalidate(id)
     
     @classmethod
     async def update_verification_status(cls, email: str):
-        async with async_session_maker() as session:
-            query = update(cls.model).where(cls.model.email == email).values(is_verified=True)
-            await session.execute(query)
-            await session.commit()
+        async with session_scope() as session:
+            query = (
+                update(cls.model)
+                .where(cls.model.email == email)
+                .values(is_verified=True, verified_at=func.coalesce(cls.model.verified_at, func.now()))
+                .returning(cls.model.id)
+            )
+            result = await session.execute(query)
+            user_ids = result.scalars().all()
+        await cls._invalidate(*user_ids)
     
     @classmethod
     async def downgrade_verification_status(cls, email: str):
-        async with async_session_maker() as session:
-            query = update(cls.model).where(cls.model.email == email).values(is_verified=False)
-            await session.execute(query)
-            await session.commit()
\ No newline at end of file
+        async with session_scope() as session:
+            query = (
+                update(cls.model)
+                .where(cls.model.email == email)
+                .values(is_verified=False)
+                .returning(cls.model.id)
+            )
+            result = await session.execute(query)
+            user_ids = result.scalars().all()
+        await cls._invalidate(*user_ids)
+    
+    @classmethod
+    async def delete_never_verified(cls, connection, cursor: int, created_before: date, limit: int) -> list[int]:
+        """
+        Deletes the next `limit` users after `cursor` (by id) that never
+        verified their email and signed up before created_before.
+        Rows locked by other transactions are skipped.
+        """
+        batch = (
+            select(cls.model.id)
+            .where(
+                cls.model.id > cursor,
+                ~cls.model.is_verified,
+                cls.model.verified_at.is_(None),
+                cls.model.created < created_before,
+            )
+            .order_by(cls.model.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .cte("batch")
+        )
+        query = delete(cls.model).where(cls.model.id == batch.c.id).returning(cls.model.id)
+        result = await connection.execute(query)
+        return sorted(result.scalars().all())
+    
+    @classmethod
+    async def prepare_import(cls, connection):
+        """
+        Session-local staging table for copy_import, same column types as users
+        """
+        columns = ", ".join(IMPORT_COLUMNS)
+        await connection.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {IMPORT_TABLE} AS "
+            f"SELECT {columns} FROM {cls.model.__tablename__} WITH NO DATA"
+        )
+    
+    @classmethod
+    async def copy_import(cls, connection, records: list[tuple]) -> int:
+        """
+        COPY of records (tuples in IMPORT_COLUMNS order) into the staging table,
+        then one INSERT ... SELECT into users in the same transaction.
+        Emails that already exist are skipped, not updated.
+        Returns the number of inserted users.
+        """
+        columns = ", ".join(IMPORT_COLUMNS)
+        async with connection.transaction():
+            await connection.copy_records_to_table(IMPORT_TABLE, records=records, columns=IMPORT_COLUMNS)
+            # строка с уже занятым email не должна откатывать весь пакет, как при COPY прямо в users
+            status = await connection.execute(
+                f"INSERT INTO {cls.model.__tablename__} ({columns}) "
+                f"SELECT {columns} FROM {IMPORT_TABLE} ON CONFLICT (email) DO NOTHING"
+            )
+            await connection.execute(f"TRUNCATE {IMPORT_TABLE}")
+        return int(status.split()[-1])
+    
+    @classmethod
+    async def copy_export(cls, connection, output, fmt: str, cursor: int = 0) -> int:
+        """
+        COPY of the public columns of users with id > cursor, ordered by id.
+        output is a path, a file object or a coroutine function taking bytes.
+        Returns the number of exported rows.
+        """
+        columns = ", ".join(column.name for column in cls._public_columns())
+        query = f"SELECT {columns} FROM {cls.model.__tablename__} WHERE id > $1 ORDER BY id"
+        if fmt == "csv":
+            status = await connection.copy_from_query(query, cursor, output=output, format="csv", header=True)
+        else:
+            # одна колонка JSON в CSV с кавычкой и разделителем, которых не бывает
+            # в выводе row_to_json: строки выходят без экранирования, как NDJSON
+            status = await connection.copy_from_query(
+                f"SELECT row_to_json(u) FROM ({query}) u", cursor,
+                output=output, format="csv", delimiter="\x02", quote="\x01"
+            )
+        return int(status.split()[-1])
@@ -1,15 +1,22 @@
 from app.config import settings
 from app.exceptions import (
     IncorrectTokenFormatException,
+    NotEnoughRightsException,
     TokenAbsentException,
     TokenExpiredException,
+    TokenRevokedException,
     UserIsNotPresentException,
 )
-from app.users.dao import UserDAO
+from app.users.cache import user_cache
+from app.users.loader import user_loader
+from app.users.revocation import revocation_list
 from app.users.models import User
+from app.users.schemas import STokenClaims
 
-from fastapi import Depends, Request
-from jose import jwt, JWTError
+import hmac
+from fastapi import Depends, Header, Request
+from jose import jwt, ExpiredSignatureError, JWTError
+from pydantic import ValidationError
 from datetime import datetime, UTC
 
 
@@ -20,27 +27,69 @@ def get_token(request: Request):
     return token
 
 
-async def get_current_user(token: str = Depends(get_token)):
+def get_refresh_token(request: Request):
+    token  = request.cookies.get("refresh_token")
+    if not token:
+        raise TokenAbsentException
+    return token
+
+
+def decode_token(token: str, token_type: str) -> dict:
     try: 
         payload = jwt.decode(
             token, settings.SECRET_KEY, settings.ALGORITHM
         )
+    except ExpiredSignatureError:
+        raise TokenExpiredException
     except JWTError:
         raise IncorrectTokenFormatException
     expire: str = payload.get("exp")
     if (not expire) or (int(expire) < datetime.now(UTC).timestamp()):
         raise TokenExpiredException
-    user_id: str = payload.get("sub")
-    if not user_id:
-        raise UserIsNotPresentException
-    user = await UserDAO.find_by_id(int(user_id))
-    if not user: 
+    if payload.get("typ") != token_type:
+        raise IncorrectTokenFormatException
+    if not payload.get("sub"):
         raise UserIsNotPresentException
+    return payload
+
+
+def get_token_claims(token: str = Depends(get_token)) -> STokenClaims:
+    """
+    Claims of a valid access token, without touching the database
+    """
+    try:
+        claims = STokenClaims.model_validate(decode_token(token, "access"))
+    except ValidationError:
+        raise IncorrectTokenFormatException
+    if revocation_list.is_revoked(claims.jti):
+        raise TokenRevokedException
+    return claims
+
+
+async def get_current_user(claims: STokenClaims = Depends(get_token_claims)):
+    user = await user_cache.get(claims.sub)
+    if not user:
+        # параллельные промахи объединяются в один запрос к базе
+        user = await user_loader.load(claims.sub)
+        if not user: 
+            raise UserIsNotPresentException
+        await user_cache.set(user)
+    if user.token_version != claims.ver:
+        raise TokenExpiredException
     return user
 
 
-async def get_current_admin_user(current_usern: User = Depends(get_current_user)):
-    if current_usern.role != "admin":
-        raise UserIsNotPresentException 
-    return current_usern
-    
\ No newline at end of file
+async def get_current_admin_user(claims: STokenClaims = Depends(get_token_claims)) -> STokenClaims:
+    if not claims.is_admin:
+        raise NotEnoughRightsException 
+    # снятие роли поднимает token_version: токен, выданный до этого, не принимаем
+    await get_current_user(claims)
+    return claims
+
+
+def get_internal_caller(x_internal_key: str = Header("")):
+    """
+    Service-to-service endpoints: the caller presents INTERNAL_API_KEY
+    """
+    if not settings.INTERNAL_API_KEY or not hmac.compare_digest(x_internal_key, settings.INTERNAL_API_KEY):
+        raise NotEnoughRightsException
@@ -0,0 +1,255 @@
+from app.config import settings
+from app.exceptions import ServiceOverloadedException
+from app.logger import logger
+from app.metrics import HASH_DURATION, HASH_IN_FLIGHT, HASH_QUEUE_WAIT, HASH_REJECTED
+
+import asyncio
+import bcrypt
+import math
+import multiprocessing
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from statistics import median
+from time import perf_counter
+
+
+def _to_bytes(password: str | bytes) -> bytes:
+    if isinstance(password, str):
+        return password.encode("utf-8")
+    return password
+
+
+def _timed(func, *args):
+    # выполняется в воркере пула, поэтому время считаем здесь,
+    # а ожидание в очереди - как разницу с общим временем в event loop
+    start = perf_counter()
+    result = func(*args)
+    return result, perf_counter() - start
+
+
+def hash_many(hasher: "Hasher", passwords: list[bytes]) -> list[bytes]:
+    # для пула импорта: дочерний процесс импортирует только этот модуль
+    return [hasher.hash(password) for password in passwords]
+
+
+def _measure(func, *args, runs: int = 3) -> float:
+    return median(_timed(func, *args)[1] for _ in range(runs))
+
+
+class Hasher(ABC):
+    """
+    Password hashing algorithm. The cost parameters are stored in the hash
+    itself, so hashes made with other parameters still verify and can be
+    detected by needs_rehash.
+    """
+    name: str
+    prefixes: tuple[bytes, ...]
+
+    def identify(self, hashed_password: bytes) -> bool:
+        return hashed_password.startswith(self.prefixes)
+
+    @abstractmethod
+    def hash(self, password: bytes) -> bytes:
+        pass
+
+    @abstractmethod
+    def verify(self, password: bytes, hashed_password: bytes) -> bool:
+        pass
+
+    @abstractmethod
+    def needs_rehash(self, hashed_password: bytes) -> bool:
+        pass
+
+    @abstractmethod
+    def calibrate(self, target: float):
+        """
+        Picks the smallest cost whose hash takes at least target seconds
+        """
+        pass
+
+
+class BcryptHasher(Hasher):
+    name = "bcrypt"
+    prefixes = (b"$2a$", b"$2b$", b"$2y$")
+    min_rounds = 4
+    max_rounds = 20
+
+    def __init__(self, rounds: int = 12):
+        self.rounds = rounds
+
+    def hash(self, password: bytes) -> bytes:
+        return bcrypt.hashpw(password=password, salt=bcrypt.gensalt(self.rounds))
+
+    def verify(self, password: bytes, hashed_password: bytes) -> bool:
+        return bcrypt.checkpw(password=password, hashed_password=hashed_password)
+
+    def needs_rehash(self, hashed_password: bytes) -> bool:
+        # $2b$12$<salt+hash>
+        return int(hashed_password.split(b"$")[2]) != self.rounds
+
+    def calibrate(self, target: float):
+        # время bcrypt удваивается с каждым раундом: меряем на 8 и экстраполируем
+        base_rounds = 8
+        base = _measure(BcryptHasher(base_rounds).hash, b"calibration")
+        rounds = base_rounds + math.ceil(math.log2(max(target / base, 1e-9)))
+        self.rounds = min(max(rounds, self.min_rounds), self.max_rounds)
+
+
+class Argon2Hasher(Hasher):
+    name = "argon2id"
+    prefixes = (b"$argon2id$",)
+    max_time_cost = 32
+
+    def __init__(self, time_cost: int = 3, memory_cost: int = 65536, parallelism: int = 1):
+        self.time_cost = time_cost
+        self.memory_cost = memory_cost
+        self.parallelism = parallelism
+
+    def _hasher(self):
+        # argon2-cffi нужен только при PASSWORD_HASHER=argon2id
+        from argon2 import PasswordHasher as Argon2PasswordHasher, Type
+
+        return Argon2PasswordHasher(
+            time_cost=self.time_cost,
+            memory_cost=self.memory_cost,
+            parallelism=self.parallelism,
+            type=Type.ID,
+        )
+
+    def hash(self, password: bytes) -> bytes:
+        return self._hasher().hash(password).encode()
+
+    def verify(self, password: bytes, hashed_password: bytes) -> bool:
+        from argon2.exceptions import InvalidHashError, VerificationError
+
+        try:
+            return self._hasher().verify(hashed_password.decode(), password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def needs_rehash(self, hashed_password: bytes) -> bool:
+        return self._hasher().check_needs_rehash(hashed_password.decode())
+
+    def calibrate(self, target: float):
+        # время argon2 линейно по time_cost
+        base = _measure(Argon2Hasher(1, self.memory_cost, self.parallelism).hash, b"calibration")
+        self.time_cost = min(max(math.ceil(target / base), 1), self.max_time_cost)
+
+
+def make_hasher(name: str) -> Hasher:
+    if name == "argon2id":
+        return Argon2Hasher(
+            time_cost=settings.ARGON2_TIME_COST,
+            memory_cost=settings.ARGON2_MEMORY_COST,
+            parallelism=settings.ARGON2_PARALLELISM,
+        )
+    return BcryptHasher(rounds=settings.BCRYPT_ROUNDS)
+
+
+def calibrate_hasher(hasher: Hasher, target_ms: int) -> dict[str, str]:
+    """
+    Calibrates the hasher and returns the settings that reproduce the result,
+    so gunicorn can calibrate once in the master and pass them to workers.
+    """
+    hasher.calibrate(target_ms / 1000)
+    if isinstance(hasher, Argon2Hasher):
+        return {"ARGON2_TIME_COST": str(hasher.time_cost), "HASH_CALIBRATED": "1"}
+    return {"BCRYPT_ROUNDS": str(hasher.rounds), "HASH_CALIBRATED": "1"}
+
+
+class PasswordHasher:
+    """
+    Runs password hashing in a bounded thread or process pool so it never
+    blocks the event loop. When more than `workers + queue_limit` jobs are
+    pending, new jobs are rejected with 503 instead of queuing without limit.
+    New hashes use the configured hasher; existing ones are verified by the
+    hasher that produced them.
+    """
+
+    def __init__(self, hasher: Hasher, kind: str, workers: int, queue_limit: int):
+        self.hasher = hasher
+        self.hashers = [hasher] + [
+            other for other in (BcryptHasher(), Argon2Hasher()) if other.name != hasher.name
+        ]
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = self.workers + queue_limit
+        self._executor: Executor | None = None
+        self._pending = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # spawn, как и в transfer: форк унаследовал бы цикл событий и соединения
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hash"
+                )
+        return self._executor
+
+    def _hasher_for(self, hashed_password: bytes) -> Hasher:
+        for hasher in self.hashers:
+            if hasher.identify(hashed_password):
+                return hasher
+        return self.hasher
+
+    async def _run(self, operation: str, func, *args):
+        if self._pending >= self.max_pending:
+            HASH_REJECTED.labels(operation).inc()
+            raise ServiceOverloadedException
+        self._pending += 1
+        HASH_IN_FLIGHT.inc()
+        start = perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, hash_time = await loop.run_in_executor(self.executor, _timed, func, *args)
+        finally:
+            self._pending -= 1
+            HASH_IN_FLIGHT.dec()
+        HASH_DURATION.labels(operation).observe(hash_time)
+        HASH_QUEUE_WAIT.labels(operation).observe(max(perf_counter() - start - hash_time, 0))
+        return result
+
+    async def hash(self, password: str | bytes) -> bytes:
+        return await self._run("hash", self.hasher.hash, _to_bytes(password))
+
+    async def verify(self, password: str | bytes, hashed_password: bytes) -> bool:
+        hasher = self._hasher_for(hashed_password)
+        return await self._run("verify", hasher.verify, _to_bytes(password), hashed_password)
+
+    def needs_rehash(self, hashed_password: bytes) -> bool:
+        hasher = self._hasher_for(hashed_password)
+        return hasher is not self.hasher or hasher.needs_rehash(hashed_password)
+
+    async def calibrate(self, target_ms: int):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.hasher.calibrate, target_ms / 1000)
+        logger.info("Password hasher calibrated", extra={"hasher": self.hasher.name, **vars(self.hasher)})
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    hasher=make_hasher(settings.PASSWORD_HASHER),
+    kind=settings.HASH_EXECUTOR,
+    workers=settings.HASH_WORKERS,
+    queue_limit=settings.HASH_QUEUE_LIMIT,
+)
+
+
+if __name__ == "__main__":
+    # python -m app.users.hashing - подобранные настройки в JSON, см. gunicorn.conf.py
+    import json
+
+    calibrated = {}
+    if settings.HASH_TARGET_MS and not settings.HASH_CALIBRATED:
+        calibrated = calibrate_hasher(make_hasher(settings.PASSWORD_HASHER), settings.HASH_TARGET_MS)
+    print(json.dumps(calibrated))
@@ -0,0 +1,19 @@
+from app.config import settings
+from app.loader import BatchLoader
+from app.users.dao import UserDAO
+from app.users.models import User
+
+
+async def load_users(ids: list[int]) -> dict[int, User]:
+    # результат идет в кэш: отставшая реплика вернула бы туда старую версию
+    # пользователя уже после того, как его инвалидация истекла
+    return {user.id: user for user in await UserDAO.find_many_by_ids(ids, replica=False)}
+
+
+# промахи кэша пользователей от параллельных запросов идут в базу одним запросом
+user_loader: BatchLoader[int, User] = BatchLoader(
+    "users",
+    load_users,
+    delay=settings.USER_LOADER_DELAY_MS / 1000,
+    max_batch=settings.USER_LOADER_MAX_BATCH,
+)
@@ -1,19 +1,29 @@
 from app.database import Base
 
 from datetime import datetime, UTC, date
+from sqlalchemy import CheckConstraint, DateTime, Index, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        CheckConstraint("email = lower(email)", name="ck_users_email_lower"),
+        Index("ix_users_email", "email", unique=True),
+        Index("ix_users_unverified", "id", "created", postgresql_where=text("NOT is_verified")),
+    )
     
     id: Mapped[int] = mapped_column(primary_key=True)
     email: Mapped[str]
     password_hashed: Mapped[bytes]
-    verification_code: Mapped[str]
+    verification_code: Mapped[str | None]
     is_verified: Mapped[bool] = mapped_column(default=False) 
+    # первое подтверждение почты; смена почты сбрасывает is_verified, но не его
+    verified_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
     portfolio_id: Mapped[int | None]
     is_sub: Mapped[bool] = mapped_column(default=False) 
     is_admin: Mapped[bool] = mapped_column(default=False) 
     is_moder: Mapped[bool] = mapped_column(default=False)
     created: Mapped[date] = mapped_column(default=datetime.now(UTC).date())
+    # увеличивается при смене ролей, токены со старой версией недействительны
+    token_version: Mapped[int] = mapped_column(default=0, server_default="0")
@@ -0,0 +1,201 @@
+from app.cache import redis
+from app.config import settings
+from app.exceptions import TooManyRequestsException
+from app.logger import logger
+from app.metrics import RATE_LIMIT_REQUESTS
+from app.users.dependencies import get_token_claims
+from app.users.schemas import STokenClaims
+
+import math
+from dataclasses import dataclass
+from time import monotonic
+from fastapi import Depends, Request
+
+
+# скользящее окно как взвешенная сумма текущего и предыдущего фиксированных
+# окон. Все лимиты запроса проверяются атомарно, списание только если прошли
+# все. Для ключа можно зарезервировать сразу несколько токенов (ARGV cost),
+# чтобы воркер расходовал их локально, без похода в Redis.
+# Возвращает {1, выдано токенов по ключам...} или {0, retry-after в мс по ключам...}
+HIT_SCRIPT = """
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+local ok = 1
+local grants = {}
+local retries = {}
+local counters = {}
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[3 * i - 2])
+    local window = tonumber(ARGV[3 * i - 1])
+    local cost = tonumber(ARGV[3 * i])
+    local index = math.floor(now / window)
+    local elapsed = (now % window) / window
+    local prev = tonumber(redis.call('GET', key .. ':' .. (index - 1)) or '0')
+    local curr = tonumber(redis.call('GET', key .. ':' .. index) or '0')
+    local available = math.floor(limit - (prev * (1 - elapsed) + curr))
+    counters[i] = key .. ':' .. index
+    grants[i] = math.min(cost, available)
+    retries[i] = 0
+    if available < 1 then
+        ok = 0
+        local retry
+        if prev > 0 and curr + 1 <= limit then
+            -- освободится, когда уменьшится вклад предыдущего окна
+            retry = (1 - (limit - curr - 1) / prev - elapsed) * window
+        else
+            -- только в следующем окне, когда уменьшится вклад текущего
+            retry = (1 - elapsed + math.max(1 - (limit - 1) / math.max(curr, 1), 0)) * window
+        end
+        retries[i] = math.max(math.ceil(retry), 1)
+    end
+end
+if ok == 0 then
+    return {0, unpack(retries)}
+end
+for i, counter in ipairs(counters) do
+    redis.call('INCRBY', counter, grants[i])
+    redis.call('PEXPIRE', counter, tonumber(ARGV[3 * i - 1]) * 2)
+end
+return {1, unpack(grants)}
+"""
+
+
+@dataclass
+class LocalState:
+    # зарезервированные в Redis токены либо блокировка ключа до expires
+    tokens: int
+    expires: float
+    blocked: bool = False
+
+
+class RateLimiter:
+    """
+    Sliding-window rate limits kept in Redis, shared by all workers.
+
+    Every worker keeps a local pre-filter in front of Redis: a key that was
+    rejected stays blocked locally until its Retry-After, and for high limits
+    (the global ones) Redis hands out a batch of `limit / local_share` tokens
+    that the worker spends without a round-trip. Reserved tokens count against
+    the limit even if unused, so the limit is never exceeded, only reached
+    slightly earlier.
+    """
+
+    def __init__(self, limits: dict[str, dict[str, tuple[int, int]]], local_share: int, local_ttl: float, local_size: int = 10000):
+        self.limits = limits
+        self.local_share = local_share
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        self._local: dict[str, LocalState] = {}
+        self._hit = redis.register_script(HIT_SCRIPT)
+
+    def _reservation(self, limit: int) -> int:
+        return max(1, limit // self.local_share)
+
+    def _set_local(self, key: str, state: LocalState):
+        if len(self._local) >= self.local_size:
+            now = monotonic()
+            self._local = {k: v for k, v in self._local.items() if v.expires > now}
+            if len(self._local) >= self.local_size:
+                self._local.clear()
+        self._local[key] = state
+
+    async def hit(self, endpoint: str, **identities: str):
+        """
+        Counts one request to the endpoint for every configured scope:
+        `ip`, `email`, `user` come from identities, `global` is shared.
+        Raises TooManyRequestsException if any limit is exhausted.
+        """
+        keys = {}
+        for scope, (limit, window) in self.limits.get(endpoint, {}).items():
+            if scope == "global":
+                keys[f"ratelimit:{endpoint}:global"] = (limit, window)
+            elif identities.get(scope):
+                keys[f"ratelimit:{endpoint}:{scope}:{identities[scope]}"] = (limit, window)
+        if not keys:
+            return
+
+        now = monotonic()
+        remote = []
+        for key in keys:
+            state = self._local.get(key)
+            if state is None or state.expires <= now or state.tokens <= 0 and not state.blocked:
+                remote.append(key)
+            elif state.blocked:
+                RATE_LIMIT_REQUESTS.labels(endpoint, "local", "rejected").inc()
+                raise TooManyRequestsException(math.ceil(state.expires - now))
+
+        if remote:
+            args = []
+            for key in remote:
+                limit, window = keys[key]
+                args += [limit, window * 1000, self._reservation(limit)]
+            try:
+                allowed, *results = await self._hit(keys=remote, args=args)
+            except Exception:
+                # лимитер не должен ронять вход: при недоступном Redis пропускаем
+                logger.warning("Rate limiter unavailable", extra={"endpoint": endpoint}, exc_info=True)
+                RATE_LIMIT_REQUESTS.labels(endpoint, "redis", "error").inc()
+                return
+            if not allowed:
+                retry_after = 0
+                for key, retry_ms in zip(remote, results):
+                    if retry_ms:
+                        self._set_local(key, LocalState(0, now + retry_ms / 1000, blocked=True))
+                        retry_after = max(retry_after, retry_ms)
+                RATE_LIMIT_REQUESTS.labels(endpoint, "redis", "rejected").inc()
+                raise TooManyRequestsException(math.ceil(retry_after / 1000))
+            for key, granted in zip(remote, results):
+                # один токен тратит текущий запрос, остальные - следующие
+                self._set_local(key, LocalState(granted, now + self.local_ttl))
+
+        for key in keys:
+            state = self._local.get(key)
+            if state is not None:
+                state.tokens -= 1
+        RATE_LIMIT_REQUESTS.labels(endpoint, "redis" if remote else "local", "allowed").inc()
+
+
+rate_limiter = RateLimiter(
+    limits=settings.RATE_LIMITS,
+    local_share=settings.RATE_LIMIT_LOCAL_SHARE,
+    local_ttl=settings.RATE_LIMIT_LOCAL_TTL,
+)
+
+
+def client_ip(request: Request) -> str | None:
+    # за прокси адрес клиента берется из X-Forwarded-For самим uvicorn (--proxy-headers)
+    return request.client.host if request.client else None
+
+
+def rate_limit(endpoint: str):
+    """
+    Dependency for anonymous endpoints: limits by client ip, by the `email`
+    field of the JSON body and globally
+    """
+    async def dependency(request: Request):
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        email = None
+        try:
+            # тело кешируется в request, эндпоинт прочитает его повторно без затрат
+            body = await request.json()
+            if isinstance(body, dict) and isinstance(body.get("email"), str):
+                email = body["email"].lower()
+        except ValueError:
+            pass
+        await rate_limiter.hit(endpoint, ip=client_ip(request), email=email)
+
+    return dependency
+
+
+def rate_limit_user(endpoint: str):
+    """
+    Dependency for authenticated endpoints: limits by client ip,
+    by user id from the access token and globally
+    """
+    async def dependency(request: Request, claims: STokenClaims = Depends(get_token_claims)):
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        await rate_limiter.hit(endpoint, ip=client_ip(request), user=str(claims.sub))
+
+    return dependency
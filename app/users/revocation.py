@@ -0,0 +1,77 @@
+from app.cache import on_reconnect, redis, subscribe
+
+from time import time
+
+
+REVOKED_CHANNEL = "tokens:revoked"
+ACCESS_PREFIX = "revoked:access:"
+REFRESH_PREFIX = "revoked:refresh:"
+
+
+class RevocationList:
+    """
+    Revoked token ids (jti). Each one is written to Redis with a TTL equal to
+    the token's remaining lifetime. Every worker mirrors the revoked access
+    tokens in memory, updated over pub/sub, so checking an access token does
+    not need a Redis round-trip. Refresh tokens live much longer and are used
+    rarely, so they are checked against Redis directly.
+    """
+
+    def __init__(self):
+        # jti -> exp
+        self._revoked: dict[str, float] = {}
+        self._next_sweep = 1024
+
+    def is_revoked(self, jti: str) -> bool:
+        exp = self._revoked.get(jti)
+        if exp is None:
+            return False
+        if exp < time():
+            del self._revoked[jti]
+            return False
+        return True
+
+    def _add_local(self, jti: str, exp: float):
+        self._revoked[jti] = exp
+        if len(self._revoked) >= self._next_sweep:
+            now = time()
+            self._revoked = {k: v for k, v in self._revoked.items() if v >= now}
+            self._next_sweep = max(1024, len(self._revoked) * 2)
+
+    def _on_message(self, data: str):
+        jti, exp = data.rsplit(":", 1)
+        self._add_local(jti, float(exp))
+
+    async def load(self):
+        """
+        Loads all revoked access tokens from Redis: on startup and after
+        the pub/sub listener reconnects
+        """
+        async for key in redis.scan_iter(match=f"{ACCESS_PREFIX}*", count=1000):
+            exp = await redis.get(key)
+            if exp is not None:
+                self._add_local(key.removeprefix(ACCESS_PREFIX), float(exp))
+
+    async def revoke_access(self, jti: str, exp: float):
+        ttl = int(exp - time()) + 1
+        if ttl <= 0:
+            return
+        self._add_local(jti, exp)
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.set(f"{ACCESS_PREFIX}{jti}", exp, ex=ttl)
+            pipe.publish(REVOKED_CHANNEL, f"{jti}:{exp}")
+            await pipe.execute()
+
+    async def revoke_refresh(self, jti: str, exp: float):
+        ttl = int(exp - time()) + 1
+        if ttl > 0:
+            await redis.set(f"{REFRESH_PREFIX}{jti}", exp, ex=ttl)
+
+    async def is_refresh_revoked(self, jti: str) -> bool:
+        return bool(await redis.exists(f"{REFRESH_PREFIX}{jti}"))
+
+
+revocation_list = RevocationList()
+
+subscribe(REVOKED_CHANNEL, revocation_list._on_message)
+on_reconnect(revocation_list.load)
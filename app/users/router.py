@@ -1,58 +1,82 @@
-from app.exceptions import IncorrectEmailOrPasswordException, InvalidVerificationCode, UserAlreadyExistsException, UserIsNotPresentException
-from app.tasks.tasks import create_verification_code, send_verify_message
+from app.config import settings
+from app.exceptions import IncorrectEmailOrPasswordException, InvalidVerificationCode, TokenExpiredException, TokenRevokedException, UserAlreadyExistsException, UserException, UserIsNotPresentException
+from app.tasks.tasks import create_verification_code
+from app.database import get_session
+from app.outbox.dao import OutboxDAO
 from app.users.dao import UserDAO
-from app.users.dependencies import get_current_admin_user, get_current_user
+from app.users.dependencies import decode_token, get_current_admin_user, get_current_user, get_internal_caller, get_refresh_token, get_token_claims
 from app.users.models import User
-from app.users.schemas import SUpdatePortfolioId, SUserAuth, SAdminAuth, SModerAuth, SUserInfo, SSubAuth, SResetEmail, SUserSignup, SUserVerify, SUserVerifyNewPassword
-from app.users.auth import get_password_hash, authenticate_user, create_access_token
+from app.users.cache import user_cache
+from app.users.loader import user_loader
+from app.users.revocation import revocation_list
+from app.users.verification import verification_codes
+from app.users.rate_limit import rate_limit, rate_limit_user
+from app.users.transfer import TransferFormat, import_users, iter_export
+from app.users.schemas import SBulkUpdatePortfolioId, STokenClaims, SBulkUpdatePortfolioIdResult, SMessage, STokens, SUserImportResult, SUserLookup, SUserLookupResult, SUpdatePortfolioId, SUserAuth, SUserInfo, SUsersPage, SResetEmail, SUserSignup, SUserVerify, SUserVerifyNewPassword, dump_user, user_to_dict
+from app.users.auth import get_password_hash, authenticate_user, create_user_tokens
 from app.logger import logger
 
+import hashlib
+import orjson
 from datetime import datetime, UTC
-from fastapi import APIRouter, Depends, Request, Response, status
-from fastapi.responses import RedirectResponse
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse, RedirectResponse, StreamingResponse
 from fastapi_versioning import version
-from dateutil.tz import tzutc
 
 
 router = APIRouter(
     prefix="/auth",
-    tags=["Auth & Users"]
+    tags=["Auth & Users"],
+    dependencies=[Depends(get_session)],
+    default_response_class=ORJSONResponse
 )
 
 
-@router.post("/signup")
+def message_response(status_code: int, message: str, email: str | None = None) -> ORJSONResponse:
+    content = {"message": message, "time": datetime.now(UTC)}
+    if email is not None:
+        content["email"] = email
+    return ORJSONResponse(status_code=status_code, content=content)
+
+
+@router.post("/signup", response_model=SMessage, dependencies=[Depends(rate_limit("signup"))])
 @version(1)
 async def signup_user(user_data: SUserSignup):
     try:
-        existing_user = await UserDAO.find_one_or_none(email=user_data.email)
+        # хеш дорогой: повторная регистрация отсекается до него, а гонку
+        # двух одновременных регистраций решает индекс ix_users_email
+        if await UserDAO.find_one_or_none(email=user_data.email):
+            logger.error("User already exists", extra={"email": user_data.email})
+            raise UserAlreadyExistsException
+        password_hashed = await get_password_hash(user_data.password)
+        verification_code = create_verification_code()
+        user = await UserDAO.add_or_none(
+            conflict_columns=["email"],
+            email=user_data.email,
+            password_hashed=password_hashed
+        )
 
-        if existing_user:
+        if not user:
             msg = "User already exists"
-            logger.error(msg, extra={"email": existing_user.email}, exc_info=True)
+            logger.error(msg, extra={"email": user_data.email}, exc_info=True)
             raise UserAlreadyExistsException
         
-        password_hashed = get_password_hash(user_data.password)
-        verification_code = create_verification_code()
-        user = await UserDAO.add_return_obj(email=user_data.email, password_hashed=password_hashed, verification_code=verification_code)
         # user_dict = SUserInfo.model_validate(user).model_dump()
-        send_verify_message.delay(user.email, verification_code)
+        await verification_codes.issue(user.email, verification_code)
+        # письмо уйдет через outbox только если транзакция запроса закоммитится
+        await OutboxDAO.add_verification(user.email, verification_code)
         # return RedirectResponse(url="/v1/auth/verify_email")
-        item = {
-            "email": user_data.email,
-            "message": "User created successfully. Verification code sent to email.",
-            "time": datetime.now(tz=tzutc()).isoformat()
-            }
-        return JSONResponse(status_code=status.HTTP_201_CREATED, content=item)
+        return message_response(status.HTTP_201_CREATED, "User created successfully. Verification code sent to email.", user_data.email)
 
+    except UserException:
+        raise
     except Exception as e:
         msg = "Unknown Exc: Cannot signup new user"
         logger.error(msg, extra=user_data.model_dump(), exc_info=True)
         # raise e
 
 
-@router.post("/verify_email")
+@router.post("/verify_email", response_model=SMessage)
 @version(1)
 async def verify_email(user_data: SUserVerify):
     try:
@@ -62,32 +86,21 @@ async def verify_email(user_data: SUserVerify):
             logger.error(msg, extra={"email": user_data.email}, exc_info=True)
             raise UserIsNotPresentException
         
-        item = {
-            "email": user_data.email,
-            "message": "",
-            "time": datetime.now(tz=tzutc()).isoformat()
-            }
-        if user_data.verification_code != current_user.verification_code:
-            item["message"] = "Invalid verification code"
-            return JSONResponse(status_code=status.HTTP_417_EXPECTATION_FAILED, content=item)
+        if not await verification_codes.consume(current_user.email, user_data.verification_code):
+            return message_response(status.HTTP_417_EXPECTATION_FAILED, "Invalid verification code", user_data.email)
         
         await UserDAO.update_verification_status(current_user.email)
         # return RedirectResponse(url="/login")
-        item["message"] = "Email successfully verified"
-        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=item)
+        return message_response(status.HTTP_202_ACCEPTED, "Email successfully verified", user_data.email)
         
     except Exception as e:
         msg = "Unknown Exc: Cannot verify email of new user"
         logger.error(msg, extra=user_data.model_dump(), exc_info=True)
-        item = {
-            "mesage": msg,
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content=item)
+        return message_response(status.HTTP_500_INTERNAL_SERVER_ERROR, msg)
     
 
 
-@router.post("/login")
+@router.post("/login", response_model=STokens, dependencies=[Depends(rate_limit("login"))])
 @version(1)
 async def login_user(response: Response, user_data: SUserAuth):
     try:
@@ -98,160 +111,241 @@ async def login_user(response: Response, user_data: SUserAuth):
             logger.error(msg, extra={"email": user_data.email}, exc_info=True)
             raise IncorrectEmailOrPasswordException
         
-        item = {
-            "email": user_data.email,
-            "message": "",
-            "time": datetime.now(tz=tzutc()).isoformat()
-            }
-        
         if not user.is_verified:
-            item["message"] = "Email not verified"
-            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=item)
+            return message_response(status.HTTP_401_UNAUTHORIZED, "Email not verified", user_data.email)
         
-        access_token = create_access_token({"sub": str(user.id)})
+        access_token, refresh_token = create_user_tokens(user)
         response.set_cookie("access_token", access_token, httponly=True)
-        return {"access_token": access_token}
+        response.set_cookie("refresh_token", refresh_token, httponly=True)
+        return STokens(access_token=access_token, refresh_token=refresh_token)
     
+    except UserException:
+        raise
     except Exception as e:
         msg = "Unknown Exc: Cannot login user"
         logger.error(msg, extra=user_data.model_dump(), exc_info=True)
-        item = {
-            "mesage": msg,
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content=item)
+        return message_response(status.HTTP_500_INTERNAL_SERVER_ERROR, msg)
+
+
+async def revoke_cookie_tokens(request: Request):
+    for cookie, token_type in (("access_token", "access"), ("refresh_token", "refresh")):
+        token = request.cookies.get(cookie)
+        if not token:
+            continue
+        try:
+            payload = decode_token(token, token_type)
+        except UserException:
+            # просроченный или чужой токен отзывать не нужно
+            continue
+        jti = payload.get("jti")
+        if not jti:
+            continue
+        if token_type == "access":
+            await revocation_list.revoke_access(jti, payload["exp"])
+        else:
+            await revocation_list.revoke_refresh(jti, payload["exp"])
 
 
-@router.post("/logout")
+@router.post("/logout", response_model=SMessage)
 @version(1)
-async def logout_user(response: Response):
+async def logout_user(request: Request):
     try:
+        await revoke_cookie_tokens(request)
+        # куки удаляем на возвращаемом ответе, а не на параметре response
+        response = message_response(status.HTTP_200_OK, "Successfully logout")
         response.delete_cookie("access_token", httponly=True)
-        item = {
-            "mesage": "Successfully logout",
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-        return JSONResponse(status_code=status.HTTP_200_OK, content=item)
+        response.delete_cookie("refresh_token", httponly=True)
+        return response
     
     except Exception as e:
         msg = "Unknown Exc: Cannot logout user"
-        logger.error(msg, extra=response, exc_info=True)
-        item = {
-            "mesage": msg,
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content=item)
+        logger.error(msg, exc_info=True)
+        return message_response(status.HTTP_500_INTERNAL_SERVER_ERROR, msg)
 
 
-@router.post("/delete_user")
+@router.post("/refresh", response_model=STokens)
 @version(1)
-async def delete_user(response: Response, current_user: User = Depends(get_current_user)):
+async def refresh_tokens(response: Response, token: str = Depends(get_refresh_token)):
+    payload = decode_token(token, "refresh")
+    if await revocation_list.is_refresh_revoked(payload["jti"]):
+        raise TokenRevokedException
+    # роли берем из базы: после их смены token_version в refresh токене устаревает
+    user = await UserDAO.find_by_id(int(payload["sub"]))
+    if not user:
+        raise UserIsNotPresentException
+    if user.token_version != payload.get("ver"):
+        raise TokenExpiredException
+    
+    # старый refresh токен одноразовый
+    await revocation_list.revoke_refresh(payload["jti"], payload["exp"])
+    access_token, refresh_token = create_user_tokens(user)
+    response.set_cookie("access_token", access_token, httponly=True)
+    response.set_cookie("refresh_token", refresh_token, httponly=True)
+    return STokens(access_token=access_token, refresh_token=refresh_token)
+
+
+@router.post("/delete_user", response_model=SMessage)
+@version(1)
+async def delete_user(current_user: User = Depends(get_current_user)):
     try:
-        item = {
-            "email": current_user.email,
-            "message": "User deleted",
-            "time": datetime.now(tz=tzutc()).isoformat()
-            }
         await UserDAO.delete(id=current_user.id)
+        response = message_response(status.HTTP_200_OK, "User deleted", current_user.email)
         response.delete_cookie("access_token", httponly=True)
-        return JSONResponse(status_code=status.HTTP_200_OK, content=item)
+        return response
     
     except Exception as e:
         msg = "Unknown Exc: Cannot delete user"
-        logger.error(msg, extra=current_user, exc_info=True)
-        item = {
-            "mesage": msg,
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content=item)
+        logger.error(msg, extra={"user_id": current_user.id}, exc_info=True)
+        return message_response(status.HTTP_500_INTERNAL_SERVER_ERROR, msg)
     
 
-@router.get("/me")
+def serialize_me(user: User) -> tuple[str, str]:
+    body = dump_user(user)
+    return f'"{hashlib.sha1(body).hexdigest()[:20]}"', body.decode()
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return any(
+        candidate.strip().removeprefix("W/") in (etag, "*")
+        for candidate in if_none_match.split(",")
+    )
+
+
+@router.get("/me", response_model=SUserInfo)
 @version(1)
-async def read_users_me(current_user: User = Depends(get_current_user)):
-    try:
-        return current_user
-    except Exception as e:
-        msg = "Unknown Exc: Cannot read current user"
-        logger.error(msg, extra=current_user, exc_info=True)
-        item = {
-            "mesage": msg,
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content=item)
+async def read_users_me(request: Request, claims: STokenClaims = Depends(get_token_claims)):
+    """
+    Served from a per-user cache of the serialized body: a valid token and a
+    matching If-None-Match give 304 without touching the database.
+    A cached body built for another token_version is not used, then
+    get_current_user rejects the token as usual.
+    """
+    cached = await user_cache.get_response(claims.sub)
+    if cached and int(cached["ver"]) == claims.ver:
+        etag, body = cached["etag"], cached["body"]
+    else:
+        current_user = await get_current_user(claims)
+        etag, body = serialize_me(current_user)
+        await user_cache.set_response(current_user.id, current_user.token_version, etag, body)
+
+    # клиент всегда перепроверяет ответ по ETag
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 
+async def iter_ndjson(rows):
+    async for row in rows:
+        yield orjson.dumps(dict(row), option=orjson.OPT_APPEND_NEWLINE)
 
-@router.get("/all")
+
+@router.get("/all", response_model=SUsersPage)
 @version(1)
-async def read_users_all(current_user: User = Depends(get_current_admin_user)):
+async def read_users_all(
+    cursor: int | None = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    stream: bool = False,
+    current_user: STokenClaims = Depends(get_current_admin_user)
+):
     try:
-        if current_user.is_admin:
-            return await UserDAO.find_all()
-        item = {
-            "email": current_user.email,
-            "mesage": "Unauthorized",
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=item)
+        if stream:
+            return StreamingResponse(
+                iter_ndjson(UserDAO.stream_all(cursor=cursor)),
+                media_type="application/x-ndjson"
+            )
+        users = await UserDAO.find_page(cursor=cursor, limit=limit)
+        next_cursor = users[-1]["id"] if len(users) == limit else None
+        # строки уже содержат только публичные колонки, без валидации через SUsersPage
+        return ORJSONResponse({"users": [dict(user) for user in users], "next_cursor": next_cursor})
 
     except Exception as e:
         msg = "Unknown Exc: Cannot read all users"
-        logger.error(msg, extra=current_user, exc_info=True)
-        item = {
-            "mesage": msg,
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content=item)
+        logger.error(msg, extra={"user_id": current_user.sub}, exc_info=True)
+        return message_response(status.HTTP_500_INTERNAL_SERVER_ERROR, msg)
+
+
+@router.post("/admin/import", response_model=SUserImportResult)
+@version(1)
+async def import_users_bulk(
+    request: Request,
+    fmt: TransferFormat = Query(default="csv", alias="format"),
+    current_user: STokenClaims = Depends(get_current_admin_user)
+):
+    """
+    Bulk import from a CSV or NDJSON request body, one user per line,
+    loaded with COPY. Existing emails are skipped, invalid lines reported.
+    """
+    logger.info("Users import started", extra={"user_id": current_user.sub, "format": fmt})
+    return await import_users(request.stream(), fmt)
+
+
+@router.get("/admin/export")
+@version(1)
+async def export_users_bulk(
+    fmt: TransferFormat = Query(default="csv", alias="format"),
+    cursor: int = 0,
+    current_user: STokenClaims = Depends(get_current_admin_user)
+):
+    """
+    Public columns of all users with id > cursor, streamed straight from COPY
+    """
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(iter_export(fmt, cursor), media_type=media_type)
 
 
-@router.post("/verify_password")
+@router.post("/internal/lookup", response_model=SUserLookupResult, dependencies=[Depends(get_internal_caller)])
+@version(1)
+async def lookup_users(user_data: SUserLookup):
+    """
+    Users by ids for other services, in one request instead of one per user.
+    Lookups from concurrent requests are merged into shared queries.
+    """
+    users = await user_loader.load_all(user_data.ids)
+    return ORJSONResponse({
+        "users": [user_to_dict(user) for user in users.values()],
+        "missing": [user_id for user_id in dict.fromkeys(user_data.ids) if user_id not in users],
+    })
+
+
+@router.post("/verify_password", response_model=SMessage)
 @version(1)
 async def verify_password(user_data: SUserVerifyNewPassword, current_user: User = Depends(get_current_user)):
     try:
         # user = await UserDAO.find_obj(email=user_data.email)
         
-        if user_data.verification_code != current_user.verification_code:
+        if not await verification_codes.consume(current_user.email, user_data.verification_code):
             msg = "Code missmatch"
-            logger.error(msg, extra=current_user, exc_info=True)
+            logger.error(msg, extra={"user_id": current_user.id}, exc_info=True)
             raise InvalidVerificationCode
         
-        password_hashed = get_password_hash(user_data.password_new)
+        password_hashed = await get_password_hash(user_data.password_new)
         user = await UserDAO.update(filter_by={"email":current_user.email}, password_hashed=password_hashed)
         # return RedirectResponse(url="/login")
-        item = {
-            "email": current_user.email,
-            "mesage": "Password successfully verified",
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-        return JSONResponse(status_code=status.HTTP_200_OK, content=item)
+        return message_response(status.HTTP_200_OK, "Password successfully verified", current_user.email)
         
+    except UserException:
+        raise
     except Exception as e:
         msg = "Unknown Exc: Cannot verify new password"
         logger.error(msg, extra=user_data.model_dump(), exc_info=True)
-        item = {
-            "mesage": msg,
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content=item)
+        return message_response(status.HTTP_500_INTERNAL_SERVER_ERROR, msg)
 
 
-@router.post("/reset_password")
+@router.post("/reset_password", response_model=SMessage, dependencies=[Depends(rate_limit_user("reset_password"))])
 @version(1)
 async def reset_password(current_user: User = Depends(get_current_user)):
     # user = await authenticate_user(user_data.email, user_data.password_old)
     try:
         
         verification_code = create_verification_code()
-        await UserDAO.update(filter_by={"email":current_user.email}, verification_code=verification_code)    
-        send_verify_message.delay(current_user.email, verification_code)
+        await verification_codes.issue(current_user.email, verification_code)
+        await OutboxDAO.add_verification(current_user.email, verification_code)
         
         # return RedirectResponse(url="/verify_password")
-        item = {
-            "email": current_user.email,
-            "mesage": f"Reset code sent to email: {current_user.email}",
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-        return JSONResponse(status_code=status.HTTP_200_OK, content=item)
+        return message_response(status.HTTP_200_OK, f"Reset code sent to email: {current_user.email}", current_user.email)
     
     except IncorrectEmailOrPasswordException:
         msg = "IncorrectEmailOrPasswordException"
@@ -259,58 +353,96 @@ async def reset_password(current_user: User = Depends(get_current_user)):
         raise IncorrectEmailOrPasswordException
     
 
-@router.post("/verify_new_email")
+@router.post("/verify_new_email", response_model=SMessage)
 @version(1)
 async def verify_new_email(user_data: SResetEmail, current_user: User = Depends(get_current_user)):
+    # занятый адрес отсекается до погашения кода, иначе ix_users_email
+    # уронил бы UPDATE в 500, а код был бы уже потрачен
+    if user_data.email_new != current_user.email and await UserDAO.find_one_or_none(email=user_data.email_new):
+        logger.error("User already exists", extra={"email": user_data.email_new})
+        raise UserAlreadyExistsException
 
-    if user_data.verification_code != current_user.verification_code:
+    if not await verification_codes.consume(current_user.email, user_data.verification_code):
         msg = "Code missmatch"
-        logger.error(msg, extra=current_user, exc_info=True)
+        logger.error(msg, extra={"user_id": current_user.id}, exc_info=True)
         raise InvalidVerificationCode
 
         
     user = await UserDAO.update(filter_by={"email":current_user.email}, email=user_data.email_new)
-    await UserDAO.downgrade_verification_status(current_user.email)
+    await UserDAO.downgrade_verification_status(user_data.email_new)
+    # новый адрес подтверждается своим кодом через /verify_email
+    verification_code = create_verification_code()
+    await verification_codes.issue(user_data.email_new, verification_code)
+    await OutboxDAO.add_verification(user_data.email_new, verification_code)
     # return RedirectResponse(url="/login")
-    item = {
-            "email": current_user.email,
-            "mesage": f"Success, verify new email, code sent to {user_data.email_new}",
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-    return JSONResponse(status_code=status.HTTP_200_OK, content=item)
+    return message_response(status.HTTP_200_OK, f"Success, verify new email, code sent to {user_data.email_new}", current_user.email)
     
 
-@router.post("/reset_email")
+@router.post("/reset_email", response_model=SMessage, dependencies=[Depends(rate_limit_user("reset_email"))])
 @version(1)
 async def reset_email(current_user: User = Depends(get_current_user)):
     verification_code = create_verification_code()
     
-    await UserDAO.update(filter_by={"email":current_user.email}, verification_code=verification_code) 
+    await verification_codes.issue(current_user.email, verification_code)
     await UserDAO.downgrade_verification_status(current_user.email)   
-    send_verify_message.delay(current_user.email, verification_code)
+    await OutboxDAO.add_verification(current_user.email, verification_code)
     
     # return RedirectResponse(url="/verify_new_email")
-    item = {
-            "email": current_user.email,
-            "mesage": f"Success, verify new email, code sent to {current_user.email}",
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-    return JSONResponse(status_code=status.HTTP_200_OK, content=item)
+    return message_response(status.HTTP_200_OK, f"Success, verify new email, code sent to {current_user.email}", current_user.email)
 
 
-@router.post("/update_portfolio_id")
+@router.post("/update_portfolio_id", response_model=SMessage)
 @version(1)
 async def update_portfolio_id(user_data: SUpdatePortfolioId):
-    user = await UserDAO.find_obj(email=user_data.email)
+    # один UPDATE ... RETURNING вместо select + update
+    user = await UserDAO.update(filter_by={"email":user_data.email}, portfolio_id=user_data.portfolio_id)
     if not user:
         msg = "UserIsNotPresentException"
         logger.error(msg, extra=user_data.model_dump(), exc_info=True)
-        return UserIsNotPresentException
+        raise UserIsNotPresentException
     
-    await UserDAO.update(filter_by={"email":user_data.email}, portfolio_id=user_data.portfolio_id) 
-    item = {
-            "email": user_data.email,
-            "mesage": f"User portfilio id updated",
-            "time": datetime.now(tz=tzutc()).isoformat()
-        }
-    return JSONResponse(status_code=status.HTTP_200_OK, content=item)
+    return message_response(status.HTTP_200_OK, f"User portfilio id updated", user_data.email)
+
+
+@router.post("/update_portfolio_ids", response_model=SBulkUpdatePortfolioIdResult, dependencies=[Depends(get_internal_caller)])
+@version(1)
+async def update_portfolio_ids(user_data: SBulkUpdatePortfolioId):
+    """
+    Batch version of update_portfolio_id for service-to-service sync:
+    items are matched by id or email, status is reported per item
+    """
+    # при повторах ключа в пакете побеждает последнее значение
+    by_id = {item.id: item.portfolio_id for item in user_data.items if item.id is not None}
+    by_email = {item.email: item.portfolio_id for item in user_data.items if item.email is not None}
+
+    updated_ids = {
+        row["key"] for row in await UserDAO.bulk_update(
+            "id",
+            [{"id": key, "portfolio_id": value} for key, value in by_id.items()],
+            chunk_size=settings.BULK_UPDATE_CHUNK_SIZE
+        )
+    }
+    updated_emails = {
+        row["key"] for row in await UserDAO.bulk_update(
+            "email",
+            [{"email": key, "portfolio_id": value} for key, value in by_email.items()],
+            chunk_size=settings.BULK_UPDATE_CHUNK_SIZE
+        )
+    }
+
+    results = []
+    for item in user_data.items:
+        if item.id is not None:
+            found = item.id in updated_ids
+        else:
+            found = item.email in updated_emails
+        results.append({
+            **item.model_dump(exclude_none=True),
+            "status": "updated" if found else "not_found",
+        })
+    return ORJSONResponse({
+        "updated": sum(result["status"] == "updated" for result in results),
+        "not_found": sum(result["status"] == "not_found" for result in results),
+        "results": results,
+        "time": datetime.now(UTC),
+    })
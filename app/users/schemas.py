@@ -1,5 +1,13 @@
-from datetime import date
-from pydantic import BaseModel, EmailStr, ConfigDict
+from datetime import date, datetime, UTC
+from typing import Annotated, Literal
+import orjson
+from pydantic import AfterValidator, BaseModel, EmailStr, ConfigDict, Field, model_validator
+
+from app.config import settings
+
+
+# в базе email хранится в нижнем регистре (ck_users_email_lower)
+NormalizedEmail = Annotated[EmailStr, AfterValidator(str.lower)]
 
 
 class SAdminAuth(BaseModel):
@@ -20,15 +28,26 @@ class SSubAuth(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class STokenClaims(BaseModel):
+    sub: int
+    ver: int
+    jti: str
+    exp: int
+    is_admin: bool
+    is_moder: bool
+    is_sub: bool
+    is_verified: bool
+
+
 class SUserSignup(BaseModel):
-    email: EmailStr
+    email: NormalizedEmail
     password: bytes
 
     model_config = ConfigDict(from_attributes=True)
 
 
 class SUserVerify(BaseModel):
-    email: str
+    email: NormalizedEmail
     verification_code: str
     
     model_config = ConfigDict(from_attributes=True)
@@ -41,30 +60,119 @@ class SUserVerifyNewPassword(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 class SUserAuth(BaseModel):
-    email: EmailStr
+    email: NormalizedEmail
     password: bytes
     
     model_config = ConfigDict(from_attributes=True)
 
 class SUserInfo(BaseModel):
+    """
+    Public view of a user, the same columns as UserDAO._public_columns
+    """
     id: int
     email: EmailStr
-    password: bytes
-    email: str
-    portfolio_id: int
-    is_sub: bool 
-    is_admin: bool 
+    is_verified: bool
+    verified_at: datetime | None
+    portfolio_id: int | None
+    is_sub: bool
+    is_admin: bool
     is_moder: bool
     created: date
+    token_version: int
 
     model_config = ConfigDict(from_attributes=True)
 
 
+USER_PUBLIC_FIELDS = tuple(SUserInfo.model_fields)
+
+
+def user_to_dict(user) -> dict:
+    # orjson сам кодирует date/datetime, jsonable_encoder и валидация не нужны
+    return {name: getattr(user, name) for name in USER_PUBLIC_FIELDS}
+
+
+def dump_user(user) -> bytes:
+    """
+    Fast path for SUserInfo: a User or a row of public columns to JSON bytes
+    """
+    return orjson.dumps(user_to_dict(user))
+
+
+class SMessage(BaseModel):
+    email: EmailStr | None = None
+    message: str
+    time: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+
+class STokens(BaseModel):
+    access_token: str
+    refresh_token: str
+
+
+class SUsersPage(BaseModel):
+    users: list[SUserInfo]
+    next_cursor: int | None
+
+
+class SUserLookupResult(BaseModel):
+    users: list[SUserInfo]
+    missing: list[int]
+
+
+class SPortfolioIdResult(BaseModel):
+    id: int | None = None
+    email: EmailStr | None = None
+    portfolio_id: int
+    status: Literal["updated", "not_found"]
+
+
+class SImportError(BaseModel):
+    line: int
+    error: str
+
+
+class SUserImportResult(BaseModel):
+    read: int
+    imported: int
+    skipped: int  # email уже занят
+    invalid: int
+    errors: list[SImportError]
+    seconds: float
+
+
+class SBulkUpdatePortfolioIdResult(BaseModel):
+    updated: int
+    not_found: int
+    results: list[SPortfolioIdResult]
+    time: datetime
+
+
 class SResetEmail(BaseModel):
     verification_code: str
-    email_new: str
+    email_new: NormalizedEmail
 
 
 class SUpdatePortfolioId(BaseModel):
     portfolio_id: int
-    email: str
\ No newline at end of file
+    email: NormalizedEmail
+
+
+class SPortfolioIdItem(BaseModel):
+    # пользователь задается либо id, либо email
+    id: int | None = None
+    email: NormalizedEmail | None = None
+    portfolio_id: int
+
+    @model_validator(mode="after")
+    def check_key(self):
+        if (self.id is None) == (self.email is None):
+            raise ValueError("exactly one of id or email is required")
+        return self
+
+
+class SBulkUpdatePortfolioId(BaseModel):
+    items: list[SPortfolioIdItem] = Field(min_length=1, max_length=settings.PORTFOLIO_BULK_MAX_ITEMS)
+
+
+class SUserLookup(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=settings.USER_LOOKUP_MAX_IDS)
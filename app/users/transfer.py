@@ -0,0 +1,359 @@
+"""
+Bulk import and export of users through PostgreSQL COPY, CSV or NDJSON.
+
+    python -m app.users.transfer import users.csv
+    python -m app.users.transfer export users.ndjson --cursor 0
+
+Import takes one record per line with the fields email and either password
+(hashed here in a process pool) or password_hashed (bcrypt/argon2 hash
+carried over from another system), and optionally is_verified,
+portfolio_id, is_sub, is_admin, is_moder, created. Every chunk of
+IMPORT_CHUNK_SIZE records is one transaction, existing emails are skipped,
+so an interrupted import can simply be run again.
+"""
+from app.config import settings
+from app.database import driver_connection
+from app.exceptions import ImportFormatException
+from app.logger import logger
+from app.metrics import USERS_TRANSFERRED
+from app.users.dao import IMPORT_COLUMNS, UserDAO
+from app.users.hashing import hash_many, password_hasher
+from app.users.schemas import NormalizedEmail
+
+import asyncio
+import csv
+import math
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import date, datetime, UTC
+from time import perf_counter
+from typing import AsyncIterator, Literal
+
+import orjson
+from pydantic import TypeAdapter, ValidationError
+
+
+TransferFormat = Literal["csv", "ndjson"]
+
+TRUE_VALUES = {"1", "true", "t", "yes", "y"}
+FALSE_VALUES = {"0", "false", "f", "no", "n", ""}
+
+email_adapter = TypeAdapter(NormalizedEmail)
+
+
+def _bool(value) -> bool:
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+
+def _int_or_none(value) -> int | None:
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def _date(value, default: date) -> date:
+    if value is None or value == "":
+        return default
+    return date.fromisoformat(str(value)[:10])
+
+
+def parse_record(data: dict, today: date, now: datetime) -> tuple[list, bytes | None]:
+    """
+    Import record in IMPORT_COLUMNS order and the password to hash, if any.
+    Raises ValueError for an invalid record.
+    """
+    email = email_adapter.validate_python(data.get("email"))
+    password = data.get("password") or None
+    password_hashed = data.get("password_hashed") or None
+    if (password is None) == (password_hashed is None):
+        raise ValueError("exactly one of password or password_hashed is required")
+    if password_hashed is not None:
+        password_hashed = str(password_hashed).encode()
+        if not any(hasher.identify(password_hashed) for hasher in password_hasher.hashers):
+            raise ValueError("password_hashed is not a bcrypt or argon2 hash")
+    is_verified = _bool(data.get("is_verified"))
+    record = [
+        email,
+        password_hashed,
+        is_verified,
+        # проверенным нужен verified_at, иначе их удалит очистка неподтвержденных
+        now if is_verified else None,
+        _int_or_none(data.get("portfolio_id")),
+        _bool(data.get("is_sub")),
+        _bool(data.get("is_admin")),
+        _bool(data.get("is_moder")),
+        _date(data.get("created"), today),
+        0,
+    ]
+    return record, None if password is None else str(password).encode()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[list[tuple[int, str]]]:
+    """
+    Numbered non-empty lines, a list per incoming chunk of bytes
+    """
+    tail, line_no = b"", 0
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        numbered = []
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                numbered.append((line_no, line.decode("utf-8").rstrip("\r")))
+        if numbered:
+            yield numbered
+    if tail.strip():
+        yield [(line_no + 1, tail.decode("utf-8").rstrip("\r"))]
+
+
+async def iter_dicts(chunks: AsyncIterator[bytes], fmt: TransferFormat) -> AsyncIterator[list[tuple[int, dict | Exception]]]:
+    """
+    Parsed lines; a line that cannot be parsed comes with its error
+    """
+    header = None
+    async for lines in iter_lines(chunks):
+        parsed = []
+        if fmt == "ndjson":
+            for line_no, line in lines:
+                try:
+                    data = orjson.loads(line)
+                    if not isinstance(data, dict):
+                        raise ValueError("not a JSON object")
+                    parsed.append((line_no, data))
+                except ValueError as e:
+                    parsed.append((line_no, e))
+        else:
+            # одна запись на строку: переводы строк внутри полей не поддерживаются
+            rows = csv.reader(line for _, line in lines)
+            for (line_no, _), row in zip(lines, rows):
+                if header is None:
+                    header = [name.strip().lstrip("\ufeff") for name in row]
+                    if "email" not in header:
+                        raise ImportFormatException
+                    continue
+                if len(row) != len(header):
+                    parsed.append((line_no, ValueError(f"expected {len(header)} fields, got {len(row)}")))
+                    continue
+                parsed.append((line_no, dict(zip(header, row))))
+        yield parsed
+
+
+_import_executor: ProcessPoolExecutor | None = None
+
+
+def get_import_executor(workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool shared by all imports of this process, separate from the
+    login hashing pool. Started with spawn: a forked copy of a running
+    server would inherit its event loop, connections and held locks.
+    """
+    global _import_executor
+    if _import_executor is None:
+        _import_executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _import_executor
+
+
+def shutdown_import_executor():
+    global _import_executor
+    if _import_executor is not None:
+        _import_executor.shutdown(wait=False, cancel_futures=True)
+        _import_executor = None
+
+
+async def hash_passwords(executor: Executor, workers: int, passwords: list[bytes]) -> list[bytes]:
+    """
+    Hashes with the current hasher, one slice of the list per pool process
+    """
+    if not passwords:
+        return []
+    loop = asyncio.get_running_loop()
+    size = math.ceil(len(passwords) / workers)
+    parts = await asyncio.gather(*(
+        loop.run_in_executor(executor, hash_many, password_hasher.hasher, passwords[start:start + size])
+        for start in range(0, len(passwords), size)
+    ))
+    return [hashed for part in parts for hashed in part]
+
+
+async def import_users(
+    chunks: AsyncIterator[bytes],
+    fmt: TransferFormat,
+    chunk_size: int = settings.IMPORT_CHUNK_SIZE,
+    workers: int = settings.IMPORT_HASH_WORKERS,
+    max_errors: int = settings.IMPORT_MAX_ERRORS,
+) -> dict:
+    """
+    Imports users from a stream of bytes. Passwords of the next chunk are
+    hashed while the previous chunk is being copied. Returns counts and
+    the first max_errors invalid lines.
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = {"read": 0, "imported": 0, "skipped": 0, "invalid": 0, "errors": []}
+    started = perf_counter()
+    today, now = date.today(), datetime.now(UTC)
+
+    def reject(line_no: int, error: Exception):
+        stats["invalid"] += 1
+        if len(stats["errors"]) < max_errors:
+            message = error.errors()[0]["msg"] if isinstance(error, ValidationError) else str(error)
+            stats["errors"].append({"line": line_no, "error": message})
+
+    async def prepared() -> AsyncIterator[list[list]]:
+        records, passwords, to_hash = [], [], []
+        async for parsed in iter_dicts(chunks, fmt):
+            for line_no, data in parsed:
+                stats["read"] += 1
+                if isinstance(data, Exception):
+                    reject(line_no, data)
+                    continue
+                try:
+                    record, password = parse_record(data, today, now)
+                except (ValueError, ValidationError) as e:
+                    reject(line_no, e)
+                    continue
+                if password is not None:
+                    to_hash.append(record)
+                    passwords.append(password)
+                records.append(record)
+                if len(records) >= chunk_size:
+                    yield await with_hashes(records, to_hash, passwords)
+                    records, passwords, to_hash = [], [], []
+        if records:
+            yield await with_hashes(records, to_hash, passwords)
+
+    async def with_hashes(records: list[list], to_hash: list[list], passwords: list[bytes]) -> list[list]:
+        for record, hashed in zip(to_hash, await hash_passwords(executor, workers, passwords)):
+            record[IMPORT_COLUMNS.index("password_hashed")] = hashed
+        return records
+
+    async def copy(connection, records: list[list]):
+        imported = await UserDAO.copy_import(connection, records)
+        stats["imported"] += imported
+        stats["skipped"] += len(records) - imported
+        USERS_TRANSFERRED.labels("imported").inc(imported)
+        USERS_TRANSFERRED.labels("skipped").inc(len(records) - imported)
+        elapsed = perf_counter() - started
+        logger.info("Users import progress", extra={
+            **{name: value for name, value in stats.items() if name != "errors"},
+            "rows_per_second": round(stats["read"] / elapsed),
+        })
+
+    executor = get_import_executor(workers)
+    pending = None
+    try:
+        async with driver_connection() as connection:
+            await UserDAO.prepare_import(connection)
+            async for records in prepared():
+                if pending is not None:
+                    await pending
+                pending = asyncio.create_task(copy(connection, records))
+            if pending is not None:
+                await pending
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+    USERS_TRANSFERRED.labels("invalid").inc(stats["invalid"])
+    stats["seconds"] = round(perf_counter() - started, 3)
+    logger.info("Users import finished", extra={name: value for name, value in stats.items() if name != "errors"})
+    return stats
+
+
+async def export_users(output, fmt: TransferFormat, cursor: int = 0) -> int:
+    """
+    Exports public columns of users with id > cursor to output: a path,
+    a file object or a coroutine function taking bytes. Returns the row count.
+    """
+    started = perf_counter()
+    counted = {"rows": 0, "logged": 0}
+
+    async def write(data: bytes):
+        # для строк без переводов строки внутри полей число строк = число записей
+        counted["rows"] += data.count(b"\n")
+        if counted["rows"] - counted["logged"] >= settings.TRANSFER_PROGRESS_ROWS:
+            counted["logged"] = counted["rows"]
+            logger.info("Users export progress", extra={
+                "rows": counted["rows"], "rows_per_second": round(counted["rows"] / (perf_counter() - started))
+            })
+        if callable(output):
+            await output(data)
+        else:
+            await asyncio.to_thread(output.write, data)
+
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, "wb") as file:
+            return await export_users(file, fmt, cursor)
+
+    async with driver_connection(replica=True) as connection:
+        rows = await UserDAO.copy_export(connection, write, fmt, cursor)
+    USERS_TRANSFERRED.labels("exported").inc(rows)
+    logger.info("Users export finished", extra={"rows": rows, "seconds": round(perf_counter() - started, 3)})
+    return rows
+
+
+async def iter_export(fmt: TransferFormat, cursor: int = 0, buffer: int = 16) -> AsyncIterator[bytes]:
+    """
+    export_users as an async iterator for a streaming response; COPY waits
+    while the client is slower than the database
+    """
+    queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=buffer)
+
+    async def produce():
+        try:
+            await export_users(queue.put, fmt, cursor)
+        finally:
+            await queue.put(None)
+
+    task = asyncio.create_task(produce())
+    try:
+        while (chunk := await queue.get()) is not None:
+            yield chunk
+        # ошибка COPY обрывает ответ, а не отдает неполный файл как целый
+        await task
+    finally:
+        task.cancel()
+
+
+async def iter_file(path: str, chunk_size: int = 1 << 20) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := await asyncio.to_thread(file.read, chunk_size):
+            yield chunk
+
+
+def detect_format(path: str) -> TransferFormat:
+    return "ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(prog="python -m app.users.transfer")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="by default by file extension")
+    parser.add_argument("--cursor", type=int, default=0, help="export users with id > cursor")
+    parser.add_argument("--chunk-size", type=int, default=settings.IMPORT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=settings.IMPORT_HASH_WORKERS)
+    args = parser.parse_args()
+    fmt = args.format or detect_format(args.path)
+
+    if args.command == "import":
+        try:
+            result = asyncio.run(import_users(iter_file(args.path), fmt, args.chunk_size, args.workers))
+        finally:
+            shutdown_import_executor()
+    else:
+        result = {"exported": asyncio.run(export_users(args.path, fmt, args.cursor))}
+    print(json.dumps(result))
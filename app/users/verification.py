@@ -0,0 +1,65 @@
+from app.cache import redis
+from app.config import settings
+
+import hashlib
+import hmac
+
+
+# атомарная проверка: код удаляется при совпадении
+# или после исчерпания попыток
+CONSUME_SCRIPT = """
+local stored = redis.call('HGET', KEYS[1], 'code')
+if not stored then
+    return -1
+end
+if stored == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+local attempts = redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+if attempts >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class VerificationCodeStore:
+    """
+    One pending verification code per email, kept in Redis as an HMAC of the
+    code with a TTL and a counter of failed attempts.
+    """
+
+    def __init__(self, ttl: int, max_attempts: int):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self._consume = redis.register_script(CONSUME_SCRIPT)
+
+    @staticmethod
+    def _key(email: str) -> str:
+        return f"verification:{email}"
+
+    @staticmethod
+    def _digest(code: str) -> str:
+        return hmac.new(settings.SECRET_KEY.encode(), code.encode(), hashlib.sha256).hexdigest()
+
+    async def issue(self, email: str, code: str):
+        key = self._key(email)
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping={"code": self._digest(code), "attempts": 0})
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def consume(self, email: str, code: str) -> bool:
+        result = await self._consume(
+            keys=[self._key(email)],
+            args=[self._digest(code), self.max_attempts]
+        )
+        return result == 1
+
+
+verification_codes = VerificationCodeStore(
+    ttl=settings.VERIFICATION_CODE_TTL,
+    max_attempts=settings.VERIFICATION_CODE_MAX_ATTEMPTS,
+)
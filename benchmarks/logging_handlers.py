@@ -0,0 +1,77 @@
+"""
+Cost of one logger.info call seen by the caller (the event loop) for:
+a synchronous StreamHandler vs. the queue handler, with json and orjson
+serializers. --write-delay simulates a slow stdout consumer.
+
+    python -m benchmarks.logging_handlers --records 20000 --write-delay 0.00005
+"""
+from app.logger import AsyncQueueHandler, SamplingFilter, make_formatter
+
+import argparse
+import io
+import logging
+from logging.handlers import QueueListener
+from queue import SimpleQueue
+from time import perf_counter, sleep
+
+
+class SlowStream(io.StringIO):
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, s):
+        if self.delay:
+            sleep(self.delay)
+        return len(s)
+
+
+def run(name: str, records: int, delay: float, serializer: str, queued: bool, sample_rate: float | None):
+    stream_handler = logging.StreamHandler(SlowStream(delay))
+    stream_handler.setFormatter(make_formatter(serializer))
+    bench_logger = logging.getLogger(f"bench.{name}")
+    bench_logger.propagate = False
+    bench_logger.setLevel(logging.INFO)
+
+    listener = None
+    if queued:
+        queue = SimpleQueue()
+        handler = AsyncQueueHandler(queue)
+        listener = QueueListener(queue, stream_handler)
+        listener.start()
+    else:
+        handler = stream_handler
+    if sample_rate is not None:
+        handler.addFilter(SamplingFilter({"Request execution time": sample_rate}))
+    bench_logger.addHandler(handler)
+
+    start = perf_counter()
+    for _ in range(records):
+        bench_logger.info("Request execution time", extra={"process_time": 0.0123})
+    elapsed = perf_counter() - start
+
+    if listener:
+        listener.stop()
+    bench_logger.removeHandler(handler)
+    print(f"{name:>28}: {elapsed / records * 1e6:8.2f} us/call")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--write-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    cases = [
+        ("sync json", "json", False, None),
+        ("sync orjson", "orjson", False, None),
+        ("queue json", "json", True, None),
+        ("queue orjson", "orjson", True, None),
+        ("queue orjson, sampled 10%", "orjson", True, 0.1),
+    ]
+    for name, serializer, queued, sample_rate in cases:
+        run(name, args.records, args.write_delay, serializer, queued, sample_rate)
+
+
+if __name__ == "__main__":
+    main()
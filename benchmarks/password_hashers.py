@@ -0,0 +1,51 @@
+"""
+Password hashing throughput of bcrypt and argon2id at the configured cost
+(or calibrated to --target-ms): single-core latency and hashes/sec with
+one process per core.
+
+    python -m benchmarks.password_hashers --hashes 200 --target-ms 250
+"""
+from app.users.hashing import Argon2Hasher, BcryptHasher, Hasher, _measure
+from app.config import settings
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+
+def run(hasher: Hasher, hashes: int, workers: int):
+    latency = _measure(hasher.hash, b"benchmark")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # прогрев: процессы пула запускаются и импортируют модули
+        list(executor.map(hasher.hash, [b"warmup"] * workers))
+        start = perf_counter()
+        list(executor.map(hasher.hash, [b"benchmark"] * hashes))
+        elapsed = perf_counter() - start
+
+    print(
+        f"{hasher.name:>9} {vars(hasher)}: {latency * 1000:7.1f} ms/hash, "
+        f"{hashes / elapsed:8.1f} hashes/s on {workers} cores, "
+        f"{hashes / elapsed / workers:7.1f} hashes/s per core"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hashes", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--target-ms", type=int, default=settings.HASH_TARGET_MS)
+    args = parser.parse_args()
+
+    hashers = [
+        BcryptHasher(settings.BCRYPT_ROUNDS),
+        Argon2Hasher(settings.ARGON2_TIME_COST, settings.ARGON2_MEMORY_COST, settings.ARGON2_PARALLELISM),
+    ]
+    for hasher in hashers:
+        if args.target_ms:
+            hasher.calibrate(args.target_ms / 1000)
+        run(hasher, args.hashes, args.workers)
+
+
+if __name__ == "__main__":
+    main()
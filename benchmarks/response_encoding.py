@@ -0,0 +1,77 @@
+"""
+Per-response cost of encoding users: the old path (dict -> jsonable_encoder
+-> JSONResponse), validation through the response model, and the orjson
+fast path used by the handlers. Pure CPU, no database or network.
+
+    python -m benchmarks.response_encoding --number 20000
+"""
+from app.users.models import User
+from app.users.schemas import SUserInfo, SUsersPage, dump_user, user_to_dict
+
+import argparse
+import json
+from datetime import date, datetime, UTC
+from timeit import timeit
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+
+def make_user(user_id: int) -> User:
+    return User(
+        id=user_id,
+        email=f"user{user_id}@example.com",
+        password_hashed=b"$2b$12$" + b"x" * 53,
+        verification_code=None,
+        is_verified=True,
+        verified_at=datetime.now(UTC),
+        portfolio_id=user_id * 10,
+        is_sub=False,
+        is_admin=False,
+        is_moder=False,
+        created=date.today(),
+        token_version=0,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--page", type=int, default=100)
+    args = parser.parse_args()
+
+    user = make_user(1)
+    page = [make_user(user_id) for user_id in range(args.page)]
+    columns = [column.name for column in User.__table__.columns if column.name not in ("password_hashed", "verification_code")]
+
+    cases = {
+        "user: jsonable_encoder + JSONResponse": lambda: JSONResponse(
+            jsonable_encoder({name: getattr(user, name) for name in columns})
+        ),
+        "user: SUserInfo + json": lambda: json.dumps(SUserInfo.model_validate(user).model_dump(mode="json")),
+        "user: SUserInfo.model_dump_json": lambda: SUserInfo.model_validate(user).model_dump_json(),
+        "user: dump_user (orjson)": lambda: dump_user(user),
+        f"page {args.page}: jsonable_encoder + JSONResponse": lambda: JSONResponse(
+            jsonable_encoder({"users": [{name: getattr(u, name) for name in columns} for u in page], "next_cursor": None})
+        ),
+        f"page {args.page}: SUsersPage": lambda: SUsersPage(
+            users=[SUserInfo.model_validate(u) for u in page], next_cursor=None
+        ).model_dump_json(),
+        f"page {args.page}: ORJSONResponse": lambda: ORJSONResponse(
+            {"users": [user_to_dict(u) for u in page], "next_cursor": None}
+        ),
+    }
+    for name, case in cases.items():
+        number = args.number if name.startswith("user") else max(args.number // args.page, 1)
+        elapsed = timeit(case, number=number)
+        print(f"{name:>44}: {elapsed / number * 1e6:9.1f} us/response")
+
+    # оба пути должны давать одинаковый JSON
+    assert orjson.loads(dump_user(user)) == json.loads(JSONResponse(
+        jsonable_encoder({name: getattr(user, name) for name in columns})
+    ).body)
+
+
+if __name__ == "__main__":
+    main()
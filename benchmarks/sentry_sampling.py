@@ -0,0 +1,90 @@
+"""
+Per-request overhead of Sentry tracing and profiling at different sampling
+levels, on a small FastAPI app called in-process (no network). Envelopes
+are counted by a null transport instead of being sent.
+
+    python -m benchmarks.sentry_sampling --requests 3000
+"""
+from app.sampling import TraceSampler
+
+import argparse
+import asyncio
+from time import perf_counter
+
+import httpx
+import sentry_sdk
+from fastapi import FastAPI
+from sentry_sdk.transport import Transport
+
+
+class CountingTransport(Transport):
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.envelopes = 0
+
+    def capture_envelope(self, envelope):
+        self.envelopes += 1
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/v1/auth/me")
+    async def me():
+        # немного работы, чтобы у транзакции были длительность и стек
+        return {"id": 1, "email": "user@example.com", "total": sum(range(2000))}
+
+    return app
+
+
+async def run(name: str, requests: int, **options):
+    transport = CountingTransport()
+    if options:
+        sentry_sdk.init(dsn="https://key@sentry.invalid/1", transport=transport, **options)
+    else:
+        sentry_sdk.init(dsn=None)
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=make_app()), base_url="http://bench")
+    async with client:
+        for _ in range(100):
+            await client.get("/v1/auth/me")
+        transport.envelopes = 0
+        start = perf_counter()
+        for _ in range(requests):
+            await client.get("/v1/auth/me")
+        elapsed = perf_counter() - start
+    sentry_sdk.flush()
+    print(f"{name:>34}: {elapsed / requests * 1e6:8.1f} us/request, {transport.envelopes:6} envelopes")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+
+    sampler = TraceSampler(
+        traces_rate=0.05,
+        candidate_rate=0.2,
+        route_rates={},
+        status_rates={},
+        slow_seconds=1.0,
+        max_per_second=10,
+    )
+    cases = [
+        ("sentry off", {}),
+        ("errors only", {"traces_sample_rate": 0.0}),
+        ("traces 1.0 + profiles 1.0 (old)", {"traces_sample_rate": 1.0, "profiles_sample_rate": 1.0}),
+        ("traces 1.0", {"traces_sample_rate": 1.0}),
+        ("traces 0.1", {"traces_sample_rate": 0.1}),
+        ("sampler (0.2 head, 0.05 kept)", {
+            "traces_sampler": sampler.traces_sampler,
+            "before_send_transaction": sampler.before_send_transaction,
+            "profiles_sample_rate": 0.1,
+        }),
+    ]
+    for name, options in cases:
+        asyncio.run(run(name, args.requests, **options))
+
+
+if __name__ == "__main__":
+    main()
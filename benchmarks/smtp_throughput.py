@@ -0,0 +1,65 @@
+"""
+SMTP delivery throughput against a local aiosmtpd server:
+a new connection per message (the old send_verify_message) vs. the pooled
+batch delivery of send_verify_messages.
+
+    python -m benchmarks.smtp_throughput --messages 500
+"""
+from app.tasks.email_templates import create_user_confirmation_message
+from app.tasks.smtp_pool import SMTPConnectionPool
+
+import argparse
+import smtplib
+from collections import deque
+from time import perf_counter
+
+from aiosmtpd.controller import Controller
+
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+def connection_per_message(host: str, port: int, messages: list):
+    for message in messages:
+        with smtplib.SMTP(host, port) as server:
+            server.send_message(message)
+
+
+def pooled(host: str, port: int, messages: list):
+    pool = SMTPConnectionPool(host, port, use_ssl=False)
+    pool.send_messages(deque(messages))
+    pool.close_all()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    args = parser.parse_args()
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=8025)
+    controller.start()
+    try:
+        messages = [
+            create_user_confirmation_message(f"user{i}@test.io", "AbC123")
+            for i in range(args.messages)
+        ]
+        for name, send in (("connection per message", connection_per_message), ("pooled batch", pooled)):
+            handler.received = 0
+            start = perf_counter()
+            send(controller.hostname, controller.port, messages)
+            elapsed = perf_counter() - start
+            assert handler.received == args.messages
+            print(f"{name:>24}: {args.messages / elapsed:10.1f} msg/s ({elapsed:.3f} s)")
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()
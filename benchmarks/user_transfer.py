@@ -0,0 +1,105 @@
+"""
+Throughput of bulk user import and export against the configured database:
+one INSERT per user (what calling /auth/signup per user amounts to) vs. the
+COPY import, and find_all vs. the COPY export. Also compares password
+hashing in one process with the import process pool. Rows created here use
+the transfer-bench.invalid domain and are deleted at the end.
+
+    python -m benchmarks.user_transfer --users 20000 --passwords 200
+    python -m benchmarks.user_transfer --skip-db
+"""
+from app.database import driver_connection
+from app.users.dao import UserDAO
+from app.users.hashing import BcryptHasher, hash_many
+from app.users.transfer import export_users, hash_passwords, import_users
+
+import argparse
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import bcrypt
+
+
+DOMAIN = "transfer-bench.invalid"
+
+
+def report(name: str, rows: int, elapsed: float):
+    print(f"{name:>36}: {rows:8} rows in {elapsed:7.2f} s, {rows / elapsed:10.0f} rows/s")
+
+
+async def bench_hashing(passwords: int, rounds: int, workers: int):
+    hasher = BcryptHasher(rounds=rounds)
+    data = [f"password-{i}".encode() for i in range(passwords)]
+
+    start = perf_counter()
+    hash_many(hasher, data)
+    report(f"bcrypt({rounds}), one process", passwords, perf_counter() - start)
+
+    from app.users import transfer
+    transfer.password_hasher.hasher = hasher
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        await hash_passwords(executor, workers, data[:workers])  # запуск процессов
+        start = perf_counter()
+        await hash_passwords(executor, workers, data)
+        report(f"bcrypt({rounds}), pool of {workers}", passwords, perf_counter() - start)
+
+
+def csv_body(prefix: str, users: int, password_hashed: str) -> bytes:
+    lines = ["email,password_hashed,is_verified"]
+    lines += [f"{prefix}{i}@{DOMAIN},{password_hashed},true" for i in range(users)]
+    return "\n".join(lines).encode()
+
+
+async def as_chunks(data: bytes, size: int = 1 << 20):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def bench_db(users: int):
+    # готовый хеш: здесь сравнивается загрузка, а не хеширование
+    password_hashed = bcrypt.hashpw(b"password", bcrypt.gensalt(4)).decode()
+    per_row = min(users, 2000)
+    try:
+        start = perf_counter()
+        for i in range(per_row):
+            await UserDAO.add(email=f"row{i}@{DOMAIN}", password_hashed=password_hashed.encode())
+        report("INSERT per user", per_row, perf_counter() - start)
+
+        start = perf_counter()
+        stats = await import_users(as_chunks(csv_body("copy", users, password_hashed)), "csv")
+        report("COPY import", stats["imported"], perf_counter() - start)
+
+        start = perf_counter()
+        rows = await UserDAO.find_all()
+        report("find_all", len(rows), perf_counter() - start)
+
+        start = perf_counter()
+        rows = await export_users(os.devnull, "csv")
+        report("COPY export, csv", rows, perf_counter() - start)
+
+        start = perf_counter()
+        rows = await export_users(os.devnull, "ndjson")
+        report("COPY export, ndjson", rows, perf_counter() - start)
+    finally:
+        async with driver_connection() as connection:
+            await connection.execute("DELETE FROM users WHERE email LIKE $1", f"%@{DOMAIN}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--passwords", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--skip-db", action="store_true")
+    args = parser.parse_args()
+
+    asyncio.run(bench_hashing(args.passwords, args.rounds, args.workers))
+    if not args.skip_db:
+        asyncio.run(bench_db(args.users))
+
+
+if __name__ == "__main__":
+    main()
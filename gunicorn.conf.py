@@ -0,0 +1,29 @@
+import json
+import os
+import subprocess
+import sys
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # калибруем хеширование паролей один раз и отдельным процессом: мастер
+    # не должен импортировать app, иначе воркеры унаследуют уже прочитанные
+    # settings. Подобранная стоимость передается воркерам через окружение
+    # (HASH_TARGET_MS может быть задан и в .env_prod, поэтому решает сам app.users.hashing)
+    if not os.environ.get("HASH_CALIBRATED"):
+        output = subprocess.run(
+            [sys.executable, "-m", "app.users.hashing"],
+            capture_output=True, text=True, check=True
+        ).stdout
+        calibrated = json.loads(output.splitlines()[-1])
+        if calibrated:
+            os.environ.update(calibrated)
+            server.log.info("Password hasher calibrated: %s", calibrated)
+
+
+def child_exit(server, worker):
+    # метрики умершего воркера в PROMETHEUS_MULTIPROC_DIR больше не суммируются;
+    # без каталога mark_process_dead падает с TypeError
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)